@@ -11,24 +11,68 @@ import json
 import requests
 import urllib3
 import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
 import xml.etree.ElementTree as ET
 from typing import Dict
 from dsenviosaltra_certificado import DsEnvioSaltraCertificado
 from dsenviosaltra_cliente import DsEnvioSaltraCliente
 from dsenviosaltra_respuestas import guardar_respuesta_completa, manejar_error_y_salir, guardar_respuestas_contratos
+from dsenviosaltra_http import obtener_transporte
+from dsenviosaltra_concurrencia import control_concurrencia
+from dsenviosaltra_circuito import circuito_endpoint, cola_offline, vaciar_cola_offline, CircuitoAbierto, BACKENDS_CIRCUITO
+from dsenviosaltra_limites import familia_endpoint
+from dsenviosaltra_salida import salida_atomica, escribir_resultado
+from dsenviosaltra_tiempos import fase, en_contexto, medir_guion, escribir_tiempos, configurar_metricas
+from dsenviosaltra_pdf import leer_json_con_pdfs, descartar_pdfs_temporales
+from dsenviosaltra_token import cache_tokens, caducidad_token
+from dsenviosaltra_cache import cache_respuestas, clave_respuesta, ttl_endpoint, VALORES_SIN_CACHE
+from dsenviosaltra_validacion import validar_registros, respuesta_rechazada
+from dsenviosaltra_reintentos import respuesta_error_conexion
+from dsenviosaltra_envios import registro_envios, clave_envio, endpoint_con_registro, respuesta_repetida, respuesta_http, VALORES_REENVIAR
+from dsenviosaltra_xml import (formatear_fecha, MAPEO_CERTIFICADO, MAPEO_ALTA, CAMPOS_REPRESENTANTE, CAMPOS_EMPRESA, CAMPOS_TRABAJADOR,
+                               CONVERSORES_REGISTRO, ETIQUETAS_REGISTRO, contrato_a_payload, bloques_registros, convertir_bloque,
+                               tratar_sepeId, normalizar_texto)
+
+# Guiones de la cola offline que ejecuta, como mucho, cada invocación de dsenviosaltra.py
+ENCOLADOS_POR_INVOCACION = 1
 
 # Desactivar warning de SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+class PeticionSaltra:
+    """
+    Petición SS/SEPE ya parseada del guion. Se construye una vez en leer_guion y llega al
+    envío como objetos nativos, sin volver a serializar ni parsear el JSON.
+    """
+    def __init__(self, certificado=None, datos=None):
+        self.certificado = certificado
+        self.datos = datos
+        # Payload convertido desde 'fiche-xml' cuando el guion lleva el marcador #xmltojson#
+        self.desde_xml = False
+        self.payload_xml = None
+        # Payloads de un XML con varios registros (LLAMAMIENTOS, PRORROGAS, TRANSFORMACIONES): uno por envío
+        self.registros_xml = None
+
 class SaltraClient:
-    # Constantes para códigos de contrato
-    CONTRATOS_REAL_DECRETO = [402, 407, 502, 507]
-    CONTRATOS_HORAS_FORMACION = [421, 521]
-    TIEMPO_PARCIAL = [200, 209, 230, 239, 250, 289, 300, 389, 500, 502, 503, 506, 507, 508, 510, 511, 513, 518, 520, 521, 520, 540, 541, 550, 552]
+    # Constantes para códigos de contrato (las de la conversión de contratos están en dsenviosaltra_xml)
     CODIGO_TRANSFORMACION = [109, 189, 209, 309, 289, 289, 139, 239, 339]
     COND_DESEMPLEADO_VALIDOS = ("1", "2", "3", "4", "5", "6", "7", "9")
+    # Contratos enviados en paralelo en un lote CONTRATOS (1 = envío secuencial); con [concurrencia] auto
+    # o adaptativa, según el control de dsenviosaltra_concurrencia
+    CONCURRENCIA_CONTRATOS = 1
+    VALORES_CONCURRENCIA_ADAPTATIVA = ("auto", "adaptativa")
+    # Descargas de copia básica simultáneas, en una etapa separada del envío de contratos
+    CONCURRENCIA_COPIA_BASICA = 2
+    # Conversión de los XML por registros en varios procesos: solo con [procesos-xml] mayor que 1 y más de
+    # MIN_REGISTROS_PROCESOS registros. Convertir cuesta ~0,1 ms por registro y arrancar cada proceso
+    # ~0,3 s, así que por debajo de unos 10000 registros es más rápido hacerlo en este proceso
+    PROCESOS_XML = 1
+    MIN_REGISTROS_PROCESOS = 10000
+    REGISTROS_POR_PROCESO = 1000
     
-    def __init__(self, dsClave: str, usuario: str, idUsuario:str, passw: str, guion_file: str, code_respuesta: str, tiempo_inicio):
+    def __init__(self, dsClave: str, usuario: str, idUsuario:str, passw: str, guion_file: str, code_respuesta: str, tiempo_inicio, token=None, concurrencia=None, concurrencia_copia_basica=None):
         self.dsClave = dsClave
         self.usuario = usuario
         self.idUsuario = idUsuario
@@ -45,13 +89,29 @@ class SaltraClient:
         self.parametro = ""
         self.output_path = ""
         self.fich_respuesta = ""
-
-        self.config = self.leer_guion(guion_file)
+        self.path_xml = ""
+        self.xml_streaming = False
+        self.tipo_xml = None
+        self.peticion = PeticionSaltra()
+        self.concurrencia = concurrencia or self.CONCURRENCIA_CONTRATOS
+        self.concurrencia_copia_basica = concurrencia_copia_basica or self.CONCURRENCIA_COPIA_BASICA
+        self.procesos_xml = self.PROCESOS_XML
+        self.usar_cache = True
+        self.encolado = None
+        self._lock_encolado = threading.Lock()
+        self.reenviar = False
+
+        with fase("guion"):
+            self.config = self.leer_guion(guion_file)
         self.accion_deducida = self.deducir_accion_por_url()
-        self.token = self.obtener_token()
+        # En modo demonio/lote se reutiliza el token de la sesión ya abierta
+        self._lock_token = threading.Lock()
+        self.token = token if token else self.obtener_token()
 
-        self.api_certificado = DsEnvioSaltraCertificado(self.usuario, self.idUsuario, self.metodo, self.endpoint, self.config, self.fich_respuesta, self.token, self.tiempo_inicio)
-        self.api_cliente = DsEnvioSaltraCliente(self.usuario, self.metodo, self.config, self.fich_respuesta, self.token, self.tiempo_inicio)
+        self.api_certificado = DsEnvioSaltraCertificado(self.usuario, self.idUsuario, self.metodo, self.endpoint, self.config, self.fich_respuesta, self.token, self.tiempo_inicio,
+                                                        renovador_token=self.renovar_token)
+        self.api_cliente = DsEnvioSaltraCliente(self.usuario, self.metodo, self.config, self.fich_respuesta, self.token, self.tiempo_inicio,
+                                                renovador_token=self.renovar_token)
 
     def _validar_json(self, json_str: str, contexto: str = "") -> Dict:
         """Valida y parsea un string JSON"""
@@ -63,9 +123,7 @@ class SaltraClient:
 
     def _formatear_fecha(self, fecha_str: str) -> str:
         """Formatea una fecha de formato YYYYMMDD a YYYY-MM-DD"""
-        if not fecha_str or len(fecha_str) < 8:
-            return None
-        return f"{fecha_str[:4]}-{fecha_str[4:6]}-{fecha_str[6:8]}"
+        return formatear_fecha(fecha_str)
 
     def deducir_accion_por_url(self):
         if not self.endpoint:
@@ -128,29 +186,58 @@ class SaltraClient:
                 
                 if 'url' in config:
                     self.endpoint = config['url']
+
+                if 'concurrencia' in config:
+                    valor = config['concurrencia'].strip().lower()
+                    self.concurrencia = None if valor in self.VALORES_CONCURRENCIA_ADAPTATIVA else max(1, int(valor))
+
+                if 'concurrencia-copia-basica' in config:
+                    self.concurrencia_copia_basica = max(1, int(config['concurrencia-copia-basica']))
+
+                if 'procesos-xml' in config:
+                    self.procesos_xml = max(1, int(config['procesos-xml']))
+
+                if 'cache' in config:
+                    self.usar_cache = config['cache'].strip().lower() not in VALORES_SIN_CACHE
+
+                if 'reenviar' in config:
+                    self.reenviar = config['reenviar'].strip().lower() in VALORES_REENVIAR
                 
                 if 'json envio' in config:
-                    self._validar_json(config['json envio'], "El 'json envio' ")
+                    json_envio = self._validar_json(config['json envio'], "El 'json envio' ")
+                    if isinstance(json_envio, dict):
+                        self.peticion = PeticionSaltra(json_envio.get("certificado"), json_envio.get("datos"))
                 
                 if 'fiche-xml' in config:
                     try:
-                        json_guion = config['json envio']
-                        json_objecto = json.loads(json_guion)
+                        datos = self.peticion.datos
                         
-                        if "nss" in json_objecto['datos']:
-                            self.parametro = str(json_objecto['datos']['nss'])
+                        if "nss" in datos:
+                            self.parametro = str(datos['nss'])
 
                         path_xml = self.obtener_path(config['fiche-xml'].strip())
-                        json_data = self.xml_a_json(path_xml)
-
-                        if "#xmltojson#" in config['json envio']:
-                            json_guion = config['json envio']
-                            json_objecto = json.loads(json_guion)
-
-                            del json_objecto['datos']['#xmltojson#'] # Elimina la clave marcadora si existe
-                            
-                            json_objecto['datos']['json_data'] = json_data
-                            config['json envio'] = json.dumps(json_objecto)
+                        self.path_xml = path_xml
+
+                        if "#xmltojson#" in datos:
+                            del datos['#xmltojson#'] # Elimina la clave marcadora si existe
+                            self.peticion.desde_xml = True
+
+                            tipo_raiz = self.tipo_raiz_xml(path_xml)
+                            self.tipo_xml = tipo_raiz
+                            # Los lotes CONTRATOS se leen en streaming al enviarlos: no se cargan enteros en memoria
+                            if tipo_raiz == "CONTRATOS":
+                                self.xml_streaming = True
+                            elif tipo_raiz in CONVERSORES_REGISTRO:
+                                # Con varios registros se envían todos; con uno se mantiene el envío simple
+                                with fase("xml"):
+                                    registros = self.xml_a_registros(path_xml)
+                                if registros and len(registros) > 1:
+                                    self.peticion.registros_xml = registros
+                                elif registros:
+                                    self.peticion.payload_xml = registros[0]
+                            else:
+                                with fase("xml"):
+                                    self.peticion.payload_xml = self.xml_a_objeto(path_xml)
 
                     except json.JSONDecodeError as e:
                         manejar_error_y_salir(self.fich_respuesta, f"{e}", self.usuario, self.endpoint, self.tiempo_inicio)
@@ -204,10 +291,8 @@ class SaltraClient:
     def realizar_llamada_ss_sepe(self) -> str:
         data_json = ""
         try:
-            data = self.config["json envio"]
-            data_dictionary = json.loads(data)
-            certificado = data_dictionary.get("certificado")
-            data_json = data_dictionary.get("datos")
+            certificado = self.peticion.certificado
+            data_json = self.peticion.datos
 
             if isinstance(data_json, str):
                 try:
@@ -262,41 +347,32 @@ class SaltraClient:
             if self.endpoint.rstrip('/').endswith('/contrata'):
                 
                 if self.metodo == 'DELETE':
-                    response = requests.request(
+                    self.comprobar_circuito()
+                    response = obtener_transporte().request(
                         method=self.metodo,
                         url=self.endpoint,
                         headers=headers,
-                        json=datos_originales
+                        json=datos_originales,
+                        renovador_token=self.renovar_token
                     )
                     if response.status_code == 200:
                         print("Contrato eliminado correctamente.")
                     #guardar_respuesta_completa(response, self.fich_respuesta, "query_avanza",  self.config, self.usuario, self.endpoint, self.metodo, self.tiempo_inicio)
                 else:
                     test = datos_originales.get('test')
-                    json_string = datos_originales["json_data"]
-                    contratos_a_procesar = json.loads(json_string)
-                    respuestas_contratos = []
-                    for i, contrato in enumerate(contratos_a_procesar):
-                        if test == 1:
-                            contrato["test"] = test
-                            
-                        response = requests.request(
-                            method=self.metodo,
-                            url=self.endpoint,
-                            headers=headers,
-                            json=contrato
-                        )
-
-                        if response.status_code == 200:
-                            response = self.obtener_copia_basica(test, contrato, headers, response)
-                        else:
-                            response = response.json()
-                            
-                        # Acumular las respuestas en una lista
-                        respuestas_contratos.append({
-                            'response': response,
-                            'numero': i + 1
-                        })
+                    rechazados = {}
+                    if self.xml_streaming:
+                        # Primera pasada solo para validar: ningún contrato se envía si el lote aún no se ha revisado entero
+                        with fase("xml"):
+                            rechazados = self.validar_xml(self.iterar_xml(self.path_xml))
+                        contratos_a_procesar = self.iterar_xml(self.path_xml)
+                    elif self.peticion.desde_xml:
+                        contratos_a_procesar = self._payload_xml()
+                        rechazados = self.validar_xml(contratos_a_procesar)
+                    else:
+                        json_string = datos_originales["json_data"]
+                        contratos_a_procesar = json.loads(json_string)
+                    respuestas_contratos = self.enviar_contratos(contratos_a_procesar, test, headers, rechazados)
 
                     guardar_respuestas_contratos(
                         respuestas_contratos,
@@ -309,7 +385,39 @@ class SaltraClient:
                     )
             elif self.endpoint.rstrip('/').endswith('/llamamientos') or self.endpoint.rstrip('/').endswith('/prorroga') or self.endpoint.rstrip('/').endswith('/certifica') or self.endpoint.rstrip('/').endswith('/transformation') or self.endpoint.rstrip('/').endswith('/contrata/data'):
                 test = datos_originales.get('test')
-                if "json_data" in datos_originales:
+                if self.peticion.registros_xml is not None:
+                    rechazados = self.validar_xml(self.peticion.registros_xml)
+                    respuestas_registros = self.enviar_registros(self.peticion.registros_xml, test, headers, rechazados)
+                    guardar_respuestas_contratos(
+                        respuestas_registros,
+                        self.fich_respuesta,
+                        self.config,
+                        self.usuario,
+                        self.endpoint,
+                        self.metodo,
+                        self.tiempo_inicio
+                    )
+                    return
+
+                if self.peticion.desde_xml:
+                    llamada_json = self._payload_xml()
+
+                    rechazados = self.validar_xml([llamada_json])
+                    if rechazados:
+                        guardar_respuestas_contratos(
+                            [respuesta_rechazada(1, rechazados[1])],
+                            self.fich_respuesta,
+                            self.config,
+                            self.usuario,
+                            self.endpoint,
+                            self.metodo,
+                            self.tiempo_inicio
+                        )
+                        return
+
+                    if test == 1:
+                        llamada_json["test"] = test
+                elif "json_data" in datos_originales:
                     json_string = datos_originales["json_data"]
                     llamada_json = json.loads(json_string)
 
@@ -318,23 +426,54 @@ class SaltraClient:
                 else:
                     llamada_json = datos_originales
                     
-                response = requests.request(
-                    method=self.metodo,
-                    url=self.endpoint,
-                    headers=headers,
-                    json=llamada_json
-                )
-                guardar_respuesta_completa(response, self.fich_respuesta, "query_avanza",  self.config, self.usuario, self.endpoint, self.metodo, self.tiempo_inicio)
+                clave = self._clave_envio(llamada_json, test)
+                entrada = self._envio_aceptado(clave)
+                if entrada is not None:
+                    response = respuesta_http(respuesta_repetida(entrada))
+                else:
+                    self.comprobar_circuito()
+                    response = obtener_transporte().request(
+                        method=self.metodo,
+                        url=self.endpoint,
+                        headers=headers,
+                        json=llamada_json,
+                        stream=True,
+                        renovador_token=self.renovar_token
+                    )
+                guardar_respuesta_completa(response, self.fich_respuesta, "query_avanza",  self.config, self.usuario, self.endpoint, self.metodo, self.tiempo_inicio,
+                                           al_aceptar=self._registrador_envio(clave, entrada))
 
             else:
-                response = requests.request(
-                    method=self.metodo,
-                    url=self.endpoint,
-                    headers=headers,
-                    json=datos_originales
-                )
+                # Las consultas idempotentes se sirven de la caché de respuestas mientras no caduquen
+                ttl = ttl_endpoint(self.endpoint, self.metodo) if self.usar_cache else None
+                clave = clave_respuesta(self.endpoint, self.metodo, datos_originales, certificado) if ttl else None
+                response = cache_respuestas.obtener(clave) if clave else None
+                # Las altas/bajas ya aceptadas se responden desde el registro de envíos
+                clave_envio_ss = self._clave_envio(datos_originales, datos_originales.get('test'))
+                entrada = self._envio_aceptado(clave_envio_ss)
+
+                if entrada is not None:
+                    response = respuesta_http(respuesta_repetida(entrada))
+                elif response is None:
+                    self.comprobar_circuito()
+                    response = obtener_transporte().request(
+                        method=self.metodo,
+                        url=self.endpoint,
+                        headers=headers,
+                        json=datos_originales,
+                        stream=True,
+                        renovador_token=self.renovar_token
+                    )
+                    if clave:
+                        cache_respuestas.guardar(clave, response, ttl, self.endpoint)
+                else:
+                    print(f"Respuesta de {self.endpoint} obtenida de la caché")
+
+                guardar_respuesta_completa(response, self.fich_respuesta, "query_avanza",  self.config, self.usuario, self.endpoint, self.metodo, self.tiempo_inicio,
+                                           al_aceptar=self._registrador_envio(clave_envio_ss, entrada))
 
-                guardar_respuesta_completa(response, self.fich_respuesta, "query_avanza",  self.config, self.usuario, self.endpoint, self.metodo, self.tiempo_inicio)
+        except CircuitoAbierto as e:
+            self.salir_por_circuito(e)
 
         except requests.exceptions.HTTPError as e:
             data_error = json.loads(e.response.text)
@@ -350,7 +489,209 @@ class SaltraClient:
         except Exception as e:
             manejar_error_y_salir(self.fich_respuesta, f"{e}", self.usuario, self.endpoint, self.tiempo_inicio)
 
-    def obtener_copia_basica(self, test, contrato, headers, response):      
+    def _payload_xml(self):
+        if self.peticion.payload_xml is None:
+            manejar_error_y_salir(self.fich_respuesta, f"No se ha podido convertir el XML '{self.path_xml}'", self.usuario, self.endpoint, self.tiempo_inicio)
+        return self.peticion.payload_xml
+
+    def validar_xml(self, payloads):
+        """Valida los payloads del XML con las reglas de su tipo y devuelve {numero: [errores]} de los rechazados"""
+        rechazados = validar_registros(self.tipo_xml, payloads)
+        if rechazados:
+            print(f"{len(rechazados)} registros de '{self.path_xml}' rechazados por la validación local")
+        return rechazados
+
+    def enviar_contratos(self, contratos_a_procesar, test, headers, rechazados=None):
+        """
+        Envía los contratos del lote en dos etapas encadenadas: los envíos (hasta self._hilos_envio()
+        a la vez) y las descargas de copia básica de los aceptados (hasta self.concurrencia_copia_basica).
+        Los contratos de 'rechazados' ({numero: errores}) no se envían. Devuelve las respuestas en orden de 'numero'.
+        """
+        rechazados = rechazados or {}
+        hilos = self._hilos_envio()
+        envios = ThreadPoolExecutor(max_workers=hilos)
+        copias_basicas = ThreadPoolExecutor(max_workers=self.concurrencia_copia_basica)
+        # Con un XML en streaming no se leen más contratos de los que se pueden enviar enseguida
+        en_cola = threading.BoundedSemaphore(hilos * 2)
+        try:
+            futuros = []
+            for i, contrato in enumerate(contratos_a_procesar):
+                if i + 1 in rechazados:
+                    futuro = Future()
+                    futuro.set_result(respuesta_rechazada(i + 1, rechazados[i + 1]))
+                    futuros.append(futuro)
+                    continue
+                en_cola.acquire()
+                futuro = envios.submit(en_contexto(self._enviar_contrato), i + 1, contrato, test, headers, copias_basicas)
+                futuro.add_done_callback(lambda _: en_cola.release())
+                futuros.append(futuro)
+
+            respuestas_contratos = []
+            for futuro in futuros:
+                resultado = futuro.result()
+                if isinstance(resultado, Future):
+                    resultado = resultado.result()
+                respuestas_contratos.append(resultado)
+        except BaseException:
+            # Un error que aborta el lote (p.ej. manejar_error_y_salir) cancela el trabajo pendiente
+            envios.shutdown(wait=True, cancel_futures=True)
+            copias_basicas.shutdown(wait=True, cancel_futures=True)
+            raise
+        envios.shutdown(wait=True)
+        copias_basicas.shutdown(wait=True)
+
+        return respuestas_contratos
+
+    def enviar_registros(self, registros, test, headers, rechazados=None):
+        """
+        Envía cada registro de un XML multirregistro (hasta self._hilos_envio() a la vez), salvo los de 'rechazados',
+        y devuelve las respuestas en orden de 'numero'
+        """
+        rechazados = rechazados or {}
+        with ThreadPoolExecutor(max_workers=self._hilos_envio()) as envios:
+            return list(envios.map(en_contexto(lambda args: self._enviar_registro(*args, test, headers, rechazados)), enumerate(registros, start=1)))
+
+    def _hilos_envio(self) -> int:
+        """
+        Hilos de envío de un lote: la concurrencia fija o, con [concurrencia] auto, el máximo del backend;
+        en ese caso las peticiones en curso las limita su control adaptativo en el transporte
+        """
+        if self.concurrencia:
+            return self.concurrencia
+        control = control_concurrencia(self.endpoint)
+        return control.maximo if control else 1
+
+    def _enviar_registro(self, numero, registro, test, headers, rechazados=None):
+        if rechazados and numero in rechazados:
+            return respuesta_rechazada(numero, rechazados[numero])
+
+        if test == 1:
+            registro["test"] = test
+
+        clave = self._clave_envio(registro, test)
+        entrada = self._envio_aceptado(clave)
+        if entrada is not None:
+            return {'response': respuesta_repetida(entrada), 'numero': numero}
+
+        try:
+            response = obtener_transporte().request(
+                method=self.metodo,
+                url=self.endpoint,
+                headers=headers,
+                json=registro,
+                stream=True,
+                renovador_token=self.renovar_token
+            )
+        except requests.exceptions.RequestException as e:
+            # Agotados los reintentos, el registro sale con error sin abortar el resto del lote
+            return self._respuesta_sin_envio(numero, e)
+
+        respuesta_data = leer_json_con_pdfs(response, os.path.dirname(self.fich_respuesta))
+        if response.status_code == 200:
+            self._registrar_envio(clave, respuesta_data)
+        return {
+            'response': respuesta_data,
+            'numero': numero
+        }
+
+    def _respuesta_sin_envio(self, numero, error):
+        """Respuesta de un registro del lote que no ha llegado al servidor; si el backend está caído el guion se encola"""
+        if isinstance(error, CircuitoAbierto):
+            self.encolar_guion()
+        return respuesta_error_conexion(numero, error)
+
+    def encolar_guion(self) -> str:
+        """Copia el guion (una sola vez) a la cola offline de su backend, que lo volverá a ejecutar cuando se recupere"""
+        with self._lock_encolado:
+            if self.encolado is None:
+                self.encolado = cola_offline.encolar(familia_endpoint(self.endpoint), self.guion_file)
+                print(f"Guion encolado en {self.encolado}")
+            return self.encolado
+
+    def comprobar_circuito(self):
+        """
+        Se llama justo antes de ir a la red, ya consultadas la caché y el registro de envíos: con el
+        backend caído ni se intenta y el guion espera en la cola a que se recupere. En los lotes cada
+        registro lo comprueba el transporte.
+        """
+        circuito = circuito_endpoint(self.endpoint)
+        if circuito is not None and circuito.abierto():
+            self.salir_por_circuito(CircuitoAbierto(f"Servicio {circuito.nombre} no disponible (circuito abierto)"))
+
+    def salir_por_circuito(self, error):
+        ruta = self.encolar_guion()
+        manejar_error_y_salir(self.fich_respuesta, f"{error}. Guion encolado en {ruta}: se enviará automáticamente cuando el servicio se recupere",
+                              self.usuario, self.endpoint, self.tiempo_inicio)
+
+    def _clave_envio(self, payload, test):
+        """Huella del envío en el registro de envíos aceptados, o None si este envío no se registra (p.ej. con validar_sin_enviar)"""
+        if test == 1 or not endpoint_con_registro(self.endpoint, self.metodo):
+            return None
+        return clave_envio(self.endpoint, self.peticion.certificado, payload)
+
+    def _envio_aceptado(self, clave):
+        """Devuelve el envío ya aceptado con esta huella salvo que el guion pida reenviar ([reenviar])"""
+        if clave is None or self.reenviar:
+            return None
+        entrada = registro_envios.buscar(clave)
+        if entrada is not None:
+            print(f"Envío a {self.endpoint} ya aceptado (id {entrada['id_envio']}): se responde desde el registro de envíos")
+        return entrada
+
+    def _registrar_envio(self, clave, respuesta_data):
+        if clave is not None and isinstance(respuesta_data, dict) and respuesta_data.get("success") is True:
+            registro_envios.registrar(clave, self.endpoint, respuesta_data, self.fich_respuesta)
+
+    def _registrador_envio(self, clave, entrada):
+        """Función con la que guardar_respuesta_completa registra la respuesta aceptada (no si ya venía del registro)"""
+        if clave is None or entrada is not None:
+            return None
+        return lambda respuesta_data: self._registrar_envio(clave, respuesta_data)
+
+    def _enviar_contrato(self, numero, contrato, test, headers, copias_basicas):
+        """Envía un contrato; si se acepta, devuelve el Future de su copia básica en lugar de esperarla"""
+        if test == 1:
+            contrato["test"] = test
+
+        clave = self._clave_envio(contrato, test)
+        entrada = self._envio_aceptado(clave)
+        if entrada is not None:
+            return {'response': respuesta_repetida(entrada), 'numero': numero}
+
+        try:
+            response = obtener_transporte().request(
+                method=self.metodo,
+                url=self.endpoint,
+                headers=headers,
+                json=contrato,
+                stream=True,
+                renovador_token=self.renovar_token
+            )
+        except requests.exceptions.RequestException as e:
+            return self._respuesta_sin_envio(numero, e)
+
+        if response.status_code != 200:
+            return {
+                'response': response.json(),
+                'numero': numero
+            }
+
+        # El contrato se lee (cerrando la respuesta) y se registra antes de pasar a la etapa de copia básica:
+        # con stream=True, mientras no se lee, su respuesta ocupa un hueco del backend que la copia básica necesita
+        try:
+            respuesta_contrato = leer_json_con_pdfs(response, os.path.dirname(self.fich_respuesta))
+        except json.JSONDecodeError as e:
+            manejar_error_y_salir(self.fich_respuesta, f"Error al decodificar JSON: {e}", self.usuario, self.endpoint, self.tiempo_inicio)
+        self._registrar_envio(clave, respuesta_contrato)
+        return copias_basicas.submit(en_contexto(self._completar_copia_basica), numero, test, contrato, headers, respuesta_contrato)
+
+    def _completar_copia_basica(self, numero, test, contrato, headers, respuesta_contrato):
+        return {
+            'response': self.obtener_copia_basica(test, contrato, headers, respuesta_contrato),
+            'numero': numero
+        }
+
+    def obtener_copia_basica(self, test, contrato, headers, respuesta_contrato):
 
         copia_basica_json ={}
         if test == 1:
@@ -361,18 +702,29 @@ class SaltraClient:
         copia_basica_json["dni"] = contrato.get("dni", "")
         copia_basica_json["startDate"] = contrato.get("startDate", "")
 
-        reponse_copia_basica = requests.request(
-            method="GET",
-            url = "https://api.saltra.es/api/v4/sepe/copy-basic",
-            headers=headers,
-            json=copia_basica_json
-        )
-                
+        # Mismo servicio que el endpoint del contrato: .../sepe/contrata -> .../sepe/copy-basic
+        url_copia_basica = self.endpoint.rstrip('/').rsplit('/', 1)[0] + "/copy-basic"
+
+        dict1 = respuesta_contrato
         try:
-            dict1 = json.loads(response.text)
-            dict2 = json.loads(reponse_copia_basica.text)
-        except json.JSONDecodeError as e:
-            manejar_error_y_salir(self.fich_respuesta, f"Error al decodificar JSON: {e}", self.usuario, self.endpoint, self.tiempo_inicio)
+            reponse_copia_basica = obtener_transporte().request(
+                method="GET",
+                url = url_copia_basica,
+                headers=headers,
+                json=copia_basica_json,
+                stream=True,
+                renovador_token=self.renovar_token
+            )
+            try:
+                # Los PDFs van directamente a disco; en los dict quedan sus referencias
+                dict2 = leer_json_con_pdfs(reponse_copia_basica, os.path.dirname(self.fich_respuesta))
+            finally:
+                reponse_copia_basica.close()
+        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+            # El contrato ya está aceptado y registrado: sale aceptado, con el error de su copia básica,
+            # y el resto del lote sigue (abortarlo haría que al relanzarlo se volviera a enviar)
+            dict1['errors'] = f"Copia básica no obtenida: {e}"
+            return dict1
 
         if reponse_copia_basica.status_code == 200:
             # Verificar que ambas respuestas tengan success=true y la estructura de datos correcta
@@ -385,10 +737,10 @@ class SaltraClient:
                 del dict1['data']['file']
                 dict1['data']['file2'] = segundo_fichero
                 return dict1
-            else:
-                return dict2
-        else:
-            return dict2
+
+        # Solo se conserva la respuesta de la copia básica: el PDF del contrato no se va a guardar
+        descartar_pdfs_temporales(dict1)
+        return dict2
                         
     def obtener_path(self, path):
         if '\\' in path or 'C:' in path:
@@ -402,436 +754,150 @@ class SaltraClient:
         
         return path
 
-    def xml_a_json(self, path_xml):
-        try:
-            # Parsea el archivo XML 
-            tree = ET.parse(path_xml)
-            root = tree.getroot()
-            payload_api = {}
-
-            esContrato = False
-            esLlamamiento = False
-            esProrroga = False
-            esTransformacion = False
-            esCertificado = False
-            
-            if root.tag == "CONTRATOS":
-                esContrato = True
-
-            if root.tag == "LLAMAMIENTOS":
-                esLlamamiento = True
-
-            if root.tag == "PRORROGAS":
-                esProrroga = True
-
-            if root.tag == "TRANSFORMACIONES":
-                esTransformacion = True
-
-            if root.tag == "Certificado_empresa":
-                esCertificado = True
-            
-            if esContrato:
-                json_dict = []
-                for contrato_node in root:
-                    cod_contrato = int(contrato_node.tag.split('_')[1])
-                    cif_empresa = self.obtener_texto_nodo(contrato_node, 'DATOS_EMPRESA/CIF_NIF_EMPRESA/CIF_NIF')
-                    ccc_completo = self.obtener_texto_nodo(contrato_node, 'DATOS_EMPRESA/CODIGO_CUENTA_COTIZACION')
-                    
-                    regimen_empresa = ccc_completo[:4]
-                    ccc_empresa = ccc_completo[4:]
-                    
-                    identificador = self.obtener_texto_nodo(contrato_node, 'DATOS_TRABAJADOR/IDENTIFICADORPFISICA')
-                    tipo_documento = identificador[0] if identificador else ""
-                    numero_documento = identificador[1:] if identificador else ""
-                    
-                    nombre = self.obtener_texto_nodo(contrato_node, 'DATOS_TRABAJADOR/NOMBRE_APELLIDOS/NOMBRE')
-                    apellido1 = self.obtener_texto_nodo(contrato_node, 'DATOS_TRABAJADOR/NOMBRE_APELLIDOS/PRIMER_APELLIDO')
-                    apellido2 = self.obtener_texto_nodo(contrato_node, 'DATOS_TRABAJADOR/NOMBRE_APELLIDOS/SEGUNDO_APELLIDO')
-                    sexo = int(self.obtener_texto_nodo(contrato_node, 'DATOS_TRABAJADOR/SEXO', '0'))
-
-                    fecha_nacimiento = self._formatear_fecha(self.obtener_texto_nodo(contrato_node, 'DATOS_TRABAJADOR/FECHA_NACIMIENTO'))
-                    
-                    nacionalidad = int(self.obtener_texto_nodo(contrato_node, 'DATOS_TRABAJADOR/NACIONALIDAD', '0'))
-                    municipio = int(self.obtener_texto_nodo(contrato_node, 'DATOS_TRABAJADOR/MUNICIPIO_RESIDENCIA', '0'))
-                    pais_residencia = int(self.obtener_texto_nodo(contrato_node, 'DATOS_TRABAJADOR/PAIS_RESIDENCIA', '0'))
-
-                    nss = self.obtener_texto_nodo(contrato_node, 'DATOS_TRABAJADOR/NUMERO_SEGURIDAD_SOCIAL')
-                    # Asegura que el NSS tenga 12 dígitos, rellenando con ceros a la izquierda si es necesario
-                    if nss:
-                        nss = nss.zfill(12)
-                    else:
-                        nss = 0 
-                    
-                    nivel_formativo = int(self.obtener_texto_nodo(contrato_node, 'DATOS_GENERALES_CONTRATO/NIVEL_FORMATIVO', '0'))
-                    ocupacion = self.obtener_texto_nodo(contrato_node, 'DATOS_GENERALES_CONTRATO/CODIGO_OCUPACION')
-                    nacionalidad_contrato = int(self.obtener_texto_nodo(contrato_node, 'DATOS_GENERALES_CONTRATO/NACIONALIDAD_CT', '0'))
-                    municipio_contrato = int(self.obtener_texto_nodo(contrato_node, 'DATOS_GENERALES_CONTRATO/MUNICIPIO_CT', '0'))
-                    
-                    real_decreto_1435_1985 = ""
-                    if cod_contrato in self.CONTRATOS_REAL_DECRETO:
-                        real_decreto_1435_1985 = self.obtener_texto_nodo(contrato_node, 'DATOS_GENERALES_CONTRATO/REAL_DECRETO_1435_1985')
-
-                    collectiveAgreement = self.obtener_texto_nodo(contrato_node, 'DATOS_GENERALES_CONTRATO/IND_CONVENIO_COLECTIVO')
-
-                    fecha_inicio = self._formatear_fecha(self.obtener_texto_nodo(contrato_node, 'DATOS_GENERALES_CONTRATO/FECHA_INICIO'))
-                    
-                    indicativo_prtr = self.obtener_texto_nodo(contrato_node, 'DATOS_GENERALES_CONTRATO/INDICATIVO_PRTR')
-                    causa_sustitucion_str = self.obtener_texto_nodo(contrato_node, 'DATOS_CONTRATO_SUSTITUCION/CAUSA_SUSTITUCION')
-                    causa_sustitucion = causa_sustitucion_str if causa_sustitucion_str is not None else None
-
-                    horas_formacion = 0
-                    minutos_formacion = 0
-                    indicador_ere = None
-
-                    if cod_contrato in self.CONTRATOS_HORAS_FORMACION:
-                        horas_formacion_str = self.obtener_texto_nodo(contrato_node, 'DATOS_CONTRATO_TIEMPO_PARCIAL/HORAS_FORMACION', '0')
-                        horas_formacion = int(horas_formacion_str)
-                        minutos_formacion = 1
-                        
-                    # IND_ERE no existe en el XML, asumimos "N" (No)
-                    indicador_ere = self.obtener_texto_nodo(contrato_node, 'DATOS_PRESTACIONES/IND_ERE', 'N')
-                    fecha_fin = self._formatear_fecha(self.obtener_texto_nodo(contrato_node, 'DATOS_GENERALES_CONTRATO/FECHA_TERMINO'))
-
-                    tipo_firma = self.obtener_texto_nodo(contrato_node, 'DATOS_COMUNICA_COPIA_BASICA/TIPO_FIRMA')
-                    texto_copia_basica = self.obtener_texto_nodo(contrato_node, 'DATOS_COMUNICA_COPIA_BASICA/TEXTO_COPIABASICA')
-                    texto_copia_basica = self.normalizar_texto(texto_copia_basica)                   
-
-                    workplace = self.obtener_texto_nodo(contrato_node, 'DATOS_COMUNICA_COPIA_BASICA/DOMIC_CENTRO_TRABAJO')
-
-                    if cod_contrato in self.TIEMPO_PARCIAL:
-                        tipo_jornada = self.obtener_texto_nodo(contrato_node, 'DATOS_CONTRATO_TIEMPO_PARCIAL/TIPO_JORNADA')
-                        horas_jornada = self.obtener_texto_nodo(contrato_node, 'DATOS_CONTRATO_TIEMPO_PARCIAL/HORAS_JORNADA', "0")
-                        minutos_jornada = 0
-
-                    payload_api = {
-                        "cif": cif_empresa,
-                        "regimen": regimen_empresa,
-                        "ccc": ccc_empresa,
-                        "docType": tipo_documento,
-                        "dni": numero_documento,
-                        "name": nombre,
-                        "surname": apellido1,
-                        "lastSurname": apellido2,
-                        "sex": sexo,
-                        "dateOfBirth": fecha_nacimiento,
-                        "nationality": nacionalidad,
-                        "municipality": municipio,
-                        "PAIS_RESIDENCIA": pais_residencia,
-                        "nss": nss,
-                        "nivelFormativo": nivel_formativo,
-                        "occupation": ocupacion,
-                        "nationalityContract": nacionalidad_contrato,
-                        "municipalityContract": municipio_contrato,
-                        "codContract": cod_contrato,
-                        "startDate": fecha_inicio,
-                        "INDICATIVO_PRTR": indicativo_prtr,
-                        "copyBasic": {
-                            "TIPO_FIRMA": tipo_firma,
-                            "TEXTO_COPIABASICA": texto_copia_basica,
-                            "DOMIC_CENTRO_TRABAJO": workplace
-                        },
-                        "duplicate": 1
-                    }
-                    if real_decreto_1435_1985 and real_decreto_1435_1985 != "":
-                        payload_api["REAL_DECRETO_1435_1985"] = real_decreto_1435_1985
-
-                    if collectiveAgreement and collectiveAgreement != "":
-                        payload_api["collectiveAgreement"] = collectiveAgreement
-
-                    if horas_formacion > 0:
-                        payload_api["HORAS_FORMACION"] = horas_formacion
-
-                    if minutos_formacion > 0:
-                        payload_api["jornadaFormativaMin"] = minutos_formacion
-                    
-                    if indicador_ere is not None:
-                        payload_api["IND_ERE"] = indicador_ere
-
-                    if causa_sustitucion:
-                        payload_api["sustitucion"] = causa_sustitucion
-                    
-                    if fecha_fin:
-                        payload_api["endDate"] = fecha_fin
-
-                    if cod_contrato in self.TIEMPO_PARCIAL:
-                        payload_api["jornadaType"] = tipo_jornada
-                        payload_api["jornadaHour"] = horas_jornada[:4]
-                        payload_api["jornadaMin"] = horas_jornada[4:]
-                    
-                    json_dict.append(payload_api)
-
-                return json.dumps(json_dict)
-            elif esProrroga:
-                prorroga_node = root.find('PRORROGA_TIPO')
-                cif_empresa = self.obtener_texto_nodo(prorroga_node, 'DATOS_EMPRESA/CIF_NIF_EMPRESA/CIF_NIF')
-                ccc_completo = self.obtener_texto_nodo(prorroga_node, 'DATOS_EMPRESA/CCC')
-                
-                regimen_empresa = ccc_completo[:4]
-                ccc_empresa = ccc_completo[4:]
+    def _certificado_a_payload(self, certificado_node):
+        """Convierte el nodo Cuenta_cotizacion en el payload del certificado de empresa"""
+        datos = MAPEO_CERTIFICADO.extraer(certificado_node)
+        if not datos["Datos_Trabajador"]:
+            raise ValueError("el certificado no contiene Datos_Trabajador")
+
+        # Datos Representante
+        representante = {}
+        if datos["Datos_Representante"]:
+            representante = {campo: datos[f"Datos_Representante/{campo}"] for campo in CAMPOS_REPRESENTANTE}
+
+        # Datos Empresa
+        empresa = {}
+        if datos["Datos_Empresa"]:
+            empresa = {campo: datos[f"Datos_Empresa/{campo}"] for campo in CAMPOS_EMPRESA}
+
+        # Datos Trabajador
+        trabajador = {campo: datos[f"Datos_Trabajador/{campo}"] for campo in CAMPOS_TRABAJADOR}
+        trabajador["CodProfesion"] = trabajador["CodProfesion"][:4]
+
+        if datos["DistribucionJornadas"]:
+            periodos = datos["periodos"]
+            trabajador["DistribucionJornadas"] = {
+                "Periodo": periodos[0] if len(periodos) == 1 else periodos
+            }
 
-                dni = self.obtener_texto_nodo(prorroga_node, 'DATOS_USOLIBRE_EMPRESA/USOLIBRE_EMPRESA')
+        # Datos Cotización (múltiples)
+        if datos["cotizaciones"]:
+            trabajador["Datos_Cotizacion"] = datos["cotizaciones"]
 
-                fecha_inicio_cto = self._formatear_fecha(self.obtener_texto_nodo(prorroga_node, 'DATOS_GENERALES_PRORROGA/FECHA_INICIO_CTO'))
-                fecha_inicio = self._formatear_fecha(self.obtener_texto_nodo(prorroga_node, 'DATOS_GENERALES_PRORROGA/FECHA_INICIO'))
-                fecha_fin = self._formatear_fecha(self.obtener_texto_nodo(prorroga_node, 'DATOS_GENERALES_PRORROGA/FECHA_FIN'))
+        return {
+            "Datos_Representante": representante,
+            "Datos_Empresa": empresa,
+            "Datos_Trabajador": trabajador
+        }
 
-                convenio_colectivo = self.obtener_texto_nodo(prorroga_node, 'DATOS_GENERALES_PRORROGA/INDICADOR_CONV_COL')
-                
-                payload_api = {
-                    "cif": cif_empresa,
-                    "regimen": regimen_empresa,
-                    "ccc": ccc_empresa,
-                    "dni": dni,
-                    "old_startDate": fecha_inicio_cto,
-                    "startDate": fecha_inicio,
-                    "endDate": fecha_fin,
-                    "prorroga_exist_convenio": convenio_colectivo,
-                    "duplicate": 1
-                }
-                
-                return json.dumps(payload_api)
-            elif esLlamamiento:
-                llamamiento_node = root.find('LLAMAMIENTO_TIPO')
-                cif_empresa = self.obtener_texto_nodo(llamamiento_node, 'DATOS_EMPRESA/CIF_NIF_EMPRESA/CIF_NIF')
-                ccc_completo = self.obtener_texto_nodo(llamamiento_node, 'DATOS_EMPRESA/CCC')
-                
-                regimen_empresa = ccc_completo[:4]
-                ccc_empresa = ccc_completo[4:]
-                
-                identificador = self.obtener_texto_nodo(llamamiento_node, 'DATOS_TRABAJADOR/IDENTIFICADORPFISICA')
-                tipo_documento = identificador[0] if identificador else ""
-                numero_documento = identificador[1:] if identificador else ""
-                
-                nombre = self.obtener_texto_nodo(llamamiento_node, 'DATOS_TRABAJADOR/NOMBRE_APELLIDOS/NOMBRE')
-                apellido1 = self.obtener_texto_nodo(llamamiento_node, 'DATOS_TRABAJADOR/NOMBRE_APELLIDOS/PRIMER_APELLIDO')
-                apellido2 = self.obtener_texto_nodo(llamamiento_node, 'DATOS_TRABAJADOR/NOMBRE_APELLIDOS/SEGUNDO_APELLIDO')
-                sexo = int(self.obtener_texto_nodo(llamamiento_node, 'DATOS_TRABAJADOR/SEXO', '0'))
+    def _alta_a_payload(self, root):
+        """Convierte el XML de alta simple (TIPODOC/CCC/NIF_NIE/FECHA_ALTA) en su payload"""
+        datos = MAPEO_ALTA.extraer(root)
+        return {
+            "dni": datos["dni"],
+            "ccc": datos["ccc"],
+            "startDate": datos["fecha_inicio"]
+        }
 
-                fecha_nacimiento = self._formatear_fecha(self.obtener_texto_nodo(llamamiento_node, 'DATOS_TRABAJADOR/FECHA_NACIMIENTO'))
-                
-                nacionalidad = int(self.obtener_texto_nodo(llamamiento_node, 'DATOS_TRABAJADOR/NACIONALIDAD', '0'))
-                municipio = int(self.obtener_texto_nodo(llamamiento_node, 'DATOS_TRABAJADOR/MUNICIPIO_RESIDENCIA', '0'))
-                pais_residencia = int(self.obtener_texto_nodo(llamamiento_node, 'DATOS_TRABAJADOR/PAIS_RESIDENCIA', '0'))
-                nss = self.obtener_texto_nodo(llamamiento_node, 'DATOS_TRABAJADOR/NUMERO_SEGURIDAD_SOCIAL', '0')
-                if nss:
-                    nss = nss.zfill(12)
-                else:
-                    nss = 0                
+    def tipo_raiz_xml(self, path_xml):
+        """Devuelve la etiqueta raíz del XML leyendo solo hasta su apertura, o None si no se puede leer"""
+        try:
+            for _, nodo in ET.iterparse(path_xml, events=("start",)):
+                return nodo.tag
+        except (OSError, ET.ParseError) as e:
+            print(f"Ha ocurrido un error al leer el XML '{path_xml}': {e}")
+        return None
 
-                fecha_inicio = self._formatear_fecha(self.obtener_texto_nodo(llamamiento_node, 'DATOS_LLAMAMIENTO/FECHA_INICIO'))
+    def _nodos_registro(self, path_xml):
+        """
+        Recorre el XML con iterparse y genera (raíz, nodo) por cada registro de primer nivel.
+        Cada registro se libera en cuanto se pide el siguiente, así que la memoria no crece con el tamaño del fichero.
+        """
+        raiz = None
+        profundidad = 0
+
+        for evento, nodo in ET.iterparse(path_xml, events=("start", "end")):
+            if evento == "start":
+                if raiz is None:
+                    raiz = nodo
+                    if raiz.tag not in CONVERSORES_REGISTRO:
+                        raise ValueError(f"El XML '{path_xml}' de tipo {raiz.tag} no admite lectura por registros")
+                profundidad += 1
+                continue
+
+            profundidad -= 1
+            if profundidad == 1:
+                etiqueta = ETIQUETAS_REGISTRO.get(raiz.tag)
+                if etiqueta is None or nodo.tag == etiqueta:
+                    yield raiz.tag, nodo
+                raiz.clear()
+
+    def iterar_xml(self, path_xml):
+        """Recorre un XML por registros con iterparse y genera el payload de cada uno"""
+        for tipo_raiz, nodo in self._nodos_registro(path_xml):
+            yield CONVERSORES_REGISTRO[tipo_raiz](nodo)
+
+    def xml_a_registros(self, path_xml):
+        """
+        Convierte todos los registros de un XML (LLAMAMIENTOS, PRORROGAS, TRANSFORMACIONES o CONTRATOS)
+        en una lista de payloads en orden de fichero. La conversión se hace en este proceso; con
+        [procesos-xml] mayor que 1 y más de MIN_REGISTROS_PROCESOS registros, el fichero se reparte en
+        bloques de REGISTROS_POR_PROCESO registros que cada proceso lee y convierte por su cuenta.
+        """
+        try:
+            if self.procesos_xml > 1:
+                tipo_raiz, cabecera, bloques, total = bloques_registros(path_xml, self.REGISTROS_POR_PROCESO)
+                if total > self.MIN_REGISTROS_PROCESOS and len(bloques) > 1:
+                    # 'spawn' evita heredar por fork los hilos y el pool de conexiones de los modos lote/demonio
+                    contexto = multiprocessing.get_context("spawn")
+                    with ProcessPoolExecutor(max_workers=min(self.procesos_xml, len(bloques)), mp_context=contexto) as procesos:
+                        futuros = [procesos.submit(convertir_bloque, path_xml, tipo_raiz, cabecera, inicio, fin)
+                                   for inicio, fin in bloques]
+                        return [payload for futuro in futuros for payload in futuro.result()]
+
+            return list(self.iterar_xml(path_xml))
+        except FileNotFoundError:
+            print(f"Error: El archivo '{path_xml}' no fue encontrado.")
+            return None
+        except Exception as e:
+            print(f"Ha ocurrido un error al procesar el XML: {e}")
+            return None
 
-                fecha_fin = self._formatear_fecha(self.obtener_texto_nodo(llamamiento_node, 'DATOS_LLAMAMIENTO/FECHA_FIN'))
-                
-                nivel_formativo = int(self.obtener_texto_nodo(llamamiento_node, 'DATOS_LLAMAMIENTO/NIVEL_FORMATIVO', '0'))
-                ocupacion = int(self.obtener_texto_nodo(llamamiento_node, 'DATOS_LLAMAMIENTO/CODIGO_OCUPACION', '0'))
-                question = self.obtener_texto_nodo(llamamiento_node, 'DATOS_LLAMAMIENTO/IND_INCORPORA_ACTIVIDAD')
-
-                sepeId = self.obtener_texto_nodo(llamamiento_node, 'DATOS_LLAMAMIENTO/CLAVE_CONTRATO_TRANS')
-                sepeId = self.tratar_sepeId(sepeId)
-
-                payload_api = {
-                    "cif": cif_empresa,
-                    "regimen": regimen_empresa,
-                    "ccc": ccc_empresa,
-                    "duplicate": 1,
-                    "employees": [
-                        {
-                            "doc": numero_documento,
-                            "docType": tipo_documento,
-                            "name": nombre,
-                            "surname": apellido1,
-                            "lastSurname": apellido2,
-                            "nss": nss,
-                            "sex": sexo,
-                            "dateOfBirth": fecha_nacimiento,
-                            "nationality": nacionalidad,
-                            "municipality": municipio,
-                            "country": pais_residencia,
-                            "startDate": fecha_inicio,
-                            "endDate": fecha_fin,
-                            "nivelFormativo": nivel_formativo,
-                            "question": question,
-                            "occupation": ocupacion,
-                            "sepeId": sepeId
-                        }
-                    ]
-                }
-                return json.dumps(payload_api)
-            
-            elif esTransformacion:
-                contratoTiempoParcial = False
-                for transformacion_node in root:
-                    cod_contrato = int(transformacion_node.tag.split('_')[1])
-
-                    cif_empresa = self.obtener_texto_nodo(transformacion_node, 'DATOS_EMPRESA/CIF_NIF_EMPRESA/CIF_NIF')
-                    ccc_completo = self.obtener_texto_nodo(transformacion_node, 'DATOS_EMPRESA/CODIGO_CUENTA_COTIZACION')
-
-                    identificador = self.obtener_texto_nodo(transformacion_node, 'DATOS_CONTRATO/IDENTIFICADORPFISICA')
-                    fecha_inicio_cto = self._formatear_fecha(self.obtener_texto_nodo(transformacion_node, 'DATOS_CONTRATO/FECHA_INICIO_CTO'))
-                    clave_contrato = self.obtener_texto_nodo(transformacion_node, 'DATOS_CONTRATO/CLAVE_CONTRATO', '')
-                    clave_contrato = self.tratar_sepeId(clave_contrato)
-
-                    fecha_inicio_transformacion = self._formatear_fecha(self.obtener_texto_nodo(transformacion_node, 'DATOS_GENERALES_TRANSFORMACION/FECHA_INICIO'))
-                    codigo_ocupacion = self.obtener_texto_nodo(transformacion_node, 'DATOS_GENERALES_TRANSFORMACION/CODIGO_OCUPACION')
-                    nacionalidad_contrato = self.obtener_texto_nodo(transformacion_node, 'DATOS_GENERALES_TRANSFORMACION/NACIONALIDAD_CT', '0')
-                    municipio_contrato = self.obtener_texto_nodo(transformacion_node, 'DATOS_GENERALES_TRANSFORMACION/MUNICIPIO_CT', '0')
-                    
-                    tipo_firma = self.obtener_texto_nodo(transformacion_node, 'DATOS_COMUNICA_COPIA_BASICA/TIPO_FIRMA')
-                    texto_copia_basica = self.obtener_texto_nodo(transformacion_node, 'DATOS_COMUNICA_COPIA_BASICA/TEXTO_COPIABASICA', "Vacio")
-                    domicilio_centro_trabajo = self.obtener_texto_nodo(transformacion_node, 'DATOS_COMUNICA_COPIA_BASICA/DOMIC_CENTRO_TRABAJO', "") 
-
-                    if "DATOS_CONTRATO_TIEMPO_PARCIAL" in [child.tag for child in transformacion_node]:
-                        tipo_jornada = self.obtener_texto_nodo(transformacion_node, 'DATOS_CONTRATO_TIEMPO_PARCIAL/TIPO_JORNADA')
-                        horas_jornada = int(self.obtener_texto_nodo(transformacion_node, 'DATOS_CONTRATO_TIEMPO_PARCIAL/HORAS_JORNADA', 0))
-                        contratoTiempoParcial = True
-
-                    payload_api = {
-                        "TIPO_CONTRATO": cod_contrato,
-                        "DATOS_EMPRESA": {
-                            "CODIGO_CUENTA_COTIZACION": ccc_completo
-                        },
-                        "DATOS_CONTRATO": {
-                            "IDENTIFICADORPFISICA": identificador,
-                            "FECHA_INICIO_CTO": fecha_inicio_cto,
-                            "CLAVE_CONTRATO": clave_contrato
-                        },
-                        "DATOS_GENERALES_TRANSFORMACION": {
-                            "FECHA_INICIO": fecha_inicio_transformacion,
-                            "CODIGO_OCUPACION": codigo_ocupacion
-                        },
-                        "DATOS_COMUNICA_COPIA_BASICA": {
-                            "TIPO_FIRMA": tipo_firma,
-                            "TEXTO_COPIABASICA": texto_copia_basica,
-                            "DOMIC_CENTRO_TRABAJO": domicilio_centro_trabajo
-                        },
-                        "duplicate": 1
-                    }
-
-                    if contratoTiempoParcial:
-                        payload_api["DATOS_CONTRATO_TIEMPO_PARCIAL"] = {
-                            "TIPO_JORNADA": tipo_jornada,
-                            "HORAS_JORNADA": horas_jornada
-                        }
-
-                return json.dumps(payload_api)
-            elif esCertificado:
-                cerificado_node = root.find("Cuenta_cotizacion")
-
-                representante_node = cerificado_node.find("Datos_Representante")
-                # Datos Representante
-                representante = {}
-                if representante_node is not None:
-                    representante = {
-                        "CIF_NIF": self.obtener_texto_nodo(representante_node, 'CIF_NIF'),
-                        "Nombre": self.obtener_texto_nodo(representante_node, 'Nombre'),
-                        "Apellido1": self.obtener_texto_nodo(representante_node, 'Apellido1'),
-                        "Apellido2": self.obtener_texto_nodo(representante_node, 'Apellido2'),
-                        "Cargo": self.obtener_texto_nodo(representante_node, 'Cargo')
-                    }
-                
-                # Datos Empresa
-                empresa_node = cerificado_node.find('Datos_Empresa')
-                empresa = {}
-                if empresa_node is not None:
-                    empresa = {
-                        "CIF_NIF": self.obtener_texto_nodo(empresa_node, 'CIF_NIF'),
-                        "CCC": self.obtener_texto_nodo(empresa_node, 'CCC')
-                    }
-                
-                # Datos Trabajador
-                trabajador_node = cerificado_node.find('Datos_Trabajador')
-                trabajador = {}
-                
-                if trabajador_node is not None:
-                    # Datos básicos del trabajador
-                    trabajador = {
-                        "DNI_NIE": self.obtener_texto_nodo(trabajador_node, 'DNI_NIE'),
-                        "Nombre": self.obtener_texto_nodo(trabajador_node, 'Nombre'),
-                        "Apellido1": self.obtener_texto_nodo(trabajador_node, 'Apellido1'),
-                        "Apellido2": self.obtener_texto_nodo(trabajador_node, 'Apellido2'),
-                        "NumSS": self.obtener_texto_nodo(trabajador_node, 'NumSS'),
-                        "GrupoCotizacion": self.obtener_texto_nodo(trabajador_node, 'GrupoCotizacion'),
-                        "TipoContrato": self.obtener_texto_nodo(trabajador_node, 'TipoContrato'),
-                        "DuracionContrato": self.obtener_texto_nodo(trabajador_node, 'DuracionContrato'),
-                        "IndicadorDuracionContrato": self.obtener_texto_nodo(trabajador_node, 'IndicadorDuracionContrato'),
-                        "CodProfesion": self.obtener_texto_nodo(trabajador_node, 'CodProfesion')[:4],
-                        "FechaAltaEmpresa": self._formatear_fecha(self.obtener_texto_nodo(trabajador_node, 'FechaAltaEmpresa')),
-                        "CodCausaSuspension": self.obtener_texto_nodo(trabajador_node, 'CodCausaSuspension'),
-                        "FechaSuspensionExtincion": self._formatear_fecha(self.obtener_texto_nodo(trabajador_node, 'FechaSuspensionExtincion')),
-                        "DiasSalarioTramitacion": self.obtener_texto_nodo(trabajador_node, 'DiasSalarioTramitacion')
-                    }
-
-                distribucion_node = trabajador_node.find('DistribucionJornadas')
-                if distribucion_node is not None:
-                    periodos = []
-                    for periodo_node in distribucion_node.findall('Periodo'):
-                        periodo = {
-                            "TipoDistribucion": self.obtener_texto_nodo(periodo_node, 'TipoDistribucion'),
-                            "FechaInicioPeriodo": self._formatear_fecha(self.obtener_texto_nodo(periodo_node, 'FechaInicioPeriodo')),
-                            "FechaFinPeriodo": self._formatear_fecha(self.obtener_texto_nodo(periodo_node, 'FechaFinPeriodo')),
-                            "NumeroDiasTrabajadosPorSemanaOPeriodo": self.obtener_texto_nodo(periodo_node, 'NumeroDiasTrabajadosPorSemanaOPeriodo')
-                        }
-                        periodos.append(periodo)
-                    
-                    trabajador["DistribucionJornadas"] = {
-                        "Periodo": periodos[0] if len(periodos) == 1 else periodos
-                    }
-
-                # Datos Cotización (múltiples)
-                datos_cotizacion_list = []
-                for cotizacion_node in trabajador_node.findall('Datos_Cotizacion'):
-                    cotizacion = {
-                        "Ano": self.obtener_texto_nodo(cotizacion_node, 'Ano'),
-                        "Mes": self.obtener_texto_nodo(cotizacion_node, 'Mes'),
-                        "NumDiasCotizados": self.obtener_texto_nodo(cotizacion_node, 'NumDiasCotizados'),
-                        "BaseCotizacionDesempleo": self.obtener_texto_nodo(cotizacion_node, 'BaseCotizacionDesempleo')
-                    }
-                    datos_cotizacion_list.append(cotizacion)
-                
-                if datos_cotizacion_list:
-                    trabajador["Datos_Cotizacion"] = datos_cotizacion_list
-                
-                payload_api = {
-                    "Datos_Representante": representante,
-                    "Datos_Empresa": empresa,
-                    "Datos_Trabajador": trabajador
-                }
+    def xml_a_objeto(self, path_xml):
+        """
+        Convierte el XML en el payload de la API como objetos nativos: lista de contratos (CONTRATOS), payload
+        del registro (LLAMAMIENTOS, PRORROGAS, TRANSFORMACIONES; con varios registros, lista de sus payloads) o diccionario
+        """
+        try:
+            # Parsea el archivo XML 
+            tree = ET.parse(path_xml)
+            root = tree.getroot()
 
-                return json.dumps(payload_api)
+            if root.tag == "CONTRATOS":
+                return [contrato_a_payload(contrato_node) for contrato_node in root]
+            elif root.tag in CONVERSORES_REGISTRO:
+                # Mismos registros que xml_a_registros: con varios se devuelven todos en lugar de quedarse con uno
+                etiqueta = ETIQUETAS_REGISTRO.get(root.tag)
+                conversor = CONVERSORES_REGISTRO[root.tag]
+                payloads = [conversor(nodo) for nodo in root if etiqueta is None or nodo.tag == etiqueta]
+                return payloads[0] if len(payloads) == 1 else payloads
+            elif root.tag == "Certificado_empresa":
+                return self._certificado_a_payload(root.find("Cuenta_cotizacion"))
             else:
-                tipo_documento = self.obtener_texto_nodo(root, 'TIPODOC')
-                ccc = self.obtener_texto_nodo(root, 'CCC')
-                dni = self.obtener_texto_nodo(root, 'NIF_NIE')
-                fecha_inicio = self._formatear_fecha(self.obtener_texto_nodo(root, 'FECHA_ALTA'))
-                payload_api = {
-                    "dni": dni,
-                    "ccc": ccc,
-                    "startDate": fecha_inicio
-                }
-                return json.dumps(payload_api)
+                return self._alta_a_payload(root)
         except FileNotFoundError:
             print(f"Error: El archivo '{path_xml}' no fue encontrado.")
             return None
         except Exception as e:
             print(f"Ha ocurrido un error al procesar el XML: {e}")
             return None
+
+    def xml_a_json(self, path_xml):
+        payload_api = self.xml_a_objeto(path_xml)
+        return json.dumps(payload_api) if payload_api is not None else None
     
     def tratar_sepeId(self, sepeId):
-        if not sepeId:
-            return ""
-        
-        sepeId = sepeId.strip()
-
-        if re.fullmatch(r"E-\d{2}-\d{4}-\d{7}", sepeId) or re.fullmatch(r"E-\d{2}-\d{4}-\d{6}", sepeId):
-            return sepeId
-        
-        
-        solo_numeros = re.sub(r"\D", "", sepeId)
-        
-        if not sepeId.startswith("E-"):
-            return f"E-{solo_numeros[0:2]}-{solo_numeros[2:6]}-{solo_numeros[6:]}"
-        else:
-            return ""
+        return tratar_sepeId(sepeId)
 
     def obtener_texto_nodo(self, nodo_padre, ruta, valor_defecto=""):
         """
@@ -845,35 +911,113 @@ class SaltraClient:
         return valor_defecto
 
     def normalizar_texto(self, texto: str) -> str:
-        if not texto:
-            return ""
+        return normalizar_texto(texto)
 
-        try:
-            bytes_texto = texto.encode('iso-8859-1')
-            texto = bytes_texto.decode('utf-8')
-        except (UnicodeDecodeError, UnicodeEncodeError):
-            pass
+    def obtener_token(self, usar_cache=True):
+        if usar_cache:
+            token = cache_tokens.obtener(self.usuario)
+            if token:
+                return token
 
-        texto = re.sub(r'\s+', ' ', texto)
+        with fase("login"):
+            try:
+                headers = {'Content-Type': 'application/json'}
 
-        # Quita espacios al inicio y final
-        return texto.strip()
+                payload = {
+                    "email": self.usuario,
+                    "password": self.passw
+                }
 
-    def obtener_token(self):
+                response = obtener_transporte().post("https://api.saltra.es/api/v4/auth/login", headers=headers, json=payload)
+                response_data = response.json()
+
+                datos_login = response_data.get('data', {})
+                token = datos_login.get('access_token')
+
+                expira = caducidad_token(token, datos_login) if token else None
+                if expira:
+                    cache_tokens.guardar(self.usuario, token, expira)
+
+                return token
+            except Exception as e:
+                error = e
+        # Fuera de la fase, para que el login fallido ya figure en los tiempos del fichero de error
+        manejar_error_y_salir(self.fich_respuesta, f"{error}", self.usuario, self.endpoint, self.tiempo_inicio)
+
+    def renovar_token(self, token_rechazado):
+        """El transporte la invoca ante un 401 en una petición de este cliente: vuelve a hacer login una sola vez por token"""
+        with self._lock_token:
+            if self.token != token_rechazado:
+                # Otro hilo ya lo ha renovado
+                return self.token
+
+            cache_tokens.invalidar(self.usuario)
+            self.token = self.obtener_token(usar_cache=False)
+            if hasattr(self, 'api_certificado'):
+                self.api_certificado.token = self.token
+                self.api_cliente.token = self.token
+            return self.token
+
+def ejecutar_guion(client: SaltraClient, start_time) -> int:
+    """Ejecuta la acción del guion y devuelve el código de salida del proceso"""
+    # fiche-out, .txt y .fin se publican juntos al terminar, con el .fin el último
+    with salida_atomica(client.fich_respuesta):
         try:
-            headers = {'Content-Type': 'application/json'}
-
-            payload = {
-                "email": self.usuario,
-                "password": self.passw
-            }
+            if client.accion_deducida == 'certificado':
+                resultado = client.acciones_certificado()
+            elif client.accion_deducida == 'cliente':
+                resultado = client.acciones_cliente()
+            elif client.accion_deducida == 'query_avanza':    
+                resultado = client.realizar_llamada_ss_sepe()
+            else:
+                print(f"Acción desconocida: {client.accion_deducida}")
+                return 1
 
-            response = requests.post("https://api.saltra.es/api/v4/auth/login", headers=headers, json=payload)
-            response_data = response.json()
+            if resultado:  
+                return 1
 
-            return response_data.get('data', {}).get('access_token')
-        except Exception as e:
-            manejar_error_y_salir(self.fich_respuesta, f"{e}", self.usuario, self.endpoint, self.tiempo_inicio)
+            if client.fich_respuesta:
+                print("Respuesta guardada")
+                
+                # Se mantiene para el ERP; el detalle por fases va en el .tiempos.json
+                end_time = time.time()
+                total_time = round(end_time-start_time)
+                escribir_resultado(client.fich_respuesta, "\nTiempo transcurrido: "+str(total_time)+" segundos", anadir=True)
+        finally:
+            # Con medición en curso (main, procesar_guion) sus tiempos se publican con el resto de resultados
+            escribir_tiempos(client.fich_respuesta)
+
+    return 0
+
+def procesar_guion(dsClave, usuario, idUsuario, passw, guion_file, code_respuesta, token=None):
+    """
+    Ejecuta un guion dentro del proceso actual (modos demonio y lote) sin terminarlo.
+    Devuelve (codigo, client); client es None si el guion falla antes de crearse el cliente.
+    """
+    start_time = time.time()
+    client = None
+    try:
+        with medir_guion(guion_file):
+            client = SaltraClient(dsClave, usuario, idUsuario, passw, guion_file, code_respuesta, start_time, token=token)
+            codigo = ejecutar_guion(client, start_time)
+    except SystemExit as e:
+        # manejar_error_y_salir ya ha escrito el fichero de error y el .fin
+        codigo = e.code if isinstance(e.code, int) else 1
+    except Exception as e:
+        print(f"Error inesperado procesando {guion_file}: {e}")
+        codigo = 1
+
+    return codigo, client
+
+def vaciar_cola_tras_guion(client, codigo: int, ejecutar, maximo: int = None) -> int:
+    """
+    Tras un guion correcto contra un backend (que por tanto responde), ejecuta hasta 'maximo' (None: todos)
+    de los guiones que esperaban en su cola offline
+    """
+    backend = familia_endpoint(client.endpoint) if client else None
+    if codigo != 0 or client.encolado or backend not in BACKENDS_CIRCUITO:
+        return 0
+    return vaciar_cola_offline(ejecutar, backends=(backend,), maximo=maximo)
 
 def main():
     start_time = time.time()
@@ -885,35 +1029,20 @@ def main():
     passw = sys.argv[3]
     guion_file = sys.argv[4]
     code_respuesta = sys.argv[5]
+    configurar_metricas(sys.argv[6] if len(sys.argv) > 6 else None)
     
     if not os.path.exists(guion_file):
         print(f"Error: Archivo {guion_file} no encontrado")
         sys.exit(1)
 
-    client = SaltraClient(dsClave, usuario, idUsuario, passw, guion_file, code_respuesta, start_time)
-    if client.accion_deducida == 'certificado':
-        resultado = client.acciones_certificado()
-    elif client.accion_deducida == 'cliente':
-        resultado = client.acciones_cliente()
-    elif client.accion_deducida == 'query_avanza':    
-        resultado = client.realizar_llamada_ss_sepe()
-    else:
-        print(f"Acción desconocida: {client.accion_deducida}")
-        sys.exit(1)
-
-    if resultado:  
-        
-        sys.exit(1)
-    else:
-        if client.fich_respuesta:
-            print("Respuesta guardada")
-            
-            end_time = time.time()
-            total_time = round(end_time-start_time)
-            with open(client.fich_respuesta, "a") as fichero:
-                fichero.write("\nTiempo transcurrido: "+str(total_time)+" segundos")
-
-        sys.exit(0)
+    with medir_guion(guion_file):
+        client = SaltraClient(dsClave, usuario, idUsuario, passw, guion_file, code_respuesta, start_time)
+        codigo = ejecutar_guion(client, start_time)
+    # Los resultados del guion ya están publicados (.fin); después se envían los encolados, pocos por
+    # invocación para no alargar el proceso que lanzó el ERP (el resto, con las siguientes, el lote o el demonio)
+    vaciar_cola_tras_guion(client, codigo, lambda guion: procesar_guion(dsClave, usuario, idUsuario, passw, guion, code_respuesta, token=client.token),
+                           maximo=ENCOLADOS_POR_INVOCACION)
+    sys.exit(codigo)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
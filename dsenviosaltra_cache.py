@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Caché en disco de las respuestas de las consultas idempotentes de API SALTRA (cno, ocupaciones,
+categorías, convenios, CCC...). Cada respuesta se guarda en su propio fichero, con la clave
+endpoint + método + datos normalizados + certificado y una caducidad que depende del endpoint.
+El número de entradas y el tamaño total están acotados: al superarlos se borran las menos
+usadas (cada acierto actualiza la fecha de modificación del fichero).
+"""
+import io
+import os
+import json
+import time
+import hashlib
+import tempfile
+import requests
+
+RUTA_CACHE_RESPUESTAS = os.path.join(os.path.expanduser("~"), ".cache", "dsenviosaltra", "respuestas")
+# Métodos con los que se consulta cada endpoint (último tramo de la URL) y segundos que se reutiliza
+# su respuesta; solo estos se guardan. Los métodos son los de los guiones: algunas consultas van por PUT/POST
+TTL_RESPUESTAS = {
+    "cno": (("GET",), 24 * 3600),
+    "occupation": (("PUT",), 24 * 3600),
+    "category-professional": (("PUT",), 24 * 3600),
+    "category-occupation-gc": (("GET",), 24 * 3600),
+    "convenios-colectivos-por-trabajador": (("GET", "POST"), 3600),
+    "ccc-asignados": (("GET",), 600),
+    "life-ccc": (("GET",), 300),
+}
+MAX_ENTRADAS_CACHE = 500
+MAX_BYTES_CACHE = 50 * 1024 * 1024
+MAX_BYTES_ENTRADA = 1024 * 1024
+SUFIJO_ENTRADA = ".json"
+# Valores de la sección [cache] del guion que desactivan la caché para esa llamada
+VALORES_SIN_CACHE = ("no", "0", "false", "off")
+
+def ttl_endpoint(endpoint: str, metodo: str):
+    """Segundos de validez de la respuesta de este endpoint, o None si no se guarda en caché"""
+    if not endpoint:
+        return None
+    metodos, ttl = TTL_RESPUESTAS.get(endpoint.rstrip("/").rsplit("/", 1)[-1], ((), None))
+    return ttl if (metodo or "").upper() in metodos else None
+
+def clave_respuesta(endpoint: str, metodo: str, datos, certificado) -> str:
+    """Clave de la respuesta: el orden de los campos de 'datos' y los espacios del certificado no la cambian"""
+    normalizado = json.dumps(
+        [endpoint.rstrip("/"), metodo.upper(), datos, (certificado or "").strip()],
+        sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(normalizado.encode("utf-8")).hexdigest()
+
+class CacheRespuestas:
+    def __init__(self, ruta: str = None):
+        self._ruta = ruta
+
+    @property
+    def ruta(self):
+        return self._ruta or RUTA_CACHE_RESPUESTAS
+
+    def _fichero(self, clave: str) -> str:
+        return os.path.join(self.ruta, clave + SUFIJO_ENTRADA)
+
+    def obtener(self, clave: str):
+        """Devuelve la respuesta guardada (como requests.Response) si no ha caducado"""
+        fichero = self._fichero(clave)
+        try:
+            with open(fichero, "r", encoding="utf-8") as f:
+                entrada = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Error leyendo la caché de respuestas: {e}")
+            return None
+
+        if entrada.get("expira", 0) <= time.time():
+            self._borrar(fichero)
+            return None
+        try:
+            os.utime(fichero)
+        except OSError:
+            pass
+
+        response = requests.Response()
+        response.status_code = entrada["status"]
+        response.headers["content-type"] = entrada["content_type"]
+        response.encoding = "utf-8"
+        response.url = entrada.get("url", "")
+        response.raw = io.BytesIO(entrada["cuerpo"].encode("utf-8"))
+        return response
+
+    def guardar(self, clave: str, response, ttl: int, url: str = ""):
+        """Guarda la respuesta si es un JSON correcto; la respuesta sigue pudiéndose leer después"""
+        if not isinstance(response, requests.Response) or response.status_code != 200:
+            return
+        content_type = response.headers.get("content-type", "")
+        if "application/json" not in content_type:
+            return
+        try:
+            cuerpo = response.content.decode(response.encoding or "utf-8")
+            if len(cuerpo) > MAX_BYTES_ENTRADA or json.loads(cuerpo).get("success") is not True:
+                return
+
+            os.makedirs(self.ruta, mode=0o700, exist_ok=True)
+            descriptor, ruta_temporal = tempfile.mkstemp(dir=self.ruta, prefix=".respuesta")
+            try:
+                os.chmod(ruta_temporal, 0o600)
+                with os.fdopen(descriptor, "w", encoding="utf-8") as f:
+                    json.dump({"expira": time.time() + ttl, "status": response.status_code,
+                               "content_type": content_type, "url": url, "cuerpo": cuerpo}, f, ensure_ascii=False)
+                os.replace(ruta_temporal, self._fichero(clave))
+            except Exception:
+                os.unlink(ruta_temporal)
+                raise
+            self._recortar()
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Error guardando la caché de respuestas: {e}")
+
+    def _borrar(self, fichero: str):
+        try:
+            os.unlink(fichero)
+        except FileNotFoundError:
+            pass
+
+    def _recortar(self):
+        """Borra las entradas caducadas y, si aún se superan los límites, las menos usadas"""
+        ahora = time.time()
+        entradas = []
+        for nombre in os.listdir(self.ruta):
+            if not nombre.endswith(SUFIJO_ENTRADA):
+                continue
+            fichero = os.path.join(self.ruta, nombre)
+            try:
+                estado = os.stat(fichero)
+            except FileNotFoundError:
+                continue
+            entradas.append((estado.st_mtime, estado.st_size, fichero))
+
+        entradas.sort()
+        total = sum(tamano for _, tamano, _ in entradas)
+        # El TTL máximo acota cuánto puede llevar una entrada sin usarse y seguir siendo válida
+        limite = ahora - max(ttl for _, ttl in TTL_RESPUESTAS.values())
+        while entradas and (len(entradas) > MAX_ENTRADAS_CACHE or total > MAX_BYTES_CACHE or entradas[0][0] < limite):
+            _, tamano, fichero = entradas.pop(0)
+            total -= tamano
+            self._borrar(fichero)
+
+cache_respuestas = CacheRespuestas()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Índice local (SQLite) de los catálogos de referencia de API SALTRA: ocupaciones (CNO),
+grupos de cotización y categorías profesionales.
+
+El índice se rellena de forma incremental con las entradas que traen las respuestas de las
+consultas (cno, parámetros 018/019/021 de category-occupation-gc) y se puede cargar entero
+desde un fichero exportado (JSON o CSV 'codigo;descripcion'). Con él se consultan los códigos
+sin ir a la red y, si el catálogo de ocupaciones se ha cargado entero, los conversores XML
+comprueban CODIGO_OCUPACION antes de enviar.
+
+Uso: python dsenviosaltra_catalogo.py cargar <catalogo> <fichero>
+     python dsenviosaltra_catalogo.py buscar <catalogo> <codigo o texto>
+"""
+import os
+import sys
+import csv
+import json
+import time
+import sqlite3
+import threading
+
+RUTA_CATALOGO = os.path.join(os.path.expanduser("~"), ".cache", "dsenviosaltra", "catalogos.sqlite")
+CATALOGO_OCUPACION = "ocupacion"
+CATALOGO_GRUPO_COTIZACION = "grupo-cotizacion"
+CATALOGO_CATEGORIA_PROFESIONAL = "categoria-profesional"
+CATALOGOS = (CATALOGO_OCUPACION, CATALOGO_GRUPO_COTIZACION, CATALOGO_CATEGORIA_PROFESIONAL)
+
+# Clave de 'data' con una entrada de catálogo en las respuestas 018/019/021
+CATALOGOS_CLAVE_RESPUESTA = {
+    "grupoCotizacion": CATALOGO_GRUPO_COTIZACION,
+    "ocupacion": CATALOGO_OCUPACION,
+    "categoriaProfesional": CATALOGO_CATEGORIA_PROFESIONAL,
+}
+# Endpoints (último tramo de la URL) cuya respuesta es una lista de entradas de catálogo
+CATALOGOS_ENDPOINT = {
+    "cno": CATALOGO_OCUPACION,
+}
+# Nombres con los que llegan el código y la descripción de cada entrada
+CAMPOS_CODIGO = ("codigo", "code", "cno", "codigoOcupacion", "id")
+CAMPOS_DESCRIPCION = ("descripcion", "description", "denominacion", "literal", "nombre", "name")
+MAX_RESULTADOS_BUSQUEDA = 50
+
+def normalizar_codigo(codigo) -> str:
+    """'0110 ', 110 y '110' son el mismo código: sin espacios ni ceros a la izquierda"""
+    if codigo is None:
+        return ""
+    codigo = str(codigo).strip()
+    if codigo.isdigit():
+        codigo = codigo.lstrip("0") or "0"
+    return codigo
+
+def _primer_campo(entrada: dict, campos):
+    for campo in campos:
+        valor = entrada.get(campo)
+        if valor not in (None, ""):
+            return valor
+    return None
+
+class CatalogoReferencia:
+    def __init__(self, ruta: str = None):
+        self._ruta = ruta
+        self._conexiones = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ruta(self):
+        return self._ruta or RUTA_CATALOGO
+
+    def _conexion(self) -> sqlite3.Connection:
+        """Una conexión por ruta y proceso (los conversores XML pueden ejecutarse en otros procesos)"""
+        clave = (self.ruta, os.getpid())
+        conexion = self._conexiones.get(clave)
+        if conexion is None:
+            with self._lock:
+                conexion = self._conexiones.get(clave)
+                if conexion is None:
+                    os.makedirs(os.path.dirname(self.ruta), mode=0o700, exist_ok=True)
+                    conexion = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False, isolation_level=None)
+                    conexion.execute("PRAGMA journal_mode=WAL")
+                    conexion.execute("""CREATE TABLE IF NOT EXISTS entradas (
+                        catalogo TEXT NOT NULL,
+                        codigo TEXT NOT NULL,
+                        descripcion TEXT,
+                        datos TEXT,
+                        actualizado REAL NOT NULL,
+                        PRIMARY KEY (catalogo, codigo)
+                    ) WITHOUT ROWID""")
+                    # Catálogos cargados enteros: solo con ellos se puede dar un código por inexistente
+                    conexion.execute("""CREATE TABLE IF NOT EXISTS catalogos (
+                        catalogo TEXT PRIMARY KEY,
+                        actualizado REAL NOT NULL
+                    )""")
+                    self._conexiones[clave] = conexion
+        return conexion
+
+    def actualizar(self, catalogo: str, entradas, completo: bool = False) -> int:
+        """
+        Añade o actualiza entradas (dicts con código y descripción). Con completo=True las entradas
+        sustituyen todo el catálogo. Devuelve cuántas se han guardado.
+        """
+        ahora = time.time()
+        filas = []
+        for entrada in entradas:
+            codigo = normalizar_codigo(_primer_campo(entrada, CAMPOS_CODIGO))
+            if not codigo:
+                continue
+            descripcion = _primer_campo(entrada, CAMPOS_DESCRIPCION)
+            filas.append((catalogo, codigo, None if descripcion is None else str(descripcion),
+                          json.dumps(entrada, ensure_ascii=False), ahora))
+
+        conexion = self._conexion()
+        with self._lock:
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                if completo:
+                    conexion.execute("DELETE FROM entradas WHERE catalogo = ?", (catalogo,))
+                    conexion.execute("INSERT OR REPLACE INTO catalogos VALUES (?, ?)", (catalogo, ahora))
+                conexion.executemany("INSERT OR REPLACE INTO entradas VALUES (?, ?, ?, ?, ?)", filas)
+                conexion.execute("COMMIT")
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+        return len(filas)
+
+    def cargar_fichero(self, catalogo: str, ruta_fichero: str) -> int:
+        """Sustituye el catálogo por el de un fichero JSON (lista de entradas o {'data': [...]}) o CSV 'codigo;descripcion'"""
+        if ruta_fichero.lower().endswith(".json"):
+            with open(ruta_fichero, "r", encoding="utf-8") as f:
+                entradas = json.load(f)
+            if isinstance(entradas, dict):
+                entradas = entradas.get("data", [])
+        else:
+            with open(ruta_fichero, "r", encoding="iso-8859-1", newline="") as f:
+                entradas = [{"codigo": fila[0], "descripcion": fila[1] if len(fila) > 1 else None}
+                            for fila in csv.reader(f, delimiter=";") if fila]
+        return self.actualizar(catalogo, entradas, completo=True)
+
+    def buscar(self, catalogo: str, codigo):
+        """Devuelve la entrada del código ({'codigo', 'descripcion', 'datos', 'actualizado'}) o None"""
+        fila = self._conexion().execute(
+            "SELECT codigo, descripcion, datos, actualizado FROM entradas WHERE catalogo = ? AND codigo = ?",
+            (catalogo, normalizar_codigo(codigo))
+        ).fetchone()
+        if fila is None:
+            return None
+        return {"codigo": fila[0], "descripcion": fila[1], "datos": json.loads(fila[2]), "actualizado": fila[3]}
+
+    def buscar_texto(self, catalogo: str, texto: str, limite: int = MAX_RESULTADOS_BUSQUEDA):
+        """Entradas cuyo código empieza por 'texto' o cuya descripción lo contiene"""
+        filas = self._conexion().execute(
+            "SELECT codigo, descripcion FROM entradas WHERE catalogo = ? AND (codigo LIKE ? OR descripcion LIKE ?) ORDER BY codigo LIMIT ?",
+            (catalogo, normalizar_codigo(texto) + "%", f"%{texto.strip()}%", limite)
+        ).fetchall()
+        return [{"codigo": codigo, "descripcion": descripcion} for codigo, descripcion in filas]
+
+    def tamano(self, catalogo: str) -> int:
+        return self._conexion().execute("SELECT COUNT(*) FROM entradas WHERE catalogo = ?", (catalogo,)).fetchone()[0]
+
+    def completo(self, catalogo: str) -> bool:
+        """Indica si el catálogo se ha cargado entero (y no solo con las entradas de las respuestas)"""
+        return self._conexion().execute("SELECT 1 FROM catalogos WHERE catalogo = ?", (catalogo,)).fetchone() is not None
+
+    def codigo_valido(self, catalogo: str, codigo) -> bool:
+        """Indica si el código está en el catálogo; si no se ha cargado entero no se puede descartar ninguno"""
+        if self.buscar(catalogo, codigo) is not None:
+            return True
+        return not self.completo(catalogo)
+
+    def registrar_respuesta(self, endpoint: str, data):
+        """Incorpora al índice las entradas de catálogo que trae una respuesta de consulta"""
+        try:
+            if isinstance(data, dict):
+                for clave, catalogo in CATALOGOS_CLAVE_RESPUESTA.items():
+                    if isinstance(data.get(clave), dict):
+                        self.actualizar(catalogo, [data[clave]])
+
+            catalogo = CATALOGOS_ENDPOINT.get((endpoint or "").rstrip("/").rsplit("/", 1)[-1])
+            if catalogo is not None:
+                entradas = data.get("list") if isinstance(data, dict) else data
+                if isinstance(entradas, list):
+                    self.actualizar(catalogo, [entrada for entrada in entradas if isinstance(entrada, dict)])
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error actualizando el catálogo de referencia: {e}")
+
+catalogo_referencia = CatalogoReferencia()
+
+def main():
+    if len(sys.argv) < 4 or sys.argv[1] not in ("cargar", "buscar") or sys.argv[2] not in CATALOGOS:
+        print(f"Uso: python dsenviosaltra_catalogo.py cargar|buscar <{'|'.join(CATALOGOS)}> <fichero|codigo|texto>")
+        sys.exit(1)
+
+    accion, catalogo, argumento = sys.argv[1:4]
+    if accion == "cargar":
+        print(f"{catalogo_referencia.cargar_fichero(catalogo, argumento)} entradas cargadas en el catálogo {catalogo}")
+        return
+
+    entrada = catalogo_referencia.buscar(catalogo, argumento)
+    resultados = [entrada] if entrada else catalogo_referencia.buscar_texto(catalogo, argumento)
+    for resultado in resultados:
+        print(f"{resultado['codigo']} : {resultado['descripcion']}")
+
+if __name__ == "__main__":
+    main()
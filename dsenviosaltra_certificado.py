@@ -4,9 +4,10 @@ import base64
 import requests
 from typing import Dict, Any
 from dsenviosaltra_respuestas import guardar_respuesta_completa, manejar_error_y_salir
+from dsenviosaltra_http import obtener_transporte
 
 class DsEnvioSaltraCertificado:
-    def __init__(self, usuario, idUsuario, metodo, endpoint: str, config: Dict[str, Any], fich_respuesta: str, token, tiempo_inicio):
+    def __init__(self, usuario, idUsuario, metodo, endpoint: str, config: Dict[str, Any], fich_respuesta: str, token, tiempo_inicio, renovador_token=None):
         self.usuario = usuario
         self.idUsuario = idUsuario
         self.metodo = metodo
@@ -15,6 +16,7 @@ class DsEnvioSaltraCertificado:
         self.fich_respuesta = fich_respuesta
         self.token = token
         self.tiempo_inicio = tiempo_inicio
+        self.renovador_token = renovador_token
 
 
     def subir_certificado(self):
@@ -52,11 +54,12 @@ class DsEnvioSaltraCertificado:
                 'Authorization': f'Bearer {self.token}'
             }
 
-            response = requests.post(
+            response = obtener_transporte().post(
                 api_url, 
                 headers=headers, 
                 data=payload_data, 
-                files=payload_files
+                files=payload_files,
+                renovador_token=self.renovador_token
             )
 
             response.raise_for_status()
@@ -75,7 +78,7 @@ class DsEnvioSaltraCertificado:
                 'Authorization': f'Bearer {self.token}'
             }
                     
-            response = requests.delete(endpoint, headers=headers)
+            response = obtener_transporte().delete(endpoint, headers=headers, renovador_token=self.renovador_token)
             response.raise_for_status()
             guardar_respuesta_completa(response, self.fich_respuesta, "certificado", self.config, self.usuario, endpoint, "DELETE", self.tiempo_inicio)
         except Exception as e:
@@ -91,7 +94,7 @@ class DsEnvioSaltraCertificado:
                 'Authorization': f'Bearer {self.token}'
             }
                     
-            response = requests.get(api_url, headers=headers)
+            response = obtener_transporte().get(api_url, headers=headers, renovador_token=self.renovador_token)
             response.raise_for_status()
             guardar_respuesta_completa(response, self.fich_respuesta, "certificado", self.config, self.usuario, api_url, "GET", self.tiempo_inicio)
 
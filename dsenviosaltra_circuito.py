@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Cortacircuitos por backend de API SALTRA (seg-social y sepe) y cola local de los guiones que
+llegan mientras el backend está caído.
+
+Tras UMBRAL_FALLOS fallos seguidos (errores de conexión, timeouts, 502/503/504) el circuito del
+backend se abre: sus peticiones fallan al momento sin abrir conexión y los guiones que llegan se
+copian a la cola de ese backend. Pasada la espera, una única petición de prueba (semiabierto)
+decide si el circuito se cierra o vuelve a abrirse con el doble de espera. El estado se guarda en
+SQLite para que lo compartan todos los procesos (un guion por proceso, lote, demonio).
+
+Con el circuito cerrado, la cola se vacía sola: el demonio mueve los guiones encolados a su spool
+y dsenviosaltra.py / el modo lote los ejecutan tras terminar con éxito un guion del mismo backend.
+Un guion en ejecución está bloqueado por su proceso; si este muere, vuelve a la cola.
+Los envíos que ya se aceptaron antes de la caída no se repiten (registro de envíos).
+"""
+import os
+import time
+import shutil
+import sqlite3
+import threading
+import requests
+from contextlib import contextmanager
+from dsenviosaltra_limites import familia_endpoint
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+RUTA_CIRCUITOS = os.path.join(os.path.expanduser("~"), ".cache", "dsenviosaltra", "circuitos.sqlite")
+RUTA_COLA_OFFLINE = os.path.join(os.path.expanduser("~"), ".cache", "dsenviosaltra", "pendientes")
+# Subdirectorio de cada backend con los guiones que se están ejecutando (bloqueados por su proceso)
+DIRECTORIO_EN_CURSO = ".procesando"
+BACKENDS_CIRCUITO = ("seg-social", "sepe")
+ESTADOS_FALLO = frozenset({502, 503, 504})
+UMBRAL_FALLOS = 5
+ESPERA_CIRCUITO = 30.0
+MAX_ESPERA_CIRCUITO = 600.0
+# Una prueba semiabierta sin resultado pasado este tiempo (p.ej. el proceso murió) se da por perdida
+MAX_DURACION_PRUEBA = 300.0
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+class CircuitoAbierto(requests.exceptions.ConnectionError):
+    """Petición no enviada porque el circuito de su backend está abierto"""
+
+class CircuitoBackend:
+    def __init__(self, nombre: str, umbral: int = UMBRAL_FALLOS, espera: float = ESPERA_CIRCUITO, ruta: str = None):
+        self.nombre = nombre
+        self.umbral = umbral
+        self.espera_inicial = espera
+        self._ruta = ruta
+        self._conexiones = {}
+        # La conexión se comparte entre hilos: cada consulta o transacción la usa en exclusiva
+        self._lock = threading.RLock()
+
+    @property
+    def ruta(self):
+        return self._ruta or RUTA_CIRCUITOS
+
+    def _conexion(self) -> sqlite3.Connection:
+        clave = (self.ruta, os.getpid())
+        conexion = self._conexiones.get(clave)
+        if conexion is None:
+            with self._lock:
+                conexion = self._conexiones.get(clave)
+                if conexion is None:
+                    os.makedirs(os.path.dirname(self.ruta), mode=0o700, exist_ok=True)
+                    conexion = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False, isolation_level=None)
+                    conexion.execute("PRAGMA journal_mode=WAL")
+                    conexion.execute("""CREATE TABLE IF NOT EXISTS circuitos (
+                        backend TEXT PRIMARY KEY,
+                        estado TEXT NOT NULL,
+                        fallos INTEGER NOT NULL,
+                        espera REAL NOT NULL,
+                        desde REAL NOT NULL
+                    )""")
+                    self._conexiones[clave] = conexion
+        return conexion
+
+    def _leer(self):
+        """(estado, fallos, espera, desde); 'desde' es el fin de la espera si está abierto o el inicio de la prueba si está semiabierto"""
+        fila = self._conexion().execute(
+            "SELECT estado, fallos, espera, desde FROM circuitos WHERE backend = ?", (self.nombre,)
+        ).fetchone()
+        return fila or (CERRADO, 0, self.espera_inicial, 0.0)
+
+    def _guardar(self, conexion, estado: str, fallos: int, espera: float, desde: float):
+        conexion.execute("INSERT OR REPLACE INTO circuitos VALUES (?, ?, ?, ?, ?)", (self.nombre, estado, fallos, espera, desde))
+
+    def abierto(self) -> bool:
+        """Indica si el backend se da por caído ahora mismo (abierto en espera o con una prueba en curso)"""
+        try:
+            with self._lock:
+                estado, _, _, desde = self._leer()
+        except sqlite3.Error:
+            return False
+        ahora = time.time()
+        if estado == ABIERTO:
+            return ahora < desde
+        if estado == SEMIABIERTO:
+            return ahora < desde + MAX_DURACION_PRUEBA
+        return False
+
+    def cerrado(self) -> bool:
+        try:
+            with self._lock:
+                return self._leer()[0] == CERRADO
+        except sqlite3.Error:
+            return True
+
+    def permitir(self) -> bool:
+        """Indica si la petición puede salir; con el circuito abierto y la espera cumplida, solo la de prueba"""
+        try:
+            with self._lock:
+                estado, fallos, espera, desde = self._leer()
+                if estado == CERRADO:
+                    return True
+                ahora = time.time()
+                vencido = ahora >= desde if estado == ABIERTO else ahora >= desde + MAX_DURACION_PRUEBA
+                if not vencido:
+                    return False
+                # Solo un proceso/hilo se queda con la prueba
+                cursor = self._conexion().execute(
+                    "UPDATE circuitos SET estado = ?, desde = ? WHERE backend = ? AND estado = ? AND desde = ?",
+                    (SEMIABIERTO, ahora, self.nombre, estado, desde)
+                )
+                return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            print(f"Error leyendo el circuito de {self.nombre}: {e}")
+            return True
+
+    def registrar(self, exito: bool):
+        try:
+            conexion = self._conexion()
+            with self._lock:
+                # Caso habitual: respuesta correcta con el circuito cerrado y sin fallos, nada que guardar
+                if exito and self._leer()[:2] == (CERRADO, 0):
+                    return
+                conexion.execute("BEGIN IMMEDIATE")
+                try:
+                    estado, fallos, espera, desde = self._leer()
+                    if exito:
+                        if estado != CERRADO or fallos:
+                            self._guardar(conexion, CERRADO, 0, self.espera_inicial, 0.0)
+                            if estado != CERRADO:
+                                print(f"Servicio {self.nombre} recuperado: circuito cerrado")
+                    elif estado == SEMIABIERTO:
+                        espera = min(MAX_ESPERA_CIRCUITO, espera * 2)
+                        self._guardar(conexion, ABIERTO, fallos + 1, espera, time.time() + espera)
+                        print(f"Servicio {self.nombre} sigue sin responder: circuito abierto {espera:.0f} s")
+                    elif estado == CERRADO:
+                        fallos += 1
+                        if fallos >= self.umbral:
+                            self._guardar(conexion, ABIERTO, fallos, self.espera_inicial, time.time() + self.espera_inicial)
+                            print(f"Servicio {self.nombre} no disponible tras {fallos} fallos: circuito abierto {self.espera_inicial:.0f} s")
+                        else:
+                            self._guardar(conexion, CERRADO, fallos, espera, desde)
+                    conexion.execute("COMMIT")
+                except BaseException:
+                    conexion.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            print(f"Error guardando el circuito de {self.nombre}: {e}")
+
+circuitos = {nombre: CircuitoBackend(nombre) for nombre in BACKENDS_CIRCUITO}
+
+def circuito_endpoint(url: str):
+    """Circuito del backend al que va la URL, o None si ese backend no tiene circuito"""
+    return circuitos.get(familia_endpoint(url))
+
+class ColaOffline:
+    """Guiones en espera de que su backend se recupere: un directorio por backend, en orden de llegada"""
+    def __init__(self, ruta: str = None):
+        self._ruta = ruta
+
+    @property
+    def ruta(self):
+        return self._ruta or RUTA_COLA_OFFLINE
+
+    def _directorio(self, backend: str) -> str:
+        return os.path.join(self.ruta, backend)
+
+    def encolar(self, backend: str, guion_file: str) -> str:
+        """Copia el guion a la cola del backend (escritura completa antes de aparecer en la cola) y devuelve la copia"""
+        directorio = self._directorio(backend)
+        os.makedirs(directorio, mode=0o700, exist_ok=True)
+        destino = os.path.join(directorio, f"{time.time_ns()}_{os.getpid()}_{os.path.basename(guion_file)}")
+        temporal = os.path.join(directorio, "." + os.path.basename(destino))
+        shutil.copyfile(guion_file, temporal)
+        with open(temporal, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(temporal, destino)
+        return destino
+
+    def pendientes(self, backend: str):
+        directorio = self._directorio(backend)
+        try:
+            nombres = sorted(nombre for nombre in os.listdir(directorio) if not nombre.startswith("."))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(directorio, nombre) for nombre in nombres]
+
+    def recuperar(self, backend: str) -> int:
+        """
+        Devuelve a la cola los guiones de DIRECTORIO_EN_CURSO que ya no tiene bloqueados ningún proceso
+        (murió mientras los ejecutaba) y devuelve cuántos. Sin fcntl no se puede saber y no se mueve ninguno.
+        """
+        directorio = os.path.join(self._directorio(backend), DIRECTORIO_EN_CURSO)
+        try:
+            nombres = sorted(os.listdir(directorio))
+        except FileNotFoundError:
+            return 0
+        if fcntl is None:
+            return 0
+        recuperados = 0
+        for nombre in nombres:
+            ruta = os.path.join(directorio, nombre)
+            try:
+                descriptor = os.open(ruta, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                if _bloquear(descriptor):
+                    os.replace(ruta, os.path.join(self._directorio(backend), nombre))
+                    print(f"Guion encolado sin terminar devuelto a la cola de {backend}: {nombre}")
+                    recuperados += 1
+            except FileNotFoundError:
+                pass
+            finally:
+                os.close(descriptor)
+        return recuperados
+
+    @contextmanager
+    def ejecutando(self, guion: str):
+        """
+        Reclama el guion encolado para ejecutarlo en este proceso: lo bloquea y lo mueve a DIRECTORIO_EN_CURSO.
+        Produce su nueva ruta, o None si ya lo ha reclamado otro. Solo se borra si el bloque termina sin
+        error; si el proceso muere, el bloqueo se libera y recuperar() lo devuelve a la cola.
+        """
+        directorio = os.path.join(os.path.dirname(guion), DIRECTORIO_EN_CURSO)
+        os.makedirs(directorio, mode=0o700, exist_ok=True)
+        try:
+            descriptor = os.open(guion, os.O_RDONLY)
+        except FileNotFoundError:
+            yield None
+            return
+        try:
+            reclamado = os.path.join(directorio, os.path.basename(guion))
+            try:
+                if _bloquear(descriptor):
+                    # El bloqueo sigue al fichero al renombrarlo
+                    os.replace(guion, reclamado)
+                else:
+                    reclamado = None
+            except FileNotFoundError:
+                reclamado = None
+            yield reclamado
+            if reclamado is not None:
+                os.unlink(reclamado)
+        finally:
+            os.close(descriptor)
+
+    def reclamar(self, guion: str, destino: str):
+        """Mueve el guion encolado a 'destino' (directorio); si otro proceso lo ha reclamado devuelve None"""
+        ruta_destino = os.path.join(destino, os.path.basename(guion))
+        try:
+            os.replace(guion, ruta_destino)
+        except FileNotFoundError:
+            return None
+        return ruta_destino
+
+def _bloquear(descriptor) -> bool:
+    """Bloqueo exclusivo sin esperar; False si lo tiene otro proceso"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+cola_offline = ColaOffline()
+
+def guiones_recuperables(backends=BACKENDS_CIRCUITO):
+    """Guiones encolados que ya se pueden volver a ejecutar: todos si el circuito está cerrado, uno de prueba si ha cumplido la espera"""
+    guiones = []
+    for backend in backends:
+        circuito = circuitos.get(backend)
+        cola_offline.recuperar(backend)
+        pendientes = cola_offline.pendientes(backend)
+        if circuito is None or circuito.cerrado():
+            guiones.extend(pendientes)
+        elif not circuito.abierto():
+            guiones.extend(pendientes[:1])
+    return guiones
+
+def vaciar_cola_offline(ejecutar, backends=BACKENDS_CIRCUITO, maximo: int = None) -> int:
+    """
+    Ejecuta con ejecutar(ruta_guion) los guiones encolados de los backends con el circuito cerrado,
+    hasta que se vacíe la cola, el circuito se vuelva a abrir o se hayan ejecutado 'maximo' (None:
+    sin límite). Devuelve cuántos se han ejecutado.
+    """
+    ejecutados = 0
+    for backend in backends:
+        circuito = circuitos.get(backend)
+        # Los que dejó a medias un proceso que murió vuelven a la cola antes de vaciarla
+        cola_offline.recuperar(backend)
+        for guion in cola_offline.pendientes(backend):
+            if (circuito is not None and circuito.abierto()) or ejecutados == maximo:
+                break
+            with cola_offline.ejecutando(guion) as reclamado:
+                if reclamado is None:
+                    continue
+                print(f"Enviando guion encolado mientras {backend} no estaba disponible: {os.path.basename(guion)}")
+                ejecutar(reclamado)
+            ejecutados += 1
+    return ejecutados
@@ -7,15 +7,17 @@ import json
 import requests
 from typing import Dict, Any
 from dsenviosaltra_respuestas import guardar_respuesta_completa, manejar_error_y_salir
+from dsenviosaltra_http import obtener_transporte
 
 class DsEnvioSaltraCliente:
-    def __init__(self, usuario, metodo, config: Dict[str, Any], fich_respuesta: str, token, tiempo_inicio):
+    def __init__(self, usuario, metodo, config: Dict[str, Any], fich_respuesta: str, token, tiempo_inicio, renovador_token=None):
         self.usuario = usuario
         self.metodo = metodo
         self.config = config
         self.fich_respuesta = fich_respuesta
         self.token = token
         self.tiempo_inicio = tiempo_inicio
+        self.renovador_token = renovador_token
         
     def subir_cliente(self, api_url):
         try: 
@@ -31,7 +33,7 @@ class DsEnvioSaltraCliente:
                     'Authorization': f'Bearer {self.token}'
                 }
 
-                response = requests.post(api_url, headers=headers, json=data_dictionary)
+                response = obtener_transporte().post(api_url, headers=headers, json=data_dictionary, renovador_token=self.renovador_token)
                 response.raise_for_status()
                 guardar_respuesta_completa(response, self.fich_respuesta, "cliente", self.config, self.usuario, api_url, "POST", self.tiempo_inicio)
 
@@ -50,7 +52,7 @@ class DsEnvioSaltraCliente:
                 'Accept': 'application/json',
                 'Authorization': f'Bearer {self.token}'
             }
-            response = requests.delete(api_url, headers=headers)
+            response = obtener_transporte().delete(api_url, headers=headers, renovador_token=self.renovador_token)
             response.raise_for_status()
             guardar_respuesta_completa(response, self.fich_respuesta, "cliente", self.config, self.usuario, api_url, "DELETE", self.tiempo_inicio)
         except Exception as e:
@@ -65,7 +67,7 @@ class DsEnvioSaltraCliente:
                 'Authorization': f'Bearer {self.token}'
             }
 
-            response = requests.get(api_url, headers=headers)
+            response = obtener_transporte().get(api_url, headers=headers, renovador_token=self.renovador_token)
             response.raise_for_status()
             guardar_respuesta_completa(response, self.fich_respuesta, "cliente", self.config, self.usuario, api_url, "GET", self.tiempo_inicio)
 
@@ -92,7 +94,7 @@ class DsEnvioSaltraCliente:
                     'Authorization': f'Bearer {self.token}'
                 }
 
-                response = requests.put(api_url, headers=headers, json=datos_originales)
+                response = obtener_transporte().put(api_url, headers=headers, json=datos_originales, renovador_token=self.renovador_token)
                 response.raise_for_status()
                 guardar_respuesta_completa(response, self.fich_respuesta, "cliente", self.config, self.usuario, api_url, "PUT", self.tiempo_inicio)
 
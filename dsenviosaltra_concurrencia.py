@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Control adaptativo (AIMD) del número de peticiones simultáneas a cada backend de API SALTRA
+(seg-social y sepe).
+
+Cada backend tiene un límite de peticiones en curso que el transporte compartido respeta en todos
+los hilos (lotes de contratos, modo lote, asíncrono y demonio). Mientras el p95 de la latencia
+y la proporción de 5xx/429 de las últimas respuestas se mantienen sanos el límite sube de forma
+aditiva (unos +1 por cada 'límite' respuestas correctas); cuando empeoran baja de forma
+multiplicativa. Tras una bajada no se vuelve a bajar por respuestas de peticiones que salieron
+antes de ella, para no hundir el límite por una sola ráfaga de errores.
+"""
+import time
+import threading
+from collections import deque
+from dsenviosaltra_limites import familia_endpoint
+
+# Respuestas que indican que el backend está saturado
+ESTADOS_SOBRECARGA = frozenset({429, 500, 502, 503, 504})
+MUESTRAS_VENTANA = 50
+MIN_MUESTRAS = 10
+MAX_TASA_ERRORES = 0.05
+FACTOR_DESCENSO = 0.5
+# (límite inicial, mínimo, máximo, p95 de latencia objetivo en segundos) de cada backend
+BACKENDS_CONCURRENCIA = {
+    "seg-social": (4, 1, 16, 5.0),
+    "sepe": (4, 1, 16, 8.0),
+}
+
+def percentil(valores, proporcion: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(proporcion * len(ordenados)))]
+
+class ControlConcurrencia:
+    def __init__(self, nombre: str, inicial: int, minimo: int, maximo: int, latencia_objetivo: float):
+        self.nombre = nombre
+        self.minimo = minimo
+        self.maximo = maximo
+        self.latencia_objetivo = latencia_objetivo
+        self.limite = float(inicial)
+        self.en_curso = 0
+        self.ultimo_descenso = 0.0
+        self._latencias = deque(maxlen=MUESTRAS_VENTANA)
+        self._errores = deque(maxlen=MUESTRAS_VENTANA)
+        self._condicion = threading.Condition()
+
+    def adquirir(self) -> float:
+        """Espera a que haya hueco bajo el límite actual; devuelve el instante de salida de la petición"""
+        with self._condicion:
+            while self.en_curso >= int(self.limite):
+                self._condicion.wait()
+            self.en_curso += 1
+            return time.monotonic()
+
+    def liberar(self, inicio: float, estado=None):
+        """Registra la respuesta (estado None: error de conexión) y ajusta el límite"""
+        ahora = time.monotonic()
+        latencia = ahora - inicio
+        error = estado is None or estado in ESTADOS_SOBRECARGA
+        with self._condicion:
+            self.en_curso -= 1
+            self._latencias.append(latencia)
+            self._errores.append(error)
+            if self._sobrecargado(estado, error):
+                # Las peticiones que salieron antes de la última bajada ya no cuentan
+                if inicio >= self.ultimo_descenso:
+                    self._bajar(ahora)
+            elif not error and latencia <= self.latencia_objetivo:
+                self.limite = min(float(self.maximo), self.limite + 1 / self.limite)
+            self._condicion.notify_all()
+
+    def _sobrecargado(self, estado, error: bool) -> bool:
+        if estado == 429:
+            return True
+        if len(self._latencias) < MIN_MUESTRAS:
+            return False
+        if error and sum(self._errores) / len(self._errores) > MAX_TASA_ERRORES:
+            return True
+        return percentil(self._latencias, 0.95) > self.latencia_objetivo
+
+    def _bajar(self, ahora: float):
+        anterior = int(self.limite)
+        self.limite = max(float(self.minimo), self.limite * FACTOR_DESCENSO)
+        self.ultimo_descenso = ahora
+        self._latencias.clear()
+        self._errores.clear()
+        if int(self.limite) != anterior:
+            print(f"Concurrencia con {self.nombre} reducida de {anterior} a {int(self.limite)} peticiones simultáneas")
+
+controles_concurrencia = {nombre: ControlConcurrencia(nombre, *parametros) for nombre, parametros in BACKENDS_CONCURRENCIA.items()}
+
+def control_concurrencia(url: str):
+    """Control del backend al que va la URL, o None si ese backend no se controla"""
+    return controles_concurrencia.get(familia_endpoint(url))
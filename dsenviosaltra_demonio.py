@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Demonio residente para API SALTRA: vigila un directorio spool y ejecuta los guiones
+que van llegando dentro de un único proceso, reutilizando el token de sesión.
+Uso: python dsenviosaltra_demonio.py dsClave usuarioPK:idUsuario passw directorio_spool code_respuesta [intervalo] [metricas.json]
+
+El ERP debe dejar cada guion en el spool ya completo (escribir con otro nombre y
+renombrar a *.txt). Cada guion se reclama moviéndolo a 'procesando/' y, al terminar,
+se archiva en 'procesados/' o 'erroneos/'. Los ficheros de salida (fiche-out, .txt,
+.fin, .tiempos.json) son los mismos que genera dsenviosaltra.py; con 'metricas.json' los
+tiempos por fase de todos los guiones se acumulan además en ese fichero.
+"""
+import os
+import sys
+import time
+import signal
+from pathlib import Path
+from dsenviosaltra import procesar_guion
+from dsenviosaltra_circuito import cola_offline, guiones_recuperables
+from dsenviosaltra_tiempos import configurar_metricas
+
+INTERVALO_SONDEO = 0.5
+RENOVAR_TOKEN_CADA = 1800
+
+class DsEnvioSaltraDemonio:
+    def __init__(self, dsClave, usuario, idUsuario, passw, directorio_spool: str, code_respuesta, intervalo=INTERVALO_SONDEO):
+        self.dsClave = dsClave
+        self.usuario = usuario
+        self.idUsuario = idUsuario
+        self.passw = passw
+        self.code_respuesta = code_respuesta
+        self.intervalo = intervalo
+
+        self.spool = Path(directorio_spool)
+        self.dir_procesando = self.spool / "procesando"
+        self.dir_procesados = self.spool / "procesados"
+        self.dir_erroneos = self.spool / "erroneos"
+        for directorio in (self.spool, self.dir_procesando, self.dir_procesados, self.dir_erroneos):
+            directorio.mkdir(parents=True, exist_ok=True)
+
+        self.token = None
+        self.token_obtenido = 0
+        self.activo = False
+
+    def detener(self, *args):
+        self.activo = False
+
+    def guiones_pendientes(self):
+        """Devuelve los guiones del spool por orden de llegada"""
+        pendientes = []
+        with os.scandir(self.spool) as entradas:
+            for entrada in entradas:
+                if entrada.is_file() and entrada.name.lower().endswith('.txt'):
+                    pendientes.append((entrada.stat().st_mtime, entrada.name))
+        return [self.spool / nombre for _, nombre in sorted(pendientes)]
+
+    def reclamar(self, guion: Path):
+        """Mueve el guion a 'procesando/'; si otro proceso lo ha reclamado devuelve None"""
+        destino = self.dir_procesando / guion.name
+        try:
+            os.replace(guion, destino)
+        except FileNotFoundError:
+            return None
+        return destino
+
+    def recuperar_encolados(self):
+        """Devuelve al spool los guiones de la cola offline cuyo backend ya responde (o uno de prueba)"""
+        for guion in guiones_recuperables():
+            if cola_offline.reclamar(guion, str(self.spool)):
+                print(f"Guion encolado devuelto al spool: {os.path.basename(guion)}")
+
+    def procesar(self, guion: Path) -> int:
+        start_time = time.time()
+
+        if self.token and start_time - self.token_obtenido > RENOVAR_TOKEN_CADA:
+            self.token = None
+
+        codigo, client = procesar_guion(self.dsClave, self.usuario, self.idUsuario, self.passw, str(guion), self.code_respuesta, token=self.token)
+        # El cliente puede haber hecho login o renovado el token tras un 401
+        if client and client.token and client.token != self.token:
+            self.token = client.token
+            self.token_obtenido = start_time
+
+        destino = self.dir_procesados if codigo == 0 else self.dir_erroneos
+        os.replace(guion, destino / guion.name)
+        print(f"Guion {guion.name} procesado en {round(time.time() - start_time, 3)} segundos (código {codigo})")
+        return codigo
+
+    def ejecutar(self):
+        self.activo = True
+        signal.signal(signal.SIGTERM, self.detener)
+        signal.signal(signal.SIGINT, self.detener)
+        print(f"Demonio vigilando {self.spool}")
+
+        while self.activo:
+            self.recuperar_encolados()
+            pendientes = self.guiones_pendientes()
+            for guion in pendientes:
+                if not self.activo:
+                    break
+                reclamado = self.reclamar(guion)
+                if reclamado:
+                    self.procesar(reclamado)
+            if not pendientes:
+                time.sleep(self.intervalo)
+
+        print("Demonio detenido")
+
+def main():
+    dsClave = sys.argv[1]
+    partesArgs = sys.argv[2].split("PK:")
+    usuario = partesArgs[0]
+    idUsuario = partesArgs[1]
+    passw = sys.argv[3]
+    directorio_spool = sys.argv[4]
+    code_respuesta = sys.argv[5]
+    intervalo = float(sys.argv[6]) if len(sys.argv) > 6 else INTERVALO_SONDEO
+    configurar_metricas(sys.argv[7] if len(sys.argv) > 7 else None)
+
+    demonio = DsEnvioSaltraDemonio(dsClave, usuario, idUsuario, passw, directorio_spool, code_respuesta, intervalo)
+    demonio.ejecutar()
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Registro local (SQLite) de los envíos aceptados por API SALTRA: contratos, llamamientos,
+prórrogas, transformaciones y altas/bajas en Seguridad Social.
+
+Cada envío aceptado se guarda con la huella de su contenido (endpoint + certificado + payload
+sin 'test' ni 'duplicate'), el id devuelto por SEPE/TGSS, el 'fiche-out' del guion que lo
+envió y la respuesta sin PDFs. Antes de enviar se busca la huella: si ya está, el envío no se
+repite (p.ej. tras un reintento o un doble clic en el ERP) y se responde desde el registro.
+"""
+import io
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import requests
+from dsenviosaltra_pdf import es_referencia_pdf, PREFIJO_PDF_BASE64
+
+RUTA_REGISTRO_ENVIOS = os.path.join(os.path.expanduser("~"), ".cache", "dsenviosaltra", "envios.sqlite")
+# Endpoints (final de la URL) cuyos envíos POST se registran y no se repiten
+ENDPOINTS_REGISTRO_ENVIOS = ("/contrata", "/llamamientos", "/prorroga", "/transformation", "/seg-social/alta", "/seg-social/baja")
+METODOS_REGISTRO_ENVIOS = ("POST",)
+# Campos del payload que no cambian el contenido del envío
+CAMPOS_FUERA_DE_HUELLA = ("test", "duplicate")
+# Valores de la sección [reenviar] del guion que fuerzan el envío aunque ya conste como aceptado
+VALORES_REENVIAR = ("si", "sí", "1", "true")
+
+def endpoint_con_registro(endpoint: str, metodo: str) -> bool:
+    return bool(endpoint) and (metodo or "").upper() in METODOS_REGISTRO_ENVIOS and \
+        endpoint.rstrip("/").endswith(ENDPOINTS_REGISTRO_ENVIOS)
+
+def clave_envio(endpoint: str, certificado, payload) -> str:
+    """Huella del contenido del envío: el orden de los campos y los espacios del certificado no la cambian"""
+    if isinstance(payload, dict):
+        payload = {campo: valor for campo, valor in payload.items() if campo not in CAMPOS_FUERA_DE_HUELLA}
+    contenido = json.dumps([endpoint.rstrip("/"), (certificado or "").strip(), payload],
+                           sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+def sin_pdfs(valor):
+    """Copia de la respuesta sin el contenido de los PDFs (ni base64 ni referencias a temporales)"""
+    if es_referencia_pdf(valor):
+        return None
+    if isinstance(valor, dict):
+        return {clave: None if clave == "content" and isinstance(contenido, str) and contenido.startswith(PREFIJO_PDF_BASE64)
+                else sin_pdfs(contenido) for clave, contenido in valor.items()}
+    if isinstance(valor, list):
+        return [sin_pdfs(elemento) for elemento in valor]
+    return valor
+
+def respuesta_http(respuesta: dict) -> requests.Response:
+    """requests.Response con el JSON indicado, para los caminos que leen la respuesta HTTP"""
+    response = requests.Response()
+    response.status_code = respuesta.get("status", 200) if isinstance(respuesta.get("status"), int) else 200
+    response.headers["content-type"] = "application/json"
+    response.encoding = "utf-8"
+    response.raw = io.BytesIO(json.dumps(respuesta, ensure_ascii=False).encode("utf-8"))
+    return response
+
+class RegistroEnvios:
+    def __init__(self, ruta: str = None):
+        self._ruta = ruta
+        self._conexiones = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ruta(self):
+        return self._ruta or RUTA_REGISTRO_ENVIOS
+
+    def _conexion(self) -> sqlite3.Connection:
+        clave = (self.ruta, os.getpid())
+        conexion = self._conexiones.get(clave)
+        if conexion is None:
+            with self._lock:
+                conexion = self._conexiones.get(clave)
+                if conexion is None:
+                    os.makedirs(os.path.dirname(self.ruta), mode=0o700, exist_ok=True)
+                    conexion = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False, isolation_level=None)
+                    conexion.execute("PRAGMA journal_mode=WAL")
+                    conexion.execute("""CREATE TABLE IF NOT EXISTS envios (
+                        clave TEXT PRIMARY KEY,
+                        endpoint TEXT NOT NULL,
+                        id_envio TEXT,
+                        fich_respuesta TEXT,
+                        respuesta TEXT NOT NULL,
+                        fecha REAL NOT NULL
+                    ) WITHOUT ROWID""")
+                    self._conexiones[clave] = conexion
+        return conexion
+
+    def buscar(self, clave: str):
+        """Devuelve el envío aceptado con esta huella ({'endpoint', 'id_envio', 'fich_respuesta', 'respuesta', 'fecha'}) o None"""
+        try:
+            fila = self._conexion().execute(
+                "SELECT endpoint, id_envio, fich_respuesta, respuesta, fecha FROM envios WHERE clave = ?", (clave,)
+            ).fetchone()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error leyendo el registro de envíos: {e}")
+            return None
+        if fila is None:
+            return None
+        return {"endpoint": fila[0], "id_envio": fila[1], "fich_respuesta": fila[2], "respuesta": json.loads(fila[3]), "fecha": fila[4]}
+
+    def registrar(self, clave: str, endpoint: str, respuesta: dict, fich_respuesta: str):
+        """Guarda un envío aceptado; la respuesta se guarda sin PDFs"""
+        data = respuesta.get("data") if isinstance(respuesta, dict) else None
+        id_envio = data.get("id") if isinstance(data, dict) else None
+        try:
+            with self._lock:
+                self._conexion().execute(
+                    "INSERT OR REPLACE INTO envios VALUES (?, ?, ?, ?, ?, ?)",
+                    (clave, endpoint, None if id_envio is None else str(id_envio), fich_respuesta,
+                     json.dumps(sin_pdfs(respuesta), ensure_ascii=False), time.time())
+                )
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error guardando el registro de envíos: {e}")
+
+def respuesta_repetida(entrada: dict) -> dict:
+    """Respuesta con la que se contesta un envío ya aceptado: la original, indicando cuándo y dónde se envió"""
+    respuesta = dict(entrada["respuesta"])
+    fecha = time.strftime("%d/%m/%Y %H:%M:%S", time.localtime(entrada["fecha"]))
+    respuesta["message"] = f"Envío ya aceptado el {fecha} (resultado en {entrada['fich_respuesta']}); no se ha vuelto a enviar"
+    return respuesta
+
+registro_envios = RegistroEnvios()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Formatos TXT de las respuestas de la API SALTRA (bloque 'Extra' de las operaciones SS/SEPE,
+certificados y clientes).
+
+Cada formato se declara como una plantilla (texto con {campos} y campo -> ruta, valor por
+defecto, conversión, igual que las tablas de dsenviosaltra_xml) o como una tabla de filas
+clave : valor, y se compila una sola vez al importar el módulo. El formato de cada respuesta
+se elige buscando en diccionarios por método, parámetro o final del endpoint, de modo que
+añadir un endpoint es añadir una entrada a una tabla.
+"""
+from datetime import datetime
+
+SANGRIA_TABLA = " " * 10
+SANGRIA_FILA = " " * 12
+SANGRIA_CAMPO = " " * 16
+
+def convertir_formato_fecha(fecha_str: str,  formato_out='%d/%m/%Y %H:%M:%S') -> str:
+    if not fecha_str:
+        return None
+    try:
+        fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d')
+        return fecha_obj.strftime(formato_out)
+    except (ValueError, TypeError):
+        return f"Advertencia: No se pudo convertir la fecha '{fecha_str}'"
+
+def compilar_ruta(ruta: str):
+    """Convierte 'profile/account/0/alias' en una función que recorre el JSON (None si falta algún paso)"""
+    pasos = tuple(int(paso) if paso.isdigit() else paso for paso in ruta.split('/'))
+
+    def obtener(datos):
+        for paso in pasos:
+            if isinstance(paso, int):
+                datos = datos[paso] if isinstance(datos, list) and len(datos) > paso else None
+            else:
+                datos = datos.get(paso) if isinstance(datos, dict) else None
+            if datos is None:
+                return None
+        return datos
+    return obtener
+
+def _filas(datos: dict, sangria: str) -> str:
+    return "".join(f"\n{sangria}{clave} : {valor}" for clave, valor in datos.items())
+
+class Plantilla:
+    """
+    Bloque de texto con campos sacados del JSON. 'campos' es {nombre: (ruta, defecto, conversion)};
+    si el valor no existe o es null se usa el defecto. Con 'lista' la plantilla se repite para
+    cada elemento de esa ruta.
+    """
+    def __init__(self, texto: str, campos=None, lista: str = None):
+        self.formato = texto.format_map
+        self.campos = [(nombre, compilar_ruta(ruta), defecto, conversion)
+                       for nombre, (ruta, defecto, conversion) in (campos or {}).items()]
+        self.lista = compilar_ruta(lista) if lista else None
+
+    def _texto(self, datos) -> str:
+        valores = {}
+        for nombre, obtener, defecto, conversion in self.campos:
+            valor = obtener(datos)
+            if valor is None:
+                valor = defecto
+            valores[nombre] = conversion(valor) if conversion else valor
+        return self.formato(valores)
+
+    def escribir(self, salida, datos):
+        if self.lista is None:
+            salida.write(self._texto(datos))
+            return
+        for elemento in self.lista(datos) or ():
+            salida.write(self._texto(elemento))
+
+class Tablas:
+    """Una 'Tabla' por elemento de la lista (toda 'data' o la de la clave indicada) con sus filas clave : valor"""
+    def __init__(self, clave: str = None):
+        self.clave = clave
+
+    def escribir(self, salida, data):
+        for registro in (data if self.clave is None else data.get(self.clave)):
+            salida.write(f"\n{SANGRIA_TABLA}Tabla" + _filas(registro, SANGRIA_FILA))
+
+class Seccion:
+    """Una sola 'Tabla' con las filas del diccionario 'clave' de data (o de data entera si no hay clave)"""
+    def __init__(self, clave: str = None):
+        self.clave = clave
+        self.vacia = f"\n{SANGRIA_CAMPO}{clave} : Ninguna"
+
+    def escribir(self, salida, data):
+        salida.write(f"\n{SANGRIA_TABLA}Tabla")
+        if self.clave is None:
+            salida.write(_filas(data, SANGRIA_CAMPO))
+        elif self.clave in data:
+            seccion = data.get(self.clave)
+            salida.write(_filas(seccion, SANGRIA_CAMPO) if seccion else self.vacia)
+
+class Mensaje:
+    """'Mensaje <id>' seguido de las filas de data; los diccionarios de 'desplegar' se escriben campo a campo"""
+    def __init__(self, desplegar=()):
+        self.desplegar = frozenset(desplegar)
+
+    def escribir(self, salida, data):
+        salida.write(f"\n{SANGRIA_TABLA}Mensaje {data.get('id')}")
+        for clave, valor in data.items():
+            if clave in self.desplegar:
+                salida.write(_filas(valor, SANGRIA_CAMPO))
+            else:
+                salida.write(f"\n{SANGRIA_CAMPO}{clave} : {valor}")
+
+# Bloque 'Extra' de json_to_txt. Prioridad: data lista, claves con tablas, parámetro, endpoint y diccionario simple
+FORMATO_DATOS_LISTA = Tablas()
+FORMATO_DATOS_DICCIONARIO = Seccion()
+FORMATOS_DATOS_TABLAS = {
+    "employees": Tablas("employees"),
+    "list": Tablas("list"),
+    "details": Tablas("details"),
+}
+# Claves cuya tabla solo se usa si el valor es una lista
+CLAVES_SOLO_LISTA = frozenset({"details"})
+FORMATOS_DATOS_PARAMETRO = {
+    "018": Seccion("grupoCotizacion"),
+    "019": Seccion("ocupacion"),
+    "021": Seccion("categoriaProfesional"),
+}
+FORMATOS_DATOS_ENDPOINT = {
+    "/enterprise-data": Mensaje(desplegar=("domicilio",)),
+}
+
+def formato_datos(data, parametro: str, endpoint: str):
+    """Devuelve el formato del bloque 'Extra' para el 'data' de una respuesta"""
+    if isinstance(data, list):
+        return FORMATO_DATOS_LISTA
+    # Si hay varias claves con tabla gana la primera de FORMATOS_DATOS_TABLAS
+    for clave, formato in FORMATOS_DATOS_TABLAS.items():
+        if clave in data and (clave not in CLAVES_SOLO_LISTA or isinstance(data[clave], list)):
+            return formato
+
+    formato = FORMATOS_DATOS_PARAMETRO.get(parametro)
+    if formato is not None:
+        return formato
+    if endpoint and "/" in endpoint:
+        formato = FORMATOS_DATOS_ENDPOINT.get(endpoint[endpoint.rfind("/"):])
+        if formato is not None:
+            return formato
+    return FORMATO_DATOS_DICCIONARIO
+
+def _texto_o_vacio(campos):
+    return {nombre: (ruta, "", None) for nombre, ruta in campos.items()}
+
+_TEXTO_CLIENTE = """
+  pk : {pk}
+  email: {email}
+  nombre: {nombre}
+  active: {activo}
+  dni: {dni}
+  razon_social: {razon_social}
+  alias: {alias}
+  regimen: {regimen}
+  cuenta: {cuenta}\n"""
+_CAMPOS_CLIENTE = _texto_o_vacio({
+    "pk": "id",
+    "email": "access/email",
+    "nombre": "name",
+    "activo": "active",
+    "dni": "profile/dni",
+    "razon_social": "profile/razon_social",
+    "alias": "profile/account/0/alias",
+    "regimen": "profile/account/0/regimen",
+    "cuenta": "profile/account/0/cuenta",
+})
+
+# Cuerpo del TXT de las acciones de cliente y certificado por método (None: solo cabecera)
+FORMATOS_CLIENTE = {
+    "POST": Plantilla(_TEXTO_CLIENTE, {nombre: ("data/" + ruta, defecto, conversion)
+                                       for nombre, (ruta, defecto, conversion) in _CAMPOS_CLIENTE.items()}),
+    "GET": Plantilla(_TEXTO_CLIENTE, _CAMPOS_CLIENTE, lista="data/data"),
+    "DELETE": Plantilla("""
+  pk : {pk}
+  email: {email}
+  nombre: {nombre}\n""", _texto_o_vacio({"pk": "data/id", "email": "data/access/email", "nombre": "data/name"})),
+    "PUT": Plantilla("""
+  mensaje : {mensaje}\n""", _texto_o_vacio({"mensaje": "message"})),
+}
+
+FORMATOS_CERTIFICADO = {
+    "POST": Plantilla("""
+  cert_secret : {cert_secret}\n""", _texto_o_vacio({"cert_secret": "data/cert_secret"})),
+    "GET": Plantilla("""
+  pk : {pk}
+  numero_serie: {pk}
+  id_certificado: {pk}
+  inicio_validez: {desde}
+  fin_validez: {hasta}
+  nombre_certificado: {nombre_cert}
+  gn: {nombre}
+  sn: {apellidos}
+  nombre_completo: {nombre_completo}
+  dni: {dni}
+  type: {tipo}
+  active: {activo}
+  issuer: {issuer_cn}\n""", {
+        **_texto_o_vacio({
+            "pk": "cert_secret",
+            "nombre_cert": "typeText",
+            "nombre": "gn",
+            "apellidos": "sn",
+            "nombre_completo": "fullName",
+            "dni": "dni",
+            "tipo": "type",
+            "activo": "active",
+            "issuer_cn": "issuer_cn",
+        }),
+        "desde": ("desde", "", convertir_formato_fecha),
+        "hasta": ("expired", "", convertir_formato_fecha),
+    }, lista="data/data"),
+    "DELETE": None,
+}
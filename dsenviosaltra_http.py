@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Transporte HTTP compartido para API SALTRA.
+Todas las llamadas (login, SS/SEPE, copia básica, certificados y clientes) usan una
+única sesión con pool de conexiones keep-alive, de modo que un lote de contratos
+reutiliza unas pocas conexiones TLS en lugar de abrir una por petición. Los errores
+transitorios se reintentan según las políticas de dsenviosaltra_reintentos, el ritmo de
+peticiones lo limita dsenviosaltra_limites y las peticiones simultáneas a cada backend,
+dsenviosaltra_concurrencia. Con un backend caído sus peticiones fallan al momento
+(dsenviosaltra_circuito). Cada intento queda medido en los tiempos del guion (dsenviosaltra_tiempos).
+"""
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import NewConnectionError
+from dsenviosaltra_limites import obtener_limitador
+from dsenviosaltra_tiempos import fase
+from dsenviosaltra_concurrencia import control_concurrencia
+from dsenviosaltra_circuito import circuito_endpoint, CircuitoAbierto, ESTADOS_FALLO
+from dsenviosaltra_reintentos import (politica_endpoint, se_puede_repetir, espera_retry_after, presupuesto_reintentos,
+                                      ESTADOS_REINTENTABLES, ESTADOS_NO_PROCESADOS, MAX_ESPERA_RETRY_AFTER)
+
+TAMANO_POOL = 10
+TIMEOUT_CONEXION = 10
+TIMEOUT_LECTURA = 180
+
+def _sin_enviar(error) -> bool:
+    """Indica si el error se produjo antes de que la petición llegara al servidor"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    motivo = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(motivo, NewConnectionError)
+
+def _al_terminar_cuerpo(response, funcion):
+    """Llama a 'funcion' una sola vez, cuando se termina de leer el cuerpo de la respuesta o se cierra"""
+    pendiente = [True]
+    lock = threading.Lock()
+
+    def terminar():
+        with lock:
+            if not pendiente[0]:
+                return
+            pendiente[0] = False
+        funcion()
+
+    cerrar, iterar = response.close, response.iter_content
+
+    def close():
+        try:
+            cerrar()
+        finally:
+            terminar()
+
+    def iter_content(*args, **kwargs):
+        # .content, .text y .json() también leen el cuerpo con iter_content
+        try:
+            yield from iterar(*args, **kwargs)
+        finally:
+            terminar()
+
+    response.close = close
+    response.iter_content = iter_content
+
+class TransporteSaltra:
+    def __init__(self, tamano_pool=TAMANO_POOL, timeout_conexion=TIMEOUT_CONEXION, timeout_lectura=TIMEOUT_LECTURA):
+        self.timeout = (timeout_conexion, timeout_lectura)
+
+        # Sin reintentos en urllib3: todos los intentos pasan por request(), y así por el presupuesto
+        # de reintentos, el circuito del backend y el control de concurrencia
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=tamano_pool, max_retries=Retry(0, read=False))
+
+        self.sesion = requests.Session()
+        self.sesion.mount("https://", adaptador)
+        self.sesion.mount("http://", adaptador)
+
+    def request(self, method, url, **kwargs):
+        """
+        Envía la petición reintentando los errores transitorios según la política del endpoint
+        (dsenviosaltra_reintentos). Un POST de envío solo se repite si no ha llegado al servidor o si
+        este indica con 429/503 y Retry-After que no lo ha procesado. Con 'renovador_token' (la función
+        del cliente que, dado un token rechazado con 401, devuelve uno nuevo) un 401 se repite con el token renovado.
+        """
+        renovador_token = kwargs.pop("renovador_token", None)
+        kwargs.setdefault("timeout", self.timeout)
+        politica = politica_endpoint(url)
+        repetible = se_puede_repetir(method, politica)
+        presupuesto_reintentos.registrar_peticion()
+
+        intento = 0
+        while True:
+            try:
+                response = self._enviar(method, url, kwargs, renovador_token)
+            except CircuitoAbierto:
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not (repetible or _sin_enviar(e)) or intento >= politica.reintentos or not presupuesto_reintentos.consumir():
+                    raise
+                intento += 1
+                espera = politica.espera(intento)
+                print(f"Error de conexión con {url} ({e}); reintento {intento} de {politica.reintentos} en {espera:.1f} s")
+                time.sleep(espera)
+                continue
+
+            if response.status_code not in ESTADOS_REINTENTABLES or intento >= politica.reintentos:
+                return response
+            espera = espera_retry_after(response.headers.get("Retry-After"))
+            # Un envío solo se repite si el servidor dice expresamente que no lo ha procesado
+            if not repetible and (response.status_code not in ESTADOS_NO_PROCESADOS or espera is None):
+                return response
+            if espera is None:
+                espera = politica.espera(intento + 1)
+            elif espera > MAX_ESPERA_RETRY_AFTER:
+                return response
+            if not presupuesto_reintentos.consumir():
+                return response
+
+            intento += 1
+            # Con stream=True la respuesta descartada aún ocupa la conexión
+            response.close()
+            print(f"HTTP {response.status_code} de {url}; reintento {intento} de {politica.reintentos} en {espera:.1f} s")
+            time.sleep(espera)
+
+    def _peticion(self, method, url, kwargs):
+        # Con el backend caído la petición falla al momento, sin esperar turno ni abrir conexión
+        circuito = circuito_endpoint(url)
+        if circuito is not None and not circuito.permitir():
+            raise CircuitoAbierto(f"Servicio {circuito.nombre} no disponible (circuito abierto): petición no enviada")
+
+        with fase("http", metodo=method, url=url, estado=None) as detalle:
+            # Cada intento (también los reintentos y la repetición tras 401) pasa por el limitador
+            obtener_limitador().esperar(url, kwargs.get("headers"))
+            # y ocupa uno de los huecos del backend mientras espera la respuesta
+            control = control_concurrencia(url)
+            inicio = control.adquirir() if control is not None else None
+            liberar = control is not None
+            estado = None
+            try:
+                response = self.sesion.request(method, url, **kwargs)
+                estado = detalle["estado"] = response.status_code
+                if liberar and kwargs.get("stream"):
+                    # Con stream=True el cuerpo aún está por llegar: el hueco y la latencia se cierran al leerlo o cerrarlo
+                    _al_terminar_cuerpo(response, lambda: control.liberar(inicio, estado))
+                    liberar = False
+                return response
+            finally:
+                if liberar:
+                    control.liberar(inicio, estado)
+                if circuito is not None:
+                    circuito.registrar(estado is not None and estado not in ESTADOS_FALLO)
+
+    def _enviar(self, method, url, kwargs, renovador_token):
+        response = self._peticion(method, url, kwargs)
+
+        # Token caducado o revocado: se vuelve a autenticar una sola vez y se repite la petición
+        if response.status_code == 401 and renovador_token is not None:
+            headers = kwargs.get("headers") or {}
+            autorizacion = headers.get("Authorization", "")
+            if autorizacion.startswith("Bearer "):
+                token_nuevo = renovador_token(autorizacion[len("Bearer "):])
+                if token_nuevo:
+                    # Con stream=True la respuesta rechazada aún ocupa la conexión
+                    response.close()
+                    kwargs["headers"] = {**headers, "Authorization": f"Bearer {token_nuevo}"}
+                    response = self._peticion(method, url, kwargs)
+
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def cerrar(self):
+        self.sesion.close()
+
+_transporte = None
+_lock_transporte = threading.Lock()
+
+def obtener_transporte() -> TransporteSaltra:
+    """Devuelve el transporte compartido del proceso, creándolo la primera vez"""
+    global _transporte
+    if _transporte is None:
+        with _lock_transporte:
+            if _transporte is None:
+                _transporte = TransporteSaltra()
+    return _transporte
+
+def configurar_transporte(**kwargs) -> TransporteSaltra:
+    """Sustituye el transporte compartido por uno con otra configuración de pool/timeouts/reintentos"""
+    global _transporte
+    with _lock_transporte:
+        if _transporte is not None:
+            _transporte.cerrar()
+        _transporte = TransporteSaltra(**kwargs)
+    return _transporte
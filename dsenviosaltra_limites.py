@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Limitación del ritmo de peticiones a API SALTRA en el propio cliente (cubos de tokens).
+
+Hay un cubo por familia de endpoints (seg-social, sepe, certificate, customer) y otro por
+certificado (cabecera X-Cert-Secret). Antes de cada petición el transporte compartido reserva
+un token de los cubos que le corresponden y, si no quedan, espera lo justo para no pasar del
+ritmo sostenido: así los hilos de un lote o del modo demonio no provocan ráfagas de 429.
+
+Los ritmos se pueden cambiar con configurar_limitador() o con el fichero RUTA_LIMITES:
+{"familias": {"sepe": [tokens por segundo, ráfaga], ...}, "certificado": [tokens por segundo, ráfaga]}
+Un ritmo 0 o null deja esa familia sin límite.
+"""
+import os
+import json
+import time
+import threading
+
+RUTA_LIMITES = os.path.join(os.path.expanduser("~"), ".config", "dsenviosaltra", "limites.json")
+CABECERA_CERTIFICADO = "X-Cert-Secret"
+# Tramo de la URL -> familia de endpoints (la primera que aparezca)
+FAMILIAS_ENDPOINT = (
+    ("/seg-social/", "seg-social"),
+    ("/sepe/", "sepe"),
+    ("/certificate", "certificate"),
+    ("/customer", "customer"),
+)
+# (tokens por segundo, ráfaga) de cada familia y de cada certificado
+LIMITES_FAMILIA = {
+    "seg-social": (5.0, 10),
+    "sepe": (5.0, 10),
+    "certificate": (2.0, 5),
+    "customer": (2.0, 5),
+}
+LIMITE_CERTIFICADO = (8.0, 16)
+
+def familia_endpoint(url: str):
+    for tramo, familia in FAMILIAS_ENDPOINT:
+        if tramo in (url or ""):
+            return familia
+    return None
+
+class CuboTokens:
+    """Cubo de tokens con reservas: si no hay token, la petición reserva el siguiente y espera a que llegue"""
+    def __init__(self, tasa: float, rafaga: int):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.tokens = float(rafaga)
+        self.ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self) -> float:
+        """Gasta un token y devuelve los segundos que hay que esperar hasta que esté disponible"""
+        with self._lock:
+            ahora = time.monotonic()
+            self.tokens = min(self.rafaga, self.tokens + (ahora - self.ultimo) * self.tasa)
+            self.ultimo = ahora
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.tasa
+
+class LimitadorPeticiones:
+    def __init__(self, limites_familia=None, limite_certificado=LIMITE_CERTIFICADO):
+        self.limites_familia = LIMITES_FAMILIA if limites_familia is None else limites_familia
+        self.limite_certificado = limite_certificado
+        self._cubos = {}
+        self._lock = threading.Lock()
+
+    def _cubo(self, clave, limite):
+        if not limite or not limite[0]:
+            return None
+        cubo = self._cubos.get(clave)
+        if cubo is None:
+            with self._lock:
+                cubo = self._cubos.setdefault(clave, CuboTokens(*limite))
+        return cubo
+
+    def esperar(self, url: str, headers=None) -> float:
+        """Reserva los tokens de la petición y espera lo necesario; devuelve los segundos esperados"""
+        cubos = []
+        familia = familia_endpoint(url)
+        if familia is not None:
+            cubos.append(self._cubo(("familia", familia), self.limites_familia.get(familia)))
+        certificado = (headers or {}).get(CABECERA_CERTIFICADO)
+        if certificado:
+            cubos.append(self._cubo(("certificado", certificado.strip()), self.limite_certificado))
+
+        espera = max([cubo.reservar() for cubo in cubos if cubo is not None], default=0.0)
+        if espera > 0:
+            time.sleep(espera)
+        return espera
+
+def leer_limites(ruta: str):
+    """Devuelve (limites_familia, limite_certificado) del fichero de configuración, o los de por defecto"""
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            configuracion = json.load(f)
+    except FileNotFoundError:
+        return LIMITES_FAMILIA, LIMITE_CERTIFICADO
+    except (OSError, ValueError) as e:
+        print(f"Error leyendo los límites de peticiones de {ruta}: {e}")
+        return LIMITES_FAMILIA, LIMITE_CERTIFICADO
+
+    limites_familia = {**LIMITES_FAMILIA, **{familia: tuple(limite) if limite else None
+                                            for familia, limite in configuracion.get("familias", {}).items()}}
+    limite_certificado = configuracion.get("certificado", LIMITE_CERTIFICADO)
+    return limites_familia, tuple(limite_certificado) if limite_certificado else None
+
+_limitador = None
+_lock_limitador = threading.Lock()
+
+def obtener_limitador() -> LimitadorPeticiones:
+    """Devuelve el limitador compartido por todos los hilos del proceso, creándolo la primera vez"""
+    global _limitador
+    if _limitador is None:
+        with _lock_limitador:
+            if _limitador is None:
+                _limitador = LimitadorPeticiones(*leer_limites(RUTA_LIMITES))
+    return _limitador
+
+def configurar_limitador(limites_familia=None, limite_certificado=LIMITE_CERTIFICADO) -> LimitadorPeticiones:
+    """Sustituye el limitador compartido por uno con otros ritmos"""
+    global _limitador
+    with _lock_limitador:
+        _limitador = LimitadorPeticiones(limites_familia, limite_certificado)
+    return _limitador
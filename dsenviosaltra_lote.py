@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Ejecución por lotes de guiones para API SALTRA: un único proceso, un único login y
+un único pool de conexiones para muchos guiones.
+Uso: python dsenviosaltra_lote.py dsClave usuarioPK:idUsuario passw origen code_respuesta [hilos] [resumen.json] [metricas.json]
+
+'origen' puede ser un directorio (se ejecutan sus *.txt), un patrón glob
+('/ruta/guion_0*.txt') o un manifiesto con una ruta de guion por línea.
+Cada guion genera sus ficheros de salida (.txt/.fin/.tiempos.json) igual que dsenviosaltra.py; con
+'metricas.json' sus tiempos por fase se acumulan además en ese fichero.
+'hilos' es el límite global de guiones en curso; las peticiones a cada backend siguen limitadas
+por el limitador, la concurrencia y el circuito del transporte compartido (dsenviosaltra_http),
+así que puede subirse a cientos sin saturar ningún backend.
+"""
+import os
+import sys
+import glob
+import json
+import time
+from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from dsenviosaltra import procesar_guion, vaciar_cola_tras_guion
+from dsenviosaltra_http import configurar_transporte, TAMANO_POOL
+from dsenviosaltra_tiempos import configurar_metricas
+
+HILOS_LOTE = 8
+
+def listar_guiones(origen: str):
+    """Devuelve la lista de guiones a partir de un directorio, un patrón glob o un manifiesto"""
+    if os.path.isdir(origen):
+        return sorted(os.path.join(origen, nombre) for nombre in os.listdir(origen) if nombre.lower().endswith('.txt'))
+
+    if glob.has_magic(origen):
+        return sorted(glob.glob(origen))
+
+    guiones = []
+    directorio_manifiesto = os.path.dirname(os.path.abspath(origen))
+    with open(origen, 'r', encoding='iso-8859-1') as f:
+        for linea in f:
+            linea = linea.strip()
+            if linea and not linea.startswith('#'):
+                guiones.append(linea if os.path.isabs(linea) else os.path.join(directorio_manifiesto, linea))
+    return guiones
+
+class DsEnvioSaltraLote:
+    def __init__(self, dsClave, usuario, idUsuario, passw, code_respuesta, hilos=HILOS_LOTE):
+        self.dsClave = dsClave
+        self.usuario = usuario
+        self.idUsuario = idUsuario
+        self.passw = passw
+        self.code_respuesta = code_respuesta
+        self.hilos = max(1, hilos)
+        self.token = None
+
+    def ejecutar_uno(self, guion_file: str) -> Dict:
+        inicio = time.time()
+        codigo, client = procesar_guion(self.dsClave, self.usuario, self.idUsuario, self.passw, guion_file, self.code_respuesta, token=self.token)
+        # El cliente puede haber hecho login o renovado el token tras un 401
+        if client and client.token:
+            self.token = client.token
+        vaciar_cola_tras_guion(client, codigo, self.ejecutar_encolado)
+        return {
+            "guion": guion_file,
+            "status": "ok" if codigo == 0 else "ko",
+            "codigo": codigo,
+            "segundos": round(time.time() - inicio, 3),
+            "salida": client.fich_respuesta if client else ""
+        }
+
+    def ejecutar_encolado(self, guion_file: str):
+        """Guion de la cola offline; su resultado va a su fiche-out y no al resumen del lote"""
+        codigo, client = procesar_guion(self.dsClave, self.usuario, self.idUsuario, self.passw, guion_file, self.code_respuesta, token=self.token)
+        if client and client.token:
+            self.token = client.token
+        return codigo
+
+    def ejecutar(self, guiones: List[str]) -> List[Dict]:
+        resultados = []
+        pendientes = list(guiones)
+
+        # Los guiones se ejecutan de uno en uno hasta tener sesión; el resto comparte ese token
+        while pendientes and not self.token:
+            resultados.append(self.ejecutar_uno(pendientes.pop(0)))
+
+        with ThreadPoolExecutor(max_workers=self.hilos) as executor:
+            resultados.extend(executor.map(self.ejecutar_uno, pendientes))
+
+        return resultados
+
+def imprimir_resumen(resultados: List[Dict], total_time):
+    correctos = sum(1 for resultado in resultados if resultado["status"] == "ok")
+    for resultado in resultados:
+        print(f"{resultado['status']:<3} {resultado['segundos']:>8.3f}s  {resultado['guion']} -> {resultado['salida']}")
+    print(f"Guiones: {len(resultados)}  ok: {correctos}  ko: {len(resultados) - correctos}  Tiempo transcurrido: {round(total_time)} segundos")
+
+def main():
+    start_time = time.time()
+
+    dsClave = sys.argv[1]
+    partesArgs = sys.argv[2].split("PK:")
+    usuario = partesArgs[0]
+    idUsuario = partesArgs[1]
+    passw = sys.argv[3]
+    origen = sys.argv[4]
+    code_respuesta = sys.argv[5]
+    hilos = int(sys.argv[6]) if len(sys.argv) > 6 else HILOS_LOTE
+    fich_resumen = sys.argv[7] if len(sys.argv) > 7 else ""
+    configurar_metricas(sys.argv[8] if len(sys.argv) > 8 else None)
+
+    if not os.path.exists(origen) and not glob.has_magic(origen):
+        print(f"Error: {origen} no encontrado")
+        sys.exit(1)
+
+    guiones = listar_guiones(origen)
+    configurar_transporte(tamano_pool=max(TAMANO_POOL, hilos))
+
+    resultados = DsEnvioSaltraLote(dsClave, usuario, idUsuario, passw, code_respuesta, hilos).ejecutar(guiones)
+    imprimir_resumen(resultados, time.time() - start_time)
+
+    if fich_resumen:
+        with open(fich_resumen, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+    sys.exit(0 if all(resultado["status"] == "ok" for resultado in resultados) else 1)
+
+if __name__ == "__main__":
+    main()
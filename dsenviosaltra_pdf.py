@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Extracción de PDFs de las respuestas de la API SALTRA sin cargarlos en memoria.
+
+Las respuestas de contratos, llamamientos, IDC, etc. traen los PDFs en base64 dentro del
+JSON ("content": "JVBERi..."). En lugar de parsear el cuerpo completo y decodificar cada
+PDF a un bytes en memoria, el cuerpo se lee por bloques: el base64 de cada PDF se decodifica
+directamente a un fichero temporal junto a 'fiche-out' y en el JSON queda una referencia
+{"ruta", "tamano", "sha256"}. guardar_pdf solo tiene que renombrar ese temporal.
+"""
+import os
+import re
+import json
+import codecs
+import hashlib
+import binascii
+import tempfile
+import requests
+from dsenviosaltra_tiempos import fase
+
+TAMANO_BLOQUE_LECTURA = 64 * 1024
+# base64 de "%PDF": los "content" que empiezan así se llevan a disco
+PREFIJO_PDF_BASE64 = "JVBER"
+# Clave "content" (no escapada dentro de otra cadena) seguida de un PDF en base64
+PATRON_CONTENIDO_PDF = re.compile(r'(?<!\\)"content"\s*:\s*(")(?=' + PREFIJO_PDF_BASE64 + ')')
+# Texto que se retiene entre bloques por si el patrón queda partido
+MARGEN_PATRON = 64
+PREFIJO_TEMPORAL = ".pdf_"
+SUFIJO_TEMPORAL = ".tmp"
+
+def es_referencia_pdf(valor) -> bool:
+    """Indica si el valor es una referencia a un PDF ya volcado a disco"""
+    return isinstance(valor, dict) and "ruta" in valor and "sha256" in valor
+
+class DecodificadorPdf:
+    """Decodifica base64 por bloques a un fichero temporal calculando tamaño y sha256"""
+    def __init__(self, directorio: str):
+        descriptor, self.ruta = tempfile.mkstemp(prefix=PREFIJO_TEMPORAL, suffix=SUFIJO_TEMPORAL, dir=directorio or None)
+        self.fichero = os.fdopen(descriptor, 'wb')
+        self.resumen = hashlib.sha256()
+        self.tamano = 0
+        # Caracteres base64 que no completan un grupo de 4 y escape JSON partido entre bloques
+        self.resto = ""
+
+    def escribir(self, texto: str):
+        texto = self.resto + texto
+        if texto.endswith("\\"):
+            texto, escape = texto[:-1], "\\"
+        else:
+            escape = ""
+        # Escapes JSON posibles en base64: "\/" y saltos de línea
+        texto = texto.replace("\\/", "/").replace("\\n", "").replace("\\r", "")
+        texto = "".join(texto.split())
+
+        completo = len(texto) - len(texto) % 4
+        self.resto = texto[completo:] + escape
+        if completo:
+            self._volcar(binascii.a2b_base64(texto[:completo]))
+
+    def _volcar(self, datos: bytes):
+        self.fichero.write(datos)
+        self.resumen.update(datos)
+        self.tamano += len(datos)
+
+    def cerrar(self) -> dict:
+        resto = self.resto.rstrip("\\")
+        if resto:
+            self._volcar(binascii.a2b_base64(resto + "=" * (-len(resto) % 4)))
+        self.fichero.close()
+        return {"ruta": self.ruta, "tamano": self.tamano, "sha256": self.resumen.hexdigest()}
+
+    def descartar(self):
+        self.fichero.close()
+        if os.path.exists(self.ruta):
+            os.unlink(self.ruta)
+
+class ExtractorPdfs:
+    """
+    Recibe el texto del JSON por bloques y devuelve el mismo JSON en el que cada PDF en
+    base64 se ha sustituido por la referencia al fichero en el que se ha decodificado.
+    """
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self.esqueleto = []
+        self.pendiente = ""
+        self.pdf = None
+        self.temporales = []
+
+    def alimentar(self, texto: str):
+        self.pendiente += texto
+        while True:
+            if self.pdf is not None:
+                fin = self.pendiente.find('"')
+                if fin == -1:
+                    self.pdf.escribir(self.pendiente)
+                    self.pendiente = ""
+                    return
+                self.pdf.escribir(self.pendiente[:fin])
+                self.esqueleto.append(json.dumps(self.pdf.cerrar()))
+                self.pdf = None
+                self.pendiente = self.pendiente[fin + 1:]
+                continue
+
+            coincidencia = PATRON_CONTENIDO_PDF.search(self.pendiente)
+            if coincidencia is None:
+                corte = max(0, len(self.pendiente) - MARGEN_PATRON)
+                self.esqueleto.append(self.pendiente[:corte])
+                self.pendiente = self.pendiente[corte:]
+                return
+
+            self.esqueleto.append(self.pendiente[:coincidencia.start(1)])
+            self.pendiente = self.pendiente[coincidencia.end(1):]
+            self.pdf = DecodificadorPdf(self.directorio)
+            self.temporales.append(self.pdf.ruta)
+
+    def terminar(self):
+        if self.pdf is not None:
+            raise ValueError("La respuesta termina dentro del contenido de un PDF")
+        self.esqueleto.append(self.pendiente)
+        return json.loads("".join(self.esqueleto))
+
+    def descartar(self):
+        if self.pdf is not None:
+            self.pdf.descartar()
+        for ruta in self.temporales:
+            if os.path.exists(ruta):
+                os.unlink(ruta)
+
+def _referenciar_pdfs(valor, directorio: str):
+    """Sustituye en un JSON ya cargado los PDFs en base64 por referencias a disco"""
+    if isinstance(valor, dict):
+        for clave, contenido in valor.items():
+            if clave == "content" and isinstance(contenido, str) and contenido.startswith(PREFIJO_PDF_BASE64):
+                pdf = DecodificadorPdf(directorio)
+                for inicio in range(0, len(contenido), TAMANO_BLOQUE_LECTURA):
+                    pdf.escribir(contenido[inicio:inicio + TAMANO_BLOQUE_LECTURA])
+                valor[clave] = pdf.cerrar()
+            else:
+                _referenciar_pdfs(contenido, directorio)
+    elif isinstance(valor, list):
+        for elemento in valor:
+            _referenciar_pdfs(elemento, directorio)
+
+def leer_json_con_pdfs(response, directorio: str):
+    """
+    Devuelve el JSON de la respuesta con los PDFs ya volcados a 'directorio'. Si la respuesta
+    es de requests se lee por bloques (con stream=True el cuerpo nunca está entero en memoria).
+    """
+    directorio = directorio or tempfile.gettempdir()
+    with fase("lectura_respuesta"):
+        if not isinstance(response, requests.Response):
+            respuesta_data = response.json()
+            _referenciar_pdfs(respuesta_data, directorio)
+            return respuesta_data
+
+        extractor = ExtractorPdfs(directorio)
+        decodificador = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        try:
+            for bloque in response.iter_content(TAMANO_BLOQUE_LECTURA):
+                extractor.alimentar(decodificador.decode(bloque))
+            extractor.alimentar(decodificador.decode(b"", final=True))
+            return extractor.terminar()
+        except BaseException:
+            extractor.descartar()
+            raise
+        finally:
+            response.close()
+
+def descartar_pdfs_temporales(valor):
+    """Borra los PDFs temporales que no se han llegado a guardar (p.ej. 'file2' de un contrato)"""
+    if es_referencia_pdf(valor):
+        ruta = valor.get("ruta")
+        if ruta and os.path.basename(ruta).startswith(PREFIJO_TEMPORAL) and ruta.endswith(SUFIJO_TEMPORAL):
+            if os.path.exists(ruta):
+                os.unlink(ruta)
+            valor["ruta"] = None
+    elif isinstance(valor, dict):
+        for contenido in valor.values():
+            descartar_pdfs_temporales(contenido)
+    elif isinstance(valor, list):
+        for elemento in valor:
+            descartar_pdfs_temporales(elemento)
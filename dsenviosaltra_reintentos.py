@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Reintentos de las peticiones a API SALTRA ante errores transitorios (429, 502, 503, 504,
+conexiones cortadas y timeouts).
+
+Cada endpoint (último tramo de la URL) tiene su política: número de reintentos, espera base y
+máxima, y si sus POST se pueden repetir. Las esperas crecen de forma exponencial con jitter
+(para que los hilos de un lote no reintenten a la vez) y respetan la cabecera Retry-After.
+Un presupuesto global limita los reintentos a una fracción de las peticiones recientes, de modo
+que una caída del servicio no multiplique el tráfico.
+
+Los GET/PUT/DELETE y los POST de consulta se reintentan siempre. Un POST de envío (contratos,
+altas...) solo se repite si no ha llegado al servidor (fallo al conectar) o si este responde
+429/503 con Retry-After; tras un 5xx o un timeout de lectura podría estar ya aceptado, y de no
+repetirlo a ciegas se encarga el registro de envíos (dsenviosaltra_envios).
+"""
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+ESTADOS_REINTENTABLES = frozenset({429, 500, 502, 503, 504})
+# Estados que, con Retry-After, indican que el servidor no ha procesado la petición: seguros también para POST
+ESTADOS_NO_PROCESADOS = frozenset({429, 503})
+METODOS_IDEMPOTENTES = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+# Un Retry-After mayor que esto no se espera: se devuelve la respuesta tal cual
+MAX_ESPERA_RETRY_AFTER = 120
+# Presupuesto: reintentos permitidos por petición en la ventana, más un mínimo fijo
+VENTANA_PRESUPUESTO = 60
+PROPORCION_PRESUPUESTO = 0.2
+MINIMO_PRESUPUESTO = 10
+# 'status' de la respuesta de un registro que no ha obtenido respuesta tras agotar los reintentos
+ESTADO_SIN_RESPUESTA = 503
+
+class PoliticaReintentos:
+    __slots__ = ("reintentos", "espera_base", "espera_maxima", "post_seguro")
+
+    def __init__(self, reintentos: int = 3, espera_base: float = 1.0, espera_maxima: float = 30.0, post_seguro: bool = False):
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        # POST de consulta o de autenticación: repetirlo no da de alta nada dos veces
+        self.post_seguro = post_seguro
+
+    def espera(self, intento: int) -> float:
+        """Espera antes del reintento 'intento' (desde 1): exponencial acotada con jitter completo"""
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** (intento - 1)))
+
+POLITICA_POR_DEFECTO = PoliticaReintentos()
+POLITICAS_REINTENTOS = {
+    "login": PoliticaReintentos(reintentos=2, post_seguro=True),
+    "copy-basic": PoliticaReintentos(reintentos=5),
+    "contrata": PoliticaReintentos(reintentos=4, espera_base=2.0),
+    "llamamientos": PoliticaReintentos(reintentos=4, espera_base=2.0),
+    "prorroga": PoliticaReintentos(reintentos=4, espera_base=2.0),
+    "transformation": PoliticaReintentos(reintentos=4, espera_base=2.0),
+    "cno": PoliticaReintentos(reintentos=5, post_seguro=True),
+    "occupation": PoliticaReintentos(reintentos=5, post_seguro=True),
+    "category-professional": PoliticaReintentos(reintentos=5, post_seguro=True),
+    "category-occupation-gc": PoliticaReintentos(reintentos=5, post_seguro=True),
+    "convenios-colectivos-por-trabajador": PoliticaReintentos(reintentos=5, post_seguro=True),
+    "ccc-asignados": PoliticaReintentos(reintentos=5, post_seguro=True),
+    "life-ccc": PoliticaReintentos(reintentos=5, post_seguro=True),
+}
+
+def politica_endpoint(url: str) -> PoliticaReintentos:
+    tramo = (url or "").split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+    return POLITICAS_REINTENTOS.get(tramo, POLITICA_POR_DEFECTO)
+
+def espera_retry_after(valor):
+    """Segundos que pide la cabecera Retry-After (número o fecha HTTP), o None si no la hay o no se entiende"""
+    if not valor:
+        return None
+    valor = valor.strip()
+    if valor.isdigit():
+        return float(valor)
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+def se_puede_repetir(metodo: str, politica: PoliticaReintentos) -> bool:
+    """Indica si la petición se puede repetir aunque el servidor haya podido procesarla"""
+    return (metodo or "").upper() in METODOS_IDEMPOTENTES or politica.post_seguro
+
+class PresupuestoReintentos:
+    """Reintentos disponibles para todo el proceso: una fracción de las peticiones de la última ventana"""
+    def __init__(self, ventana: float = VENTANA_PRESUPUESTO, proporcion: float = PROPORCION_PRESUPUESTO, minimo: int = MINIMO_PRESUPUESTO):
+        self.ventana = ventana
+        self.proporcion = proporcion
+        self.minimo = minimo
+        self._peticiones = deque()
+        self._reintentos = deque()
+        self._lock = threading.Lock()
+
+    def _purgar(self, ahora: float):
+        limite = ahora - self.ventana
+        for marcas in (self._peticiones, self._reintentos):
+            while marcas and marcas[0] < limite:
+                marcas.popleft()
+
+    def registrar_peticion(self):
+        with self._lock:
+            ahora = time.monotonic()
+            self._purgar(ahora)
+            self._peticiones.append(ahora)
+
+    def consumir(self) -> bool:
+        """Gasta un reintento si queda presupuesto; si no, la petición no se repite"""
+        with self._lock:
+            ahora = time.monotonic()
+            self._purgar(ahora)
+            if len(self._reintentos) >= self.minimo + self.proporcion * len(self._peticiones):
+                return False
+            self._reintentos.append(ahora)
+            return True
+
+presupuesto_reintentos = PresupuestoReintentos()
+
+def respuesta_error_conexion(numero: int, error) -> dict:
+    """Respuesta con la que un registro de un lote sin respuesta del servidor se incluye en el TXT de resultados"""
+    return {
+        'response': {"success": False, "status": ESTADO_SIN_RESPUESTA, "message": "Sin respuesta del servidor tras los reintentos:", "errors": str(error)},
+        'numero': numero
+    }
@@ -6,6 +6,16 @@ from typing import Dict, Any, List, Optional
 from pathlib import Path
 from datetime import datetime
 import base64
+from concurrent.futures import ThreadPoolExecutor
+from dsenviosaltra_salida import escribir_resultado, abrir_resultado
+from dsenviosaltra_pdf import leer_json_con_pdfs, es_referencia_pdf, descartar_pdfs_temporales
+from dsenviosaltra_catalogo import catalogo_referencia
+from dsenviosaltra_tiempos import fase, en_contexto, escribir_tiempos
+from dsenviosaltra_formatos import convertir_formato_fecha, formato_datos, FORMATOS_CLIENTE, FORMATOS_CERTIFICADO
+
+# Hilos que guardan a la vez los PDFs de un lote de contratos y ficheros sincronizados por cada fsync en lote
+HILOS_ESCRITURA_PDF = 4
+LOTE_FSYNC = 32
 
 # Función helper para crear directorios
 def _crear_directorio(ruta: str):
@@ -13,7 +23,7 @@ def _crear_directorio(ruta: str):
     if ruta and not os.path.exists(ruta):
         os.makedirs(ruta, exist_ok=True)
 
-def guardar_respuesta_completa(response, fich_respuesta: str, accion_deducida: str, config: Dict[str, Any], usuario: str, endpoint: str, metodo: str, tiempo_inicio):
+def guardar_respuesta_completa(response, fich_respuesta: str, accion_deducida: str, config: Dict[str, Any], usuario: str, endpoint: str, metodo: str, tiempo_inicio, al_aceptar=None):
     try:
         if not fich_respuesta:
             return
@@ -22,11 +32,21 @@ def guardar_respuesta_completa(response, fich_respuesta: str, accion_deducida: s
         
         content_type = response.headers.get('content-type', '')
         if 'application/json' in content_type:
-            respuesta_data = response.json()
-            with open(fich_respuesta, 'w', encoding='utf-8') as f:
-                json.dump(respuesta_data, f, indent=2, ensure_ascii=False)
-            
-            extraer_y_guardar_respuesta(respuesta_data, response, fich_respuesta, accion_deducida, config, usuario, endpoint, metodo, tiempo_inicio)
+            # Los PDFs se decodifican a disco mientras se lee la respuesta; en el JSON queda su referencia
+            respuesta_data = leer_json_con_pdfs(response, os.path.dirname(fich_respuesta))
+            if al_aceptar is not None and response.status_code == 200:
+                al_aceptar(respuesta_data)
+            # Las consultas de catálogo (cno, 018/019/021) van completando el índice local
+            if isinstance(respuesta_data, dict) and respuesta_data.get("success"):
+                catalogo_referencia.registrar_respuesta(endpoint, respuesta_data.get("data"))
+            try:
+                extraer_y_guardar_respuesta(respuesta_data, response, fich_respuesta, accion_deducida, config, usuario, endpoint, metodo, tiempo_inicio)
+            finally:
+                descartar_pdfs_temporales(respuesta_data)
+
+            with fase("volcado_json"):
+                contenido = json.dumps(respuesta_data, indent=2, ensure_ascii=False)
+            escribir_resultado(fich_respuesta, contenido)
         
         crear_archivo_fin(fich_respuesta)
                 
@@ -79,9 +99,11 @@ def extraer_y_guardar_respuesta(respuesta_data: Any, response: Any, fich_respues
                         rutas_pdf.append(ruta_guardada)
             
             # Generar archivo TXT con las rutas de los PDFs
-            json_to_txt(respuesta_data, txt_path, response.status_code, config, usuario, endpoint, metodo, "", rutas_pdf)
+            with fase("txt"):
+                json_to_txt(respuesta_data, txt_path, response.status_code, config, usuario, endpoint, metodo, "", rutas_pdf)
         else:
-            guardar_respuesta_sin_pdf(accion_deducida, respuesta_data, txt_path, response.status_code, config, usuario, endpoint, metodo)
+            with fase("txt"):
+                guardar_respuesta_sin_pdf(accion_deducida, respuesta_data, txt_path, response.status_code, config, usuario, endpoint, metodo)
 
     except Exception as e:
         manejar_error_y_salir(fich_respuesta, f"{e}", usuario, endpoint, tiempo_inicio)
@@ -105,6 +127,44 @@ def _procesar_pdf_contrato(data: Dict, base_path: Path, numero_contrato: int, ca
                 return guardar_pdf(pdf_content, str(pdf_path))
     return None
 
+def _procesar_pdf_registro(data: Dict, base_path: Path, numero_contrato: int) -> Optional[str]:
+    """Contratos: copia básica en 'file1'; resto de registros (llamamientos, prórrogas...): 'file'"""
+    return _procesar_pdf_contrato(data, base_path, numero_contrato, "file1", 1) or _procesar_pdf_contrato(data, base_path, numero_contrato, "file", 1)
+
+def _sincronizar(rutas: List[str]):
+    for ruta in rutas:
+        descriptor = os.open(ruta, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+class EscritorPdfs:
+    """
+    Pool acotado que guarda en paralelo los PDFs de un lote. Los ficheros no se sincronizan
+    uno a uno: esperar() hace fsync por lotes de LOTE_FSYNC y una sola vez de cada directorio.
+    """
+    def __init__(self, hilos=HILOS_ESCRITURA_PDF):
+        self.executor = ThreadPoolExecutor(max_workers=hilos)
+        self.futuros = []
+
+    def guardar(self, funcion, *args):
+        futuro = self.executor.submit(en_contexto(funcion), *args)
+        self.futuros.append(futuro)
+        return futuro
+
+    def esperar(self):
+        """Espera a que estén escritos todos los PDFs y los deja sincronizados en disco"""
+        try:
+            rutas = [ruta for ruta in (futuro.result() for futuro in self.futuros) if ruta]
+            lotes = [rutas[i:i + LOTE_FSYNC] for i in range(0, len(rutas), LOTE_FSYNC)]
+            list(self.executor.map(_sincronizar, lotes))
+            # Los renombrados solo son definitivos tras sincronizar el directorio
+            for directorio in {os.path.dirname(ruta) or "." for ruta in rutas}:
+                _sincronizar([directorio])
+        finally:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
 def guardar_respuestas_contratos(respuestas_contratos: List[Dict], fich_respuesta: str, config: Dict[str, Any], usuario: str, endpoint: str, metodo: str, tiempo_inicio):
     """Guarda todas las respuestas de contratos en un Ãºnico archivo TXT con múltiples registros"""
     try:
@@ -119,68 +179,83 @@ def guardar_respuestas_contratos(respuestas_contratos: List[Dict], fich_respuest
         
         fecha_actual = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
         parametro = config.get("parametro", "")
-        texto_salida = ""
         status = "ok"
         for item in respuestas_contratos:
             response_dict = item['response']
             if response_dict.get("status") != 200:
                 status = "ko"
                 break
+
+        # Los PDFs se escriben en paralelo y el .txt solo se genera cuando ya están todos en disco
+        escritor = EscritorPdfs()
+        pdfs = {}
+        for item in respuestas_contratos:
+            response_dict = item['response']
+            if response_dict.get("status") == 200:
+                pdfs[item['numero']] = escritor.guardar(_procesar_pdf_registro, response_dict.get("data", {}), base_path, item['numero'])
+        escritor.esperar()
             
-        texto_salida = f"""PETICION
+        with fase("txt"), abrir_resultado(txt_path) as salida:
+            salida.write(f"""PETICION
   FECHA {fecha_actual}
   USUARIO {usuario}
   URL {endpoint}{parametro}
   STATUS {status}
   
-  OPERACIONES SS/SEPE/CERTIFICA"""
+  OPERACIONES SS/SEPE/CERTIFICA""")
 
-        for item in respuestas_contratos:
-            response_dict = item['response']
-            numero_contrato = item['numero']
-            resultado = "ACEPTADO" if response_dict.get("success") == True else "RECHAZADO"
+            for item in respuestas_contratos:
+                response_dict = item['response']
+                numero_contrato = item['numero']
+                resultado = "ACEPTADO" if response_dict.get("success") == True else "RECHAZADO"
 
-            texto_salida += f"""
+                salida.write(f"""
       Registro-{numero_contrato}
-        Resultado {resultado}"""
+        Resultado {resultado}""")
             
-            if response_dict.get("status") != 200:
-                mensaje = response_dict.get("message", "")
-                error = response_dict.get("errors", "")
-                texto_salida += """
+                if response_dict.get("status") != 200:
+                    mensaje = response_dict.get("message", "")
+                    error = response_dict.get("errors", "")
+                    salida.write("""
       FinRegistro
-"""
-                texto_salida +=f"""
+""")
+                    salida.write(f"""
       Errores
-        error : {mensaje} {error}\n"""
-            else:
-                data = response_dict.get("data", {})
-                mensaje = data.get("id", "") if "id" in data else ""
-                dni_trabajador = data.get("doc", "") if "doc" in data else ""
+        error : {mensaje} {error}\n""")
+                else:
+                    data = response_dict.get("data", {})
+                    mensaje = data.get("id", "") if "id" in data else ""
+                    dni_trabajador = data.get("doc", "") if "doc" in data else ""
 
-                texto_salida += f"""
+                    salida.write(f"""
         Mensaje {mensaje}
-        DNITRABA : {dni_trabajador}"""
+        DNITRABA : {dni_trabajador}""")
                 
-                ruta_pdf1 = _procesar_pdf_contrato(data, base_path, numero_contrato, "file1", 1)
-                if ruta_pdf1:
-                    texto_salida += f"""
-        Pdf1 {ruta_pdf1}"""
+                    ruta_pdf1 = pdfs[numero_contrato].result()
+                    if ruta_pdf1:
+                        salida.write(f"""
+        Pdf1 {ruta_pdf1}""")
                 
-    #            if "file2" in data:
-    #                ruta_pdf2 = _procesar_pdf_contrato(data, base_path, numero_contrato, "file2", 2)
-    #                if ruta_pdf2:
-    #                    texto_salida += f"""
-    #    Pdf2 {ruta_pdf2}"""
+        #            if "file2" in data:
+        #                ruta_pdf2 = _procesar_pdf_contrato(data, base_path, numero_contrato, "file2", 2)
+        #                if ruta_pdf2:
+        #                    salida.write(f"""
+        #    Pdf2 {ruta_pdf2}""")
                         
-                texto_salida += """
+                    salida.write("""
       FinRegistro
-"""
-        
-        texto_salida += "\n\nFIN"
+""")
+                    # Aceptado pero sin alguno de sus documentos (p.ej. la copia básica de un contrato)
+                    if response_dict.get("errors"):
+                        salida.write(f"""
+      Errores
+        error : {response_dict["errors"]}\n""")
         
-        with open(txt_path, "w", encoding="utf-8") as f:
-            f.write(texto_salida)
+            salida.write("\n\nFIN")
+
+        # PDFs recibidos que no se guardan (p.ej. 'file2')
+        for item in respuestas_contratos:
+            descartar_pdfs_temporales(item['response'])
         
         # Crear archivo .fin
         crear_archivo_fin(fich_respuesta)
@@ -217,7 +292,18 @@ def extraer_pdf(respuesta: Any) -> Any:
     return None
 
 def guardar_pdf(pdf_data: Any, ruta_pdf: str):
+    with fase("escritura_pdf", ruta=ruta_pdf):
+        return _guardar_pdf(pdf_data, ruta_pdf)
+
+def _guardar_pdf(pdf_data: Any, ruta_pdf: str):
     try:
+        # PDF ya decodificado a disco al leer la respuesta: basta con renombrarlo
+        if es_referencia_pdf(pdf_data):
+            os.replace(pdf_data["ruta"], ruta_pdf)
+            pdf_data["ruta"] = ruta_pdf
+            print(f"PDF guardado exitosamente en: {ruta_pdf}")
+            return ruta_pdf
+
         pdf_bytes = base64.b64decode(pdf_data)
 
         if pdf_bytes.startswith(b'%PDF-'):
@@ -236,6 +322,7 @@ def guardar_pdf(pdf_data: Any, ruta_pdf: str):
 def manejar_error_y_salir(fich_respuesta, mensaje_error, usuario, endpoint, tiempo_inicio):
         """Helper para manejar errores de forma consistente"""
         crear_archivo_error(fich_respuesta, mensaje_error, usuario, endpoint, tiempo_inicio)
+        escribir_tiempos(fich_respuesta)
         crear_archivo_fin(fich_respuesta)
         sys.exit(1)
 
@@ -248,8 +335,7 @@ def crear_archivo_fin(fich_respuesta: str):
         fin_path = base_path.with_suffix('.fin')
         _crear_directorio(fin_path.parent)
         
-        with open(fin_path, 'a', encoding='iso-8859-1') as f:
-            f.write("FIN\n")
+        escribir_resultado(str(fin_path), "FIN\n", encoding='iso-8859-1', anadir=True)
     except Exception as e:
         print(f"Error creando archivo FIN: {e}")
 
@@ -274,21 +360,11 @@ def crear_archivo_error(fich_respuesta: str, resultado: str, usuario, endpoint,
 FIN
 Tiempo transcurrido: {total_time} segundos"""
         
-        with open(fich_respuesta, 'w', encoding='utf-8') as f:
-            f.write(contenido)
+        escribir_resultado(fich_respuesta, contenido)
 
     except Exception as e:
         print(f"Error creando archivo de error: {e}")
 
-def convertir_formato_fecha(fecha_str: str,  formato_out='%d/%m/%Y %H:%M:%S') -> str:
-    if not fecha_str:
-        return None
-    try:
-        fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d')
-        return fecha_obj.strftime(formato_out)
-    except (ValueError, TypeError):
-        return f"Advertencia: No se pudo convertir la fecha '{fecha_str}'"
-    
 def json_cliente_to_txt(json_data: str, txt_path: str, response_status: int, config: Dict[str, Any], usuario, endpoint, metodo):
     status = "ok" if response_status == 200 else "error"
     fecha_actual = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
@@ -299,82 +375,17 @@ def json_cliente_to_txt(json_data: str, txt_path: str, response_status: int, con
   USUARIO {usuario}
   URL {endpoint}{parametro}
   STATUS {status}"""
-    texto_salida_cuerpo = ""
-
-    if metodo.upper() == 'POST':
-        data = json_data.get("data", {})
-        profile = json_data.get("data",{}).get("profile", {})
-        pk = data.get("id", "")
-        email = data.get("access").get("email", "")
-        nombre = data.get("name") if data.get("name") is not None else ""
-        activo = data.get("active") if data.get("active") is not None else ""
-        dni = profile.get("dni") if profile.get("dni") is not None else ""
-        razon_social = profile.get("razon_social") if profile.get("razon_social") is not None else ""
-        alias = profile.get("account")[0].get("alias") if profile.get("account")[0].get("alias") is not None else ""
-        regimen = profile.get("account")[0].get("regimen") if profile.get("account")[0].get("regimen") is not None else ""
-        cuenta = profile.get("account")[0].get("cuenta") if profile.get("account")[0].get("cuenta") is not None else ""
-
-
-
-        texto_salida_cuerpo += f"""
-  pk : {pk}
-  email: {email}
-  nombre: {nombre}
-  active: {activo}
-  dni: {dni}
-  razon_social: {razon_social}
-  alias: {alias}
-  regimen: {regimen}
-  cuenta: {cuenta}\n"""
-    
-    elif metodo.upper() == 'GET':
-        total_certificados = json_data.get("data", {}).get("data",{})
-        for certificado in total_certificados:
-            profile = certificado.get("profile", {})
-            pk = certificado.get("id", "")
-            email = certificado.get("access").get("email", "")
-            nombre = certificado.get("name") if certificado.get("name") is not None else ""
-            activo = certificado.get("active") if certificado.get("active") is not None else ""
-            dni = profile.get("dni") if profile.get("dni") is not None else ""
-            razon_social = profile.get("razon_social") if profile.get("razon_social") is not None else ""
-            alias = profile.get("account")[0].get("alias") if profile.get("account")[0].get("alias") is not None else ""
-            regimen = profile.get("account")[0].get("regimen") if profile.get("account")[0].get("regimen") is not None else ""
-            cuenta = profile.get("account")[0].get("cuenta") if profile.get("account")[0].get("cuenta") is not None else ""
-
-            texto_salida_cuerpo += f"""
-  pk : {pk}
-  email: {email}
-  nombre: {nombre}
-  active: {activo}
-  dni: {dni}
-  razon_social: {razon_social}
-  alias: {alias}
-  regimen: {regimen}
-  cuenta: {cuenta}\n"""
-    
-    elif metodo.upper() == 'DELETE':
-        data = json_data.get("data", {})
-        pk = data.get("id", "")
-        email = data.get("access", {}).get("email", "")
-        nombre = data.get("name", "")
-        texto_salida_cuerpo += f"""
-  pk : {pk}
-  email: {email}
-  nombre: {nombre}\n"""
-    
-    elif metodo.upper() == 'PUT':
-        mensaje = json_data.get("message", "")
-        texto_salida_cuerpo += f"""
-  mensaje : {mensaje}\n"""
-    else:
+
+    if metodo.upper() not in FORMATOS_CLIENTE:
         return f"Error: Método {metodo} no soportado para acción cliente."
-    
-    texto_salida = texto_salida_encabezado + texto_salida_cuerpo + "\n\nFIN" if texto_salida_cuerpo else texto_salida_encabezado + "\n\nFIN" 
-    
+    formato = FORMATOS_CLIENTE[metodo.upper()]
+
     try:
-        with open(txt_path, "w", encoding="utf-8") as f:
-            f.write(texto_salida)
-    except Exception as e:
+        with abrir_resultado(txt_path) as salida:
+            salida.write(texto_salida_encabezado)
+            formato.escribir(salida, json_data)
+            salida.write("\n\nFIN")
+    except OSError as e:
         return f"Error al escribir el archivo TXT en {txt_path}: {e}"
         
 def json_certificado_to_txt(json_data: str, txt_path: str, response_status: int, config: Dict[str, Any], usuario, endpoint, metodo):
@@ -387,56 +398,18 @@ def json_certificado_to_txt(json_data: str, txt_path: str, response_status: int,
   USUARIO {usuario}
   URL {endpoint}{parametro}
   STATUS {status}"""
-    texto_salida_cuerpo = ""
 
-    if metodo.upper() == 'POST':
-        data = json_data.get("data", {})
-        cert_secret = data.get("cert_secret", "")
-
-        texto_salida_cuerpo += f"""
-  cert_secret : {cert_secret}\n"""
-        
-    elif metodo.upper() == 'GET':
-        total_certificados = json_data.get("data", {}).get("data",{})
-        for certificado in total_certificados:
-            pk = certificado.get("cert_secret", "")
-            desde = convertir_formato_fecha(certificado.get("desde", ""))
-            hasta = convertir_formato_fecha(certificado.get("expired", ""))
-            nombre_cert = certificado.get("typeText") if certificado.get("typeText") is not None else ""
-            nombre = certificado.get("gn") if certificado.get("gn") is not None else ""
-            apellidos = certificado.get("sn") if certificado.get("sn") is not None else ""
-            nombre_completo = certificado.get("fullName") if certificado.get("fullName") is not None else ""
-            dni = certificado.get("dni") if certificado.get("dni") is not None else ""
-            tipo = certificado.get("type") if certificado.get("type") is not None else ""
-            activo = certificado.get("active") if certificado.get("active") is not None else ""
-            issuer_cn = certificado.get("issuer_cn") if certificado.get("issuer_cn") is not None else ""
-
-            texto_salida_cuerpo += f"""
-  pk : {pk}
-  numero_serie: {pk}
-  id_certificado: {pk}
-  inicio_validez: {desde}
-  fin_validez: {hasta}
-  nombre_certificado: {nombre_cert}
-  gn: {nombre}
-  sn: {apellidos}
-  nombre_completo: {nombre_completo}
-  dni: {dni}
-  type: {tipo}
-  active: {activo}
-  issuer: {issuer_cn}\n"""
-            
-            
-    elif metodo.upper() == 'DELETE':
-        pass
-    else:
+    if metodo.upper() not in FORMATOS_CERTIFICADO:
         return f"Error: Método {metodo} no soportado para acción certificado."
-    
-    texto_salida = texto_salida_encabezado + texto_salida_cuerpo + "\n\nFIN" if texto_salida_cuerpo else texto_salida_encabezado + "\n\nFIN"
+    formato = FORMATOS_CERTIFICADO[metodo.upper()]
+
     try:
-        with open(txt_path, "w", encoding="utf-8") as f:
-            f.write(texto_salida)
-    except Exception as e:
+        with abrir_resultado(txt_path) as salida:
+            salida.write(texto_salida_encabezado)
+            if formato is not None:
+                formato.escribir(salida, json_data)
+            salida.write("\n\nFIN")
+    except OSError as e:
         print(f"Error al escribir el archivo TXT en {txt_path}: {e}")
 
 def json_to_txt(json_data, txt_path: str=None, response_status=None, config: Dict[str, Any]=None, usuario=None, endpoint=None, metodo=None, mensaje_error=None, rutas_pdf=None):
@@ -463,130 +436,34 @@ def json_to_txt(json_data, txt_path: str=None, response_status=None, config: Dic
       Registro-1
         Resultado {resultado}"""
     
-    texto_salida_cuerpo = ""
+    try:
+        with abrir_resultado(txt_path) as salida:
+            salida.write(texto_salida_encabezado)
 
-    if status == "ko":
-        texto_salida_cuerpo +=f"""
+            if status == "ko":
+                salida.write(f"""
   Errores
-    mensaje : {mensaje_error}\n"""
-
-    if rutas_pdf:
-        if endpoint.endswith("/llamamientos"):
-            texto_salida_cuerpo += f"""
-        Mensaje {json_data.get("id")}"""
-        for ruta in rutas_pdf:
-            pdfs += 1
-            texto_salida_cuerpo += f"""
-        Pdf{pdfs} {ruta}"""
+    mensaje : {mensaje_error}\n""")
+
+            if rutas_pdf:
+                if endpoint.endswith("/llamamientos"):
+                    salida.write(f"""
+        Mensaje {json_data.get("id")}""")
+                for ruta in rutas_pdf:
+                    pdfs += 1
+                    salida.write(f"""
+        Pdf{pdfs} {ruta}""")
         
-        texto_salida_cuerpo += """
+                salida.write("""
       FinRegistro
-"""
-    data = json_data.get("data")
+""")
+            data = json_data.get("data")
 
-    if data:
-        # data es una lista
-        if isinstance(data, list):
-            texto_salida_cuerpo += f"""
-        Extra
-          facturable : {employees}"""
-            for registro in data:
-                texto_salida_cuerpo += f"""
-          Tabla"""
-                for clave, valor in registro.items():
-                    texto_salida_cuerpo += f"""
-            {clave} : {valor}"""
-                employees += 1
-
-        # data es un diccionario
-        elif isinstance(data, dict):
-            texto_salida_cuerpo += f"""
+            if data and isinstance(data, (list, dict)):
+                salida.write(f"""
         Extra
-          facturable : {employees}"""
-            # tiene clave 'employees'
-            if "employees" in data:
-                for employee in data.get("employees"):
-                    texto_salida_cuerpo += f"""
-          Tabla"""
-                    for clave, valor in employee.items():
-                        texto_salida_cuerpo += f"""
-            {clave} : {valor}"""
-                    employees += 1
-            
-            # tiene clave 'list'
-            elif "list" in data:
-                for item in data.get("list"):
-                    texto_salida_cuerpo += f"""
-          Tabla"""
-                    for clave, valor in item.items():
-                        texto_salida_cuerpo += f"""
-            {clave} : {valor}"""
-                    employees += 1
-            
-            # tiene clave 'details'
-            elif "details" in data and isinstance(data["details"], list):
-                for item in data["details"]:
-                    texto_salida_cuerpo += f"""
-          Tabla"""
-                    for clave, valor in item.items():
-                        texto_salida_cuerpo += f"""
-            {clave} : {valor}"""
-
-            # acciones específicas (018, 019, 021)
-            elif parametro in ["018", "019", "021"]:
-                texto_salida_cuerpo += f"""
-          Tabla"""
-                if parametro == "018" and "grupoCotizacion" in data:
-                    if data.get("grupoCotizacion"):
-                        for registro, valor in data.get("grupoCotizacion").items():
-                            texto_salida_cuerpo += f"""
-                {registro} : {valor}"""
-                    else:
-                        texto_salida_cuerpo += f"""
-                grupoCotizacion : Ninguna"""
-
-                elif parametro == "019" and "ocupacion" in data:
-                    if data.get("ocupacion"):
-                        for registro, valor in data.get("ocupacion").items():
-                            texto_salida_cuerpo += f"""
-                {registro} : {valor}"""
-                    else:
-                        texto_salida_cuerpo += f"""
-                ocupacion : Ninguna"""
-
-                elif parametro == "021" and "categoriaProfesional" in data:
-                    if data.get("categoriaProfesional"):
-                        for registro, valor in data.get("categoriaProfesional").items():
-                            texto_salida_cuerpo += f"""
-                {registro} : {valor}"""
-                    else:
-                        texto_salida_cuerpo += f"""
-                categoriaProfesional : Ninguna"""
-            elif endpoint.endswith("/enterprise-data"):
-                texto_salida_cuerpo += f"""
-          Mensaje {data.get("id")}"""
-                for registro, valor in data.items():
-                    if registro == "domicilio":
-                        for clave, valor in data.get("domicilio").items():
-                            texto_salida_cuerpo += f"""
-                {clave} : {valor}"""
-                    else:
-                        texto_salida_cuerpo += f"""
-                {registro} : {valor}"""
-                employees += 1
-
-            # data es un diccionario simple
-            else:
-                texto_salida_cuerpo += f"""
-          Tabla"""
-                for registro, valor in data.items():
-                    texto_salida_cuerpo += f"""
-                {registro} : {valor}"""
-                employees += 1
-    
-    texto_salida = texto_salida_encabezado + "\n\nFIN" if texto_salida_cuerpo == "" else texto_salida_encabezado + texto_salida_cuerpo + "\n\nFIN" 
-    try:
-        with open(txt_path, "w", encoding="utf-8") as f:
-            f.write(texto_salida)
-    except Exception as e:
+          facturable : {employees}""")
+                formato_datos(data, parametro, endpoint).escribir(salida, data)
+            salida.write("\n\nFIN")
+    except OSError as e:
         print(f"Error al escribir el archivo TXT en {txt_path}: {e}")
\ No newline at end of file
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Publicación atómica de los ficheros de resultado de un guion (fiche-out, .txt y .fin).
+
+Mientras se ejecuta un guion sus resultados se acumulan en memoria, o en un directorio temporal
+junto a 'fiche-out' si se escriben por partes (abrir_resultado); al terminar se publican con
+os.replace, dejando el .fin para el final. El ERP, que espera al .fin, nunca ve un fichero a medio escribir.
+Fuera de un guion (p.ej. si falla la lectura del guion) cada fichero se escribe directamente.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+class SalidaGuion:
+    """Ficheros de resultado de un guion pendientes de publicar"""
+    def __init__(self, fich_respuesta: str):
+        self.fich_respuesta = fich_respuesta
+        # ruta -> (contenido, encoding, ruta_preparada); los ficheros abiertos con abrir() ya están en 'temporal'
+        self.ficheros = {}
+        self.temporal = None
+        self.preparados = 0
+        self.lock = threading.Lock()
+
+    def _ruta_preparada(self) -> str:
+        if self.temporal is None:
+            directorio = os.path.dirname(self.fich_respuesta) or "."
+            os.makedirs(directorio, exist_ok=True)
+            self.temporal = tempfile.mkdtemp(prefix=".salida_", dir=directorio)
+        self.preparados += 1
+        return os.path.join(self.temporal, str(self.preparados))
+
+    def escribir(self, ruta: str, contenido: str, encoding: str, anadir: bool):
+        with self.lock:
+            anterior = self.ficheros.get(ruta)
+            if anadir and anterior is not None and anterior[2] is not None:
+                with open(anterior[2], 'a', encoding=anterior[1]) as f:
+                    f.write(contenido)
+                return
+            if anadir:
+                if anterior is not None:
+                    contenido = anterior[0] + contenido
+                elif os.path.exists(ruta):
+                    # Mismo resultado que abrir en modo 'a' un fichero que ya existía
+                    with open(ruta, 'r', encoding=encoding) as f:
+                        contenido = f.read() + contenido
+            self.ficheros[ruta] = (contenido, anterior[1] if anadir and anterior else encoding, None)
+
+    @contextmanager
+    def abrir(self, ruta: str, encoding: str):
+        with self.lock:
+            ruta_preparada = self._ruta_preparada()
+        try:
+            with open(ruta_preparada, 'w', encoding=encoding) as f:
+                yield f
+        except BaseException:
+            os.unlink(ruta_preparada)
+            raise
+        with self.lock:
+            self.ficheros[ruta] = (None, encoding, ruta_preparada)
+
+    def publicar(self):
+        """Escribe cada fichero una vez en un directorio temporal y los publica renombrándolos; el .fin el último"""
+        with self.lock:
+            try:
+                preparados = []
+                for ruta in sorted(self.ficheros, key=lambda ruta: ruta.endswith('.fin')):
+                    contenido, encoding, ruta_preparada = self.ficheros[ruta]
+                    if ruta_preparada is None:
+                        ruta_preparada = self._ruta_preparada()
+                        with open(ruta_preparada, 'w', encoding=encoding) as f:
+                            f.write(contenido)
+                    preparados.append((ruta_preparada, ruta))
+
+                for ruta_preparada, ruta in preparados:
+                    os.replace(ruta_preparada, ruta)
+            finally:
+                if self.temporal is not None:
+                    shutil.rmtree(self.temporal, ignore_errors=True)
+                self.temporal = None
+                self.ficheros = {}
+
+_salidas = {}
+_lock_salidas = threading.Lock()
+
+def _clave(ruta: str) -> str:
+    # fiche-out, .txt y .fin de un guion comparten la ruta sin extensión
+    return str(Path(ruta).with_suffix(''))
+
+def salida_activa(fich_respuesta: str):
+    """SalidaGuion del guion con este 'fiche-out' si se está ejecutando dentro de salida_atomica, o None"""
+    with _lock_salidas:
+        return _salidas.get(_clave(fich_respuesta))
+
+def escribir_resultado(ruta: str, contenido: str, encoding: str = 'utf-8', anadir: bool = False):
+    """Escribe (o añade a) un fichero de resultado; dentro de salida_atomica se publica al terminar el guion"""
+    with _lock_salidas:
+        salida = _salidas.get(_clave(ruta))
+    if salida is not None:
+        salida.escribir(ruta, contenido, encoding, anadir)
+        return
+
+    if anadir:
+        with open(ruta, 'a', encoding=encoding) as f:
+            f.write(contenido)
+        return
+
+    descriptor, ruta_temporal = tempfile.mkstemp(prefix=".salida_", dir=os.path.dirname(ruta) or ".")
+    try:
+        with os.fdopen(descriptor, 'w', encoding=encoding) as f:
+            f.write(contenido)
+        os.replace(ruta_temporal, ruta)
+    except BaseException:
+        if os.path.exists(ruta_temporal):
+            os.unlink(ruta_temporal)
+        raise
+
+@contextmanager
+def abrir_resultado(ruta: str, encoding: str = 'utf-8'):
+    """
+    Abre un fichero de resultado para escribirlo por partes sin acumularlo en memoria. Se publica
+    (renombrándolo) solo si el bloque termina sin error; dentro de salida_atomica, al terminar el guion.
+    """
+    with _lock_salidas:
+        salida = _salidas.get(_clave(ruta))
+    if salida is not None:
+        with salida.abrir(ruta, encoding) as f:
+            yield f
+        return
+
+    descriptor, ruta_temporal = tempfile.mkstemp(prefix=".salida_", dir=os.path.dirname(ruta) or ".")
+    try:
+        with os.fdopen(descriptor, 'w', encoding=encoding) as f:
+            yield f
+        os.replace(ruta_temporal, ruta)
+    except BaseException:
+        if os.path.exists(ruta_temporal):
+            os.unlink(ruta_temporal)
+        raise
+
+@contextmanager
+def salida_atomica(fich_respuesta: str):
+    """Acumula los resultados del guion con este 'fiche-out' y los publica al salir, también si termina con error"""
+    if not fich_respuesta:
+        yield None
+        return
+
+    salida = SalidaGuion(fich_respuesta)
+    clave = _clave(fich_respuesta)
+    with _lock_salidas:
+        _salidas[clave] = salida
+    try:
+        yield salida
+    finally:
+        with _lock_salidas:
+            _salidas.pop(clave, None)
+        salida.publicar()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Medición por fases del tiempo de cada guion (tiempo real y de CPU).
+
+Mientras se ejecuta un guion se acumula, por fase, el número de veces, el tiempo real
+(perf_counter) y el de CPU del hilo que la ejecuta (thread_time):
+  guion              lectura del guion (incluye la conversión del XML)
+  xml                conversión (y en los lotes en streaming, validación) del XML
+  login              autenticación, incluida su petición HTTP
+  http               cada petición a API SALTRA hasta recibir las cabeceras, con sus esperas
+                     al limitador y al control de concurrencia (login y copia básica incluidos)
+  lectura_respuesta  lectura del cuerpo de la respuesta con los PDFs decodificados a disco
+  escritura_pdf      guardado de cada PDF en su ruta definitiva
+  volcado_json       serialización de la respuesta en 'fiche-out'
+  txt                generación del TXT de resultados
+Las fases se anidan (p.ej. 'http' dentro de 'login'), así que sus tiempos no se suman.
+Cada petición HTTP y cada PDF se guardan además por separado.
+
+El resultado se escribe junto a 'fiche-out' (<fiche-out sin extensión>.tiempos.json) y se
+publica con los demás ficheros del guion, antes del .fin. Opcionalmente, con
+configurar_metricas(), los totales de todos los guiones se acumulan en un fichero de métricas
+compartido por los procesos. El tiempo de CPU de la conversión del XML en otros procesos no se cuenta.
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+import contextvars
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+from dsenviosaltra_salida import salida_activa, escribir_resultado
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SUFIJO_TIEMPOS = ".tiempos.json"
+DECIMALES_TIEMPOS = 6
+
+_medicion_actual = contextvars.ContextVar("medicion_guion", default=None)
+
+def _redondear(segundos: float) -> float:
+    return round(segundos, DECIMALES_TIEMPOS)
+
+def ruta_tiempos(fich_respuesta: str) -> str:
+    return str(Path(fich_respuesta).with_suffix('')) + SUFIJO_TIEMPOS
+
+def tramo_url(url: str) -> str:
+    """Último tramo de la URL sin parámetros (contrata, copy-basic, login...)"""
+    return (url or "").split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+
+class MedicionGuion:
+    def __init__(self, guion_file: str = ""):
+        self.guion_file = guion_file
+        self.fecha = datetime.now().isoformat(timespec="seconds")
+        self.inicio = time.perf_counter()
+        self.inicio_cpu = time.process_time()
+        # fase -> [llamadas, tiempo real, tiempo de CPU, tiempo real máximo]
+        self.fases = {}
+        self.llamadas = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def fase(self, nombre: str, **detalle):
+        """Mide el bloque como fase 'nombre'; con 'detalle' (que el bloque puede completar) se guarda también por separado"""
+        inicio = time.perf_counter()
+        inicio_cpu = time.thread_time()
+        try:
+            yield detalle
+        finally:
+            pared = time.perf_counter() - inicio
+            cpu = time.thread_time() - inicio_cpu
+            with self._lock:
+                totales = self.fases.setdefault(nombre, [0, 0.0, 0.0, 0.0])
+                totales[0] += 1
+                totales[1] += pared
+                totales[2] += cpu
+                totales[3] = max(totales[3], pared)
+                if detalle:
+                    self.llamadas.append({"fase": nombre, **detalle, "inicio": _redondear(inicio - self.inicio),
+                                          "pared": _redondear(pared), "cpu": _redondear(cpu)})
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "guion": self.guion_file,
+                "fecha": self.fecha,
+                "pared": _redondear(time.perf_counter() - self.inicio),
+                # CPU de todo el proceso: en los modos lote y demonio incluye la de los guiones simultáneos
+                "cpu_proceso": _redondear(time.process_time() - self.inicio_cpu),
+                "fases": {nombre: {"llamadas": llamadas, "pared": _redondear(pared), "cpu": _redondear(cpu), "pared_max": _redondear(maximo)}
+                          for nombre, (llamadas, pared, cpu, maximo) in self.fases.items()},
+                "llamadas": sorted(self.llamadas, key=lambda llamada: llamada["inicio"])
+            }
+
+def medicion_actual():
+    return _medicion_actual.get()
+
+@contextmanager
+def fase(nombre: str, **detalle):
+    """Mide el bloque en la medición del guion en curso; sin medición no hace nada"""
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        yield detalle
+        return
+    with medicion.fase(nombre, **detalle) as detalle:
+        yield detalle
+
+def en_contexto(funcion):
+    """
+    Envuelve 'funcion' para que, al ejecutarse en un pool de hilos, mida en la misma medición
+    que el hilo que la envía. Cada llamada usa su propia copia del contexto (vale para map).
+    """
+    contexto = contextvars.copy_context()
+    def ejecutar(*args, **kwargs):
+        return contexto.copy().run(funcion, *args, **kwargs)
+    return ejecutar
+
+@contextmanager
+def medir_guion(guion_file: str):
+    """Mide el guion ejecutado dentro del bloque y, al terminar, acumula sus tiempos en el fichero de métricas"""
+    medicion = MedicionGuion(guion_file)
+    testigo = _medicion_actual.set(medicion)
+    try:
+        yield medicion
+    finally:
+        _medicion_actual.reset(testigo)
+        if _ruta_metricas:
+            metricas.acumular(medicion.resumen())
+
+def escribir_tiempos(fich_respuesta: str):
+    """
+    Escribe los tiempos del guion en curso junto a 'fiche-out'. Dentro de salida_atomica se
+    publican con el resto de ficheros (una escritura posterior sustituye a la anterior).
+    """
+    medicion = _medicion_actual.get()
+    if medicion is None or not fich_respuesta:
+        return
+    try:
+        ruta = ruta_tiempos(fich_respuesta)
+        contenido = json.dumps({"fiche-out": fich_respuesta, **medicion.resumen()}, indent=2, ensure_ascii=False)
+        salida = salida_activa(fich_respuesta)
+        if salida is not None:
+            salida.escribir(ruta, contenido, 'utf-8', False)
+        else:
+            escribir_resultado(ruta, contenido)
+    except Exception as e:
+        print(f"Error guardando los tiempos del guion: {e}")
+
+class MetricasAgregadas:
+    """
+    Totales de todos los guiones medidos: por fase y, las peticiones HTTP, por endpoint (último
+    tramo de la URL). El fichero lo comparten varios procesos y se protege con un bloqueo.
+    """
+    def __init__(self, ruta: str = None):
+        self._ruta = ruta
+
+    @property
+    def ruta(self):
+        return self._ruta or _ruta_metricas
+
+    @contextmanager
+    def _bloquear(self):
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        descriptor = os.open(self.ruta + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.flock(descriptor, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(descriptor, fcntl.LOCK_UN)
+            os.close(descriptor)
+
+    def leer(self) -> dict:
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _escribir(self, datos: dict):
+        descriptor, ruta_temporal = tempfile.mkstemp(dir=os.path.dirname(self.ruta) or ".", prefix=".metricas")
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as f:
+                json.dump(datos, f, indent=2, ensure_ascii=False)
+            os.replace(ruta_temporal, self.ruta)
+        except BaseException:
+            if os.path.exists(ruta_temporal):
+                os.unlink(ruta_temporal)
+            raise
+
+    @staticmethod
+    def _sumar(totales: dict, llamadas: int, pared: float, cpu: float, pared_max: float):
+        totales["llamadas"] = totales.get("llamadas", 0) + llamadas
+        totales["pared"] = _redondear(totales.get("pared", 0.0) + pared)
+        totales["cpu"] = _redondear(totales.get("cpu", 0.0) + cpu)
+        totales["pared_max"] = max(totales.get("pared_max", 0.0), pared_max)
+
+    def acumular(self, resumen: dict):
+        if not self.ruta:
+            return
+        try:
+            with self._bloquear():
+                datos = self.leer()
+                datos.setdefault("desde", resumen["fecha"])
+                datos["hasta"] = datetime.now().isoformat(timespec="seconds")
+                datos["guiones"] = datos.get("guiones", 0) + 1
+                datos["pared"] = _redondear(datos.get("pared", 0.0) + resumen["pared"])
+
+                fases = datos.setdefault("fases", {})
+                for nombre, totales in resumen["fases"].items():
+                    self._sumar(fases.setdefault(nombre, {}), totales["llamadas"], totales["pared"], totales["cpu"], totales["pared_max"])
+
+                http = datos.setdefault("http", {})
+                for llamada in resumen["llamadas"]:
+                    if llamada["fase"] == "http":
+                        totales = http.setdefault(tramo_url(llamada.get("url")), {})
+                        self._sumar(totales, 1, llamada["pared"], llamada["cpu"], llamada["pared"])
+                        estado = str(llamada.get("estado"))
+                        totales.setdefault("estados", {})[estado] = totales.get("estados", {}).get(estado, 0) + 1
+
+                self._escribir(datos)
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            print(f"Error acumulando las métricas en {self.ruta}: {e}")
+
+_ruta_metricas = None
+metricas = MetricasAgregadas()
+
+def configurar_metricas(ruta: str = None):
+    """Acumula los tiempos de los guiones medidos en el fichero 'ruta' (None: sin fichero de métricas)"""
+    global _ruta_metricas
+    _ruta_metricas = ruta or None
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Caché en disco de tokens de acceso de API SALTRA.
+Guarda el access_token de cada usuario junto a su caducidad para no repetir el login
+en cada guion. El fichero se escribe con permisos 0600 y se protege con un bloqueo
+para que varios procesos (guiones, lotes, demonio) puedan compartirlo.
+"""
+import os
+import json
+import time
+import base64
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+RUTA_CACHE_TOKENS = os.path.join(os.path.expanduser("~"), ".cache", "dsenviosaltra", "tokens.json")
+MARGEN_RENOVACION = 60
+
+def caducidad_token(token: str, datos_login: dict):
+    """Devuelve el instante (epoch) en que caduca el token, o None si no se puede saber"""
+    expires_in = datos_login.get("expires_in") if isinstance(datos_login, dict) else None
+    if expires_in:
+        try:
+            return time.time() + int(expires_in)
+        except (TypeError, ValueError):
+            pass
+
+    # Si el token es un JWT se usa su claim 'exp'
+    partes = token.split(".") if isinstance(token, str) else []
+    if len(partes) != 3:
+        return None
+    try:
+        carga = partes[1] + "=" * (-len(partes[1]) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(carga)).get("exp")
+        return float(exp) if exp else None
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+class CacheTokens:
+    def __init__(self, ruta: str = None):
+        self._ruta = ruta
+
+    @property
+    def ruta(self):
+        return self._ruta or RUTA_CACHE_TOKENS
+
+    def _clave(self, usuario: str) -> str:
+        return hashlib.sha256(usuario.encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def _bloquear(self):
+        os.makedirs(os.path.dirname(self.ruta), mode=0o700, exist_ok=True)
+        descriptor = os.open(self.ruta + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.flock(descriptor, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(descriptor, fcntl.LOCK_UN)
+            os.close(descriptor)
+
+    def _leer(self) -> dict:
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _escribir(self, tokens: dict):
+        descriptor, ruta_temporal = tempfile.mkstemp(dir=os.path.dirname(self.ruta), prefix=".tokens")
+        try:
+            os.chmod(ruta_temporal, 0o600)
+            with os.fdopen(descriptor, "w", encoding="utf-8") as f:
+                json.dump(tokens, f)
+            os.replace(ruta_temporal, self.ruta)
+        except Exception:
+            os.unlink(ruta_temporal)
+            raise
+
+    def obtener(self, usuario: str):
+        """Devuelve el token en caché si no va a caducar en los próximos MARGEN_RENOVACION segundos"""
+        try:
+            with self._bloquear():
+                entrada = self._leer().get(self._clave(usuario))
+        except OSError as e:
+            print(f"Error leyendo la caché de tokens: {e}")
+            return None
+
+        if entrada and entrada.get("expira", 0) - MARGEN_RENOVACION > time.time():
+            return entrada.get("token")
+        return None
+
+    def guardar(self, usuario: str, token: str, expira: float):
+        try:
+            with self._bloquear():
+                tokens = self._leer()
+                ahora = time.time()
+                tokens = {clave: entrada for clave, entrada in tokens.items() if entrada.get("expira", 0) > ahora}
+                tokens[self._clave(usuario)] = {"token": token, "expira": expira}
+                self._escribir(tokens)
+        except OSError as e:
+            print(f"Error guardando la caché de tokens: {e}")
+
+    def invalidar(self, usuario: str):
+        try:
+            with self._bloquear():
+                tokens = self._leer()
+                if tokens.pop(self._clave(usuario), None) is not None:
+                    self._escribir(tokens)
+        except OSError as e:
+            print(f"Error invalidando la caché de tokens: {e}")
+
+cache_tokens = CacheTokens()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Validación local de los payloads generados desde XML antes de enviarlos a API SALTRA.
+
+Cada tipo de documento (CONTRATOS, LLAMAMIENTOS, PRORROGAS, TRANSFORMACIONES y
+Certificado_empresa) tiene su tabla de reglas: campos del payload (rutas como en
+dsenviosaltra_formatos), descripción y comprobación. Las reglas se aplican por columnas
+sobre bloques de registros: cada campo se extrae una vez para todo el bloque y se comprueba
+de una pasada. Los registros con errores no se envían; se devuelven todos sus errores para
+escribirlos en el TXT como Registro-N RECHAZADO.
+"""
+import re
+from datetime import datetime
+from dsenviosaltra_formatos import compilar_ruta
+from dsenviosaltra_catalogo import catalogo_referencia, CATALOGO_OCUPACION
+
+TAMANO_BLOQUE_VALIDACION = 500
+# 'status' de la respuesta que se genera para un registro rechazado sin enviarlo
+ESTADO_RECHAZO_LOCAL = 422
+MENSAJE_RECHAZO_LOCAL = "Rechazado antes del envío:"
+
+LETRAS_DNI = "TRWAGMYFPDXBNJZSQVHLCKE"
+LETRAS_CONTROL_CIF = "JABCDEFGHI"
+PATRON_DNI = re.compile(r"\d{8}[A-Z]")
+PATRON_NIE = re.compile(r"[XYZ]\d{7}[A-Z]")
+PATRON_CIF = re.compile(r"[ABCDEFGHJNPQRSUVW]\d{7}[0-9A-J]")
+PATRON_SEPE_ID = re.compile(r"E-\d{2}-\d{4}-\d{6,9}")
+
+def dni_valido(valor) -> bool:
+    valor = str(valor or "").strip().upper()
+    if PATRON_NIE.fullmatch(valor):
+        valor = str("XYZ".index(valor[0])) + valor[1:]
+    return bool(PATRON_DNI.fullmatch(valor)) and LETRAS_DNI[int(valor[:8]) % 23] == valor[8]
+
+def nif_valido(valor) -> bool:
+    """CIF de empresa o DNI/NIE de persona física"""
+    valor = str(valor or "").strip().upper()
+    if not PATRON_CIF.fullmatch(valor):
+        return dni_valido(valor)
+    digitos = valor[1:8]
+    suma = sum(int(d) for d in digitos[1::2]) + sum(sum(divmod(int(d) * 2, 10)) for d in digitos[0::2])
+    control = (10 - suma % 10) % 10
+    return valor[8] in (str(control), LETRAS_CONTROL_CIF[control])
+
+def documento_valido(tipo, documento) -> bool:
+    """docType 'D' (DNI) y 'E' (NIE) se comprueban con su letra; otros tipos solo tienen que venir informados"""
+    if tipo in ("D", "E"):
+        return dni_valido(documento)
+    return bool(str(documento or "").strip())
+
+def identificador_valido(identificador) -> bool:
+    """IDENTIFICADORPFISICA: tipo de documento seguido del documento (p.ej. 'D48621852J')"""
+    identificador = str(identificador or "").strip()
+    return len(identificador) > 1 and documento_valido(identificador[0], identificador[1:])
+
+def nss_valido(valor) -> bool:
+    """12 dígitos con control módulo 97; 0 es NSS no informado"""
+    if valor in (0, "0", None, ""):
+        return True
+    valor = str(valor)
+    if not re.fullmatch(r"\d{12}", valor):
+        return False
+    provincia, numero = int(valor[:2]), int(valor[2:10])
+    base = numero + provincia * 10000000 if numero < 10000000 else int(valor[:10])
+    return base % 97 == int(valor[10:])
+
+def fecha_valida(valor) -> bool:
+    try:
+        datetime.strptime(str(valor), "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+def fecha_opcional(valor) -> bool:
+    return valor in (None, "") or fecha_valida(valor)
+
+def orden_fechas(inicio, fin) -> bool:
+    """La fecha de fin no puede ser anterior a la de inicio (si alguna no es válida ya la rechaza su regla)"""
+    if not (fecha_valida(inicio) and fecha_valida(fin)):
+        return True
+    return str(fin) >= str(inicio)
+
+def digitos(cantidad: int):
+    patron = re.compile(r"\d{%d}" % cantidad)
+    return lambda valor: bool(patron.fullmatch(str(valor or "")))
+
+def sepe_id_valido(valor) -> bool:
+    return bool(PATRON_SEPE_ID.fullmatch(str(valor or "")))
+
+def sepe_id_opcional(valor) -> bool:
+    return valor in (None, "") or sepe_id_valido(valor)
+
+def ocupacion_valida(valor) -> bool:
+    """CODIGO_OCUPACION del catálogo local (sin catálogo completo no se descarta ninguno)"""
+    return not valor or catalogo_referencia.codigo_valido(CATALOGO_OCUPACION, valor)
+
+class Regla:
+    __slots__ = ("obtener", "descripcion", "comprobar")
+
+    def __init__(self, rutas, descripcion: str, comprobar):
+        rutas = (rutas,) if isinstance(rutas, str) else rutas
+        self.obtener = [compilar_ruta(ruta) for ruta in rutas]
+        self.descripcion = descripcion
+        self.comprobar = comprobar
+
+class ReglasDocumento:
+    """Tabla de reglas compilada de un tipo de documento: [(rutas, descripción, comprobación)]"""
+    def __init__(self, reglas):
+        self.reglas = [Regla(*regla) for regla in reglas]
+
+    def validar_bloque(self, payloads) -> dict:
+        """Devuelve {índice en el bloque: [errores]} aplicando cada regla a la columna de todo el bloque"""
+        errores = {}
+        for regla in self.reglas:
+            columnas = [list(map(obtener, payloads)) for obtener in regla.obtener]
+            for indice, valores in enumerate(zip(*columnas)):
+                if not regla.comprobar(*valores):
+                    texto = ", ".join("" if valor is None else str(valor) for valor in valores)
+                    errores.setdefault(indice, []).append(f"{regla.descripcion} no válido ({texto})")
+        return errores
+
+REGLAS_DOCUMENTO = {
+    "CONTRATOS": ReglasDocumento([
+        ("cif", "CIF_NIF de la empresa", nif_valido),
+        ("regimen", "Régimen del CCC", digitos(4)),
+        ("ccc", "CCC", digitos(11)),
+        (("docType", "dni"), "Documento del trabajador", documento_valido),
+        ("nss", "NSS", nss_valido),
+        ("dateOfBirth", "Fecha de nacimiento", fecha_valida),
+        ("startDate", "Fecha de inicio", fecha_valida),
+        ("endDate", "Fecha de fin", fecha_opcional),
+        (("startDate", "endDate"), "Orden de fechas inicio/fin", orden_fechas),
+        ("occupation", "CODIGO_OCUPACION", ocupacion_valida),
+    ]),
+    "LLAMAMIENTOS": ReglasDocumento([
+        ("cif", "CIF_NIF de la empresa", nif_valido),
+        ("regimen", "Régimen del CCC", digitos(4)),
+        ("ccc", "CCC", digitos(11)),
+        (("employees/0/docType", "employees/0/doc"), "Documento del trabajador", documento_valido),
+        ("employees/0/nss", "NSS", nss_valido),
+        ("employees/0/dateOfBirth", "Fecha de nacimiento", fecha_valida),
+        ("employees/0/startDate", "Fecha de inicio", fecha_valida),
+        ("employees/0/endDate", "Fecha de fin", fecha_opcional),
+        (("employees/0/startDate", "employees/0/endDate"), "Orden de fechas inicio/fin", orden_fechas),
+        ("employees/0/occupation", "CODIGO_OCUPACION", ocupacion_valida),
+        ("employees/0/sepeId", "CLAVE_CONTRATO_TRANS", sepe_id_valido),
+    ]),
+    "PRORROGAS": ReglasDocumento([
+        ("cif", "CIF_NIF de la empresa", nif_valido),
+        ("regimen", "Régimen del CCC", digitos(4)),
+        ("ccc", "CCC", digitos(11)),
+        ("dni", "DNI del trabajador", dni_valido),
+        ("old_startDate", "Fecha de inicio del contrato", fecha_valida),
+        ("startDate", "Fecha de inicio", fecha_valida),
+        ("endDate", "Fecha de fin", fecha_valida),
+        (("startDate", "endDate"), "Orden de fechas inicio/fin", orden_fechas),
+    ]),
+    "TRANSFORMACIONES": ReglasDocumento([
+        ("DATOS_EMPRESA/CODIGO_CUENTA_COTIZACION", "CODIGO_CUENTA_COTIZACION", digitos(15)),
+        ("DATOS_CONTRATO/IDENTIFICADORPFISICA", "IDENTIFICADORPFISICA", identificador_valido),
+        ("DATOS_CONTRATO/FECHA_INICIO_CTO", "Fecha de inicio del contrato", fecha_valida),
+        ("DATOS_CONTRATO/CLAVE_CONTRATO", "CLAVE_CONTRATO", sepe_id_opcional),
+        ("DATOS_GENERALES_TRANSFORMACION/FECHA_INICIO", "Fecha de inicio", fecha_valida),
+        ("DATOS_GENERALES_TRANSFORMACION/CODIGO_OCUPACION", "CODIGO_OCUPACION", ocupacion_valida),
+    ]),
+    "Certificado_empresa": ReglasDocumento([
+        ("Datos_Empresa/CIF_NIF", "CIF_NIF de la empresa", nif_valido),
+        ("Datos_Empresa/CCC", "CCC", digitos(15)),
+        ("Datos_Trabajador/DNI_NIE", "DNI_NIE del trabajador", dni_valido),
+        ("Datos_Trabajador/NumSS", "NSS", nss_valido),
+        ("Datos_Trabajador/FechaAltaEmpresa", "FechaAltaEmpresa", fecha_valida),
+        ("Datos_Trabajador/FechaSuspensionExtincion", "FechaSuspensionExtincion", fecha_opcional),
+    ]),
+}
+
+def validar_registros(tipo_documento: str, payloads, tamano_bloque: int = TAMANO_BLOQUE_VALIDACION) -> dict:
+    """
+    Valida todos los payloads (lista o iterable, p.ej. un XML en streaming) por bloques y devuelve
+    {numero de registro (desde 1): [errores]}. Los tipos sin tabla de reglas no se validan.
+    """
+    reglas = REGLAS_DOCUMENTO.get(tipo_documento)
+    if reglas is None:
+        return {}
+
+    errores = {}
+    bloque = []
+    inicio = 1
+    for payload in payloads:
+        bloque.append(payload)
+        if len(bloque) == tamano_bloque:
+            errores.update({inicio + indice: mensajes for indice, mensajes in reglas.validar_bloque(bloque).items()})
+            inicio += len(bloque)
+            bloque = []
+    if bloque:
+        errores.update({inicio + indice: mensajes for indice, mensajes in reglas.validar_bloque(bloque).items()})
+    return errores
+
+def respuesta_rechazada(numero: int, errores) -> dict:
+    """Respuesta con la que un registro rechazado localmente se incluye en el TXT de resultados"""
+    return {
+        'response': {"success": False, "status": ESTADO_RECHAZO_LOCAL, "message": MENSAJE_RECHAZO_LOCAL, "errors": "; ".join(errores)},
+        'numero': numero
+    }
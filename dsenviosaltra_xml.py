@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Tablas de mapeo XML -> campos para los ficheros que envía el ERP (CONTRATOS, LLAMAMIENTOS,
+PRORROGAS, TRANSFORMACIONES, Certificado_empresa y alta simple), y conversión a payload de los
+registros de los XML por registros. Esta conversión no depende del cliente: los procesos de
+SaltraClient.xml_a_registros solo importan este módulo y cada uno lee su propio tramo del fichero.
+
+Cada tabla declara los campos de un registro (nombre -> ruta, valor por defecto, conversión)
+y se compila una sola vez en un árbol de etiquetas. Así todos los campos de un registro se
+extraen recorriendo sus hijos una única vez, en lugar de hacer un find() por campo.
+"""
+import io
+import re
+import xml.etree.ElementTree as ET
+
+# Constantes para códigos de contrato
+CONTRATOS_REAL_DECRETO = [402, 407, 502, 507]
+CONTRATOS_HORAS_FORMACION = [421, 521]
+TIEMPO_PARCIAL = [200, 209, 230, 239, 250, 289, 300, 389, 500, 502, 503, 506, 507, 508, 510, 511, 513, 518, 520, 521, 520, 540, 541, 550, 552]
+
+def formatear_fecha(fecha_str: str) -> str:
+    """Formatea una fecha de formato YYYYMMDD a YYYY-MM-DD"""
+    if not fecha_str or len(fecha_str) < 8:
+        return None
+    return f"{fecha_str[:4]}-{fecha_str[4:6]}-{fecha_str[6:8]}"
+
+class _RamaMapeo:
+    __slots__ = ("hijos", "campos", "listas", "nodos")
+
+    def __init__(self):
+        self.hijos = {}
+        self.campos = []
+        self.listas = []
+        self.nodos = []
+
+class MapeoXml:
+    """
+    Tabla de campos compilada. 'campos' es {nombre: (ruta, defecto, conversion)}, 'listas'
+    es {nombre: (ruta, MapeoXml)} para nodos repetidos y 'nodos' es {nombre: ruta} para
+    saber si un bloque opcional está presente. Se respeta la semántica de
+    obtener_texto_nodo: gana el primer nodo de la ruta en orden de documento y, si no existe o
+    su texto está vacío, se usa el valor por defecto.
+    """
+    def __init__(self, campos, listas=None, nodos=None):
+        self.campos = campos
+        self.listas = listas or {}
+        self.nodos = nodos or {}
+        self.arbol = _RamaMapeo()
+
+        for nombre, (ruta, _, _) in self.campos.items():
+            self._rama(ruta).campos.append(nombre)
+        for nombre, (ruta, _) in self.listas.items():
+            self._rama(ruta).listas.append(nombre)
+        for nombre, ruta in self.nodos.items():
+            self._rama(ruta).nodos.append(nombre)
+
+    def _rama(self, ruta):
+        rama = self.arbol
+        for etiqueta in ruta.split('/'):
+            rama = rama.hijos.setdefault(etiqueta, _RamaMapeo())
+        return rama
+
+    def _recorrer(self, nodo, rama, textos, listas, presentes):
+        for hijo in nodo:
+            sub = rama.hijos.get(hijo.tag)
+            if sub is None:
+                continue
+            for nombre in sub.campos:
+                if nombre not in textos:
+                    textos[nombre] = hijo.text.strip() if hijo.text else None
+            for nombre in sub.listas:
+                listas[nombre].append(self.listas[nombre][1].extraer(hijo))
+            presentes.update(sub.nodos)
+            if sub.hijos:
+                self._recorrer(hijo, sub, textos, listas, presentes)
+
+    def extraer(self, nodo):
+        """Devuelve {nombre: valor} para todos los campos, listas y nodos de la tabla en una sola pasada"""
+        textos = {}
+        listas = {nombre: [] for nombre in self.listas}
+        presentes = set()
+        self._recorrer(nodo, self.arbol, textos, listas, presentes)
+
+        valores = {}
+        for nombre, (_, defecto, conversion) in self.campos.items():
+            valor = textos.get(nombre)
+            if valor is None:
+                valor = defecto
+            valores[nombre] = conversion(valor) if conversion else valor
+        valores.update(listas)
+        for nombre in self.nodos:
+            valores[nombre] = nombre in presentes
+        return valores
+
+MAPEO_CONTRATO = MapeoXml({
+    "cif": ('DATOS_EMPRESA/CIF_NIF_EMPRESA/CIF_NIF', "", None),
+    "ccc": ('DATOS_EMPRESA/CODIGO_CUENTA_COTIZACION', "", None),
+    "identificador": ('DATOS_TRABAJADOR/IDENTIFICADORPFISICA', "", None),
+    "nombre": ('DATOS_TRABAJADOR/NOMBRE_APELLIDOS/NOMBRE', "", None),
+    "apellido1": ('DATOS_TRABAJADOR/NOMBRE_APELLIDOS/PRIMER_APELLIDO', "", None),
+    "apellido2": ('DATOS_TRABAJADOR/NOMBRE_APELLIDOS/SEGUNDO_APELLIDO', "", None),
+    "sexo": ('DATOS_TRABAJADOR/SEXO', '0', int),
+    "fecha_nacimiento": ('DATOS_TRABAJADOR/FECHA_NACIMIENTO', "", formatear_fecha),
+    "nacionalidad": ('DATOS_TRABAJADOR/NACIONALIDAD', '0', int),
+    "municipio": ('DATOS_TRABAJADOR/MUNICIPIO_RESIDENCIA', '0', int),
+    "pais_residencia": ('DATOS_TRABAJADOR/PAIS_RESIDENCIA', '0', int),
+    "nss": ('DATOS_TRABAJADOR/NUMERO_SEGURIDAD_SOCIAL', "", None),
+    "nivel_formativo": ('DATOS_GENERALES_CONTRATO/NIVEL_FORMATIVO', '0', int),
+    "ocupacion": ('DATOS_GENERALES_CONTRATO/CODIGO_OCUPACION', "", None),
+    "nacionalidad_contrato": ('DATOS_GENERALES_CONTRATO/NACIONALIDAD_CT', '0', int),
+    "municipio_contrato": ('DATOS_GENERALES_CONTRATO/MUNICIPIO_CT', '0', int),
+    "real_decreto_1435_1985": ('DATOS_GENERALES_CONTRATO/REAL_DECRETO_1435_1985', "", None),
+    "convenio_colectivo": ('DATOS_GENERALES_CONTRATO/IND_CONVENIO_COLECTIVO', "", None),
+    "fecha_inicio": ('DATOS_GENERALES_CONTRATO/FECHA_INICIO', "", formatear_fecha),
+    "indicativo_prtr": ('DATOS_GENERALES_CONTRATO/INDICATIVO_PRTR', "", None),
+    "fecha_fin": ('DATOS_GENERALES_CONTRATO/FECHA_TERMINO', "", formatear_fecha),
+    "causa_sustitucion": ('DATOS_CONTRATO_SUSTITUCION/CAUSA_SUSTITUCION', "", None),
+    "horas_formacion": ('DATOS_CONTRATO_TIEMPO_PARCIAL/HORAS_FORMACION', '0', None),
+    "tipo_jornada": ('DATOS_CONTRATO_TIEMPO_PARCIAL/TIPO_JORNADA', "", None),
+    "horas_jornada": ('DATOS_CONTRATO_TIEMPO_PARCIAL/HORAS_JORNADA', "0", None),
+    # IND_ERE no existe en el XML, asumimos "N" (No)
+    "indicador_ere": ('DATOS_PRESTACIONES/IND_ERE', 'N', None),
+    "tipo_firma": ('DATOS_COMUNICA_COPIA_BASICA/TIPO_FIRMA', "", None),
+    "texto_copia_basica": ('DATOS_COMUNICA_COPIA_BASICA/TEXTO_COPIABASICA', "", None),
+    "domicilio_centro_trabajo": ('DATOS_COMUNICA_COPIA_BASICA/DOMIC_CENTRO_TRABAJO', "", None),
+})
+
+MAPEO_LLAMAMIENTO = MapeoXml({
+    "cif": ('DATOS_EMPRESA/CIF_NIF_EMPRESA/CIF_NIF', "", None),
+    "ccc": ('DATOS_EMPRESA/CCC', "", None),
+    "identificador": ('DATOS_TRABAJADOR/IDENTIFICADORPFISICA', "", None),
+    "nombre": ('DATOS_TRABAJADOR/NOMBRE_APELLIDOS/NOMBRE', "", None),
+    "apellido1": ('DATOS_TRABAJADOR/NOMBRE_APELLIDOS/PRIMER_APELLIDO', "", None),
+    "apellido2": ('DATOS_TRABAJADOR/NOMBRE_APELLIDOS/SEGUNDO_APELLIDO', "", None),
+    "sexo": ('DATOS_TRABAJADOR/SEXO', '0', int),
+    "fecha_nacimiento": ('DATOS_TRABAJADOR/FECHA_NACIMIENTO', "", formatear_fecha),
+    "nacionalidad": ('DATOS_TRABAJADOR/NACIONALIDAD', '0', int),
+    "municipio": ('DATOS_TRABAJADOR/MUNICIPIO_RESIDENCIA', '0', int),
+    "pais_residencia": ('DATOS_TRABAJADOR/PAIS_RESIDENCIA', '0', int),
+    "nss": ('DATOS_TRABAJADOR/NUMERO_SEGURIDAD_SOCIAL', '0', None),
+    "fecha_inicio": ('DATOS_LLAMAMIENTO/FECHA_INICIO', "", formatear_fecha),
+    "fecha_fin": ('DATOS_LLAMAMIENTO/FECHA_FIN', "", formatear_fecha),
+    "nivel_formativo": ('DATOS_LLAMAMIENTO/NIVEL_FORMATIVO', '0', int),
+    "ocupacion": ('DATOS_LLAMAMIENTO/CODIGO_OCUPACION', '0', int),
+    "question": ('DATOS_LLAMAMIENTO/IND_INCORPORA_ACTIVIDAD', "", None),
+    "sepeId": ('DATOS_LLAMAMIENTO/CLAVE_CONTRATO_TRANS', "", None),
+})
+
+MAPEO_PRORROGA = MapeoXml({
+    "cif": ('DATOS_EMPRESA/CIF_NIF_EMPRESA/CIF_NIF', "", None),
+    "ccc": ('DATOS_EMPRESA/CCC', "", None),
+    "dni": ('DATOS_USOLIBRE_EMPRESA/USOLIBRE_EMPRESA', "", None),
+    "fecha_inicio_cto": ('DATOS_GENERALES_PRORROGA/FECHA_INICIO_CTO', "", formatear_fecha),
+    "fecha_inicio": ('DATOS_GENERALES_PRORROGA/FECHA_INICIO', "", formatear_fecha),
+    "fecha_fin": ('DATOS_GENERALES_PRORROGA/FECHA_FIN', "", formatear_fecha),
+    "convenio_colectivo": ('DATOS_GENERALES_PRORROGA/INDICADOR_CONV_COL', "", None),
+})
+
+MAPEO_TRANSFORMACION = MapeoXml({
+    "cif": ('DATOS_EMPRESA/CIF_NIF_EMPRESA/CIF_NIF', "", None),
+    "ccc": ('DATOS_EMPRESA/CODIGO_CUENTA_COTIZACION', "", None),
+    "identificador": ('DATOS_CONTRATO/IDENTIFICADORPFISICA', "", None),
+    "fecha_inicio_cto": ('DATOS_CONTRATO/FECHA_INICIO_CTO', "", formatear_fecha),
+    "clave_contrato": ('DATOS_CONTRATO/CLAVE_CONTRATO', "", None),
+    "fecha_inicio": ('DATOS_GENERALES_TRANSFORMACION/FECHA_INICIO', "", formatear_fecha),
+    "codigo_ocupacion": ('DATOS_GENERALES_TRANSFORMACION/CODIGO_OCUPACION', "", None),
+    "tipo_firma": ('DATOS_COMUNICA_COPIA_BASICA/TIPO_FIRMA', "", None),
+    "texto_copia_basica": ('DATOS_COMUNICA_COPIA_BASICA/TEXTO_COPIABASICA', "Vacio", None),
+    "domicilio_centro_trabajo": ('DATOS_COMUNICA_COPIA_BASICA/DOMIC_CENTRO_TRABAJO', "", None),
+    "tipo_jornada": ('DATOS_CONTRATO_TIEMPO_PARCIAL/TIPO_JORNADA', "", None),
+    "horas_jornada": ('DATOS_CONTRATO_TIEMPO_PARCIAL/HORAS_JORNADA', 0, int),
+}, nodos={
+    "tiempo_parcial": 'DATOS_CONTRATO_TIEMPO_PARCIAL',
+})
+
+MAPEO_PERIODO = MapeoXml({
+    "TipoDistribucion": ('TipoDistribucion', "", None),
+    "FechaInicioPeriodo": ('FechaInicioPeriodo', "", formatear_fecha),
+    "FechaFinPeriodo": ('FechaFinPeriodo', "", formatear_fecha),
+    "NumeroDiasTrabajadosPorSemanaOPeriodo": ('NumeroDiasTrabajadosPorSemanaOPeriodo', "", None),
+})
+
+MAPEO_COTIZACION = MapeoXml({
+    "Ano": ('Ano', "", None),
+    "Mes": ('Mes', "", None),
+    "NumDiasCotizados": ('NumDiasCotizados', "", None),
+    "BaseCotizacionDesempleo": ('BaseCotizacionDesempleo', "", None),
+})
+
+# Campos del certificado de empresa agrupados por bloque de salida; el orden es el del payload
+CAMPOS_REPRESENTANTE = ("CIF_NIF", "Nombre", "Apellido1", "Apellido2", "Cargo")
+CAMPOS_EMPRESA = ("CIF_NIF", "CCC")
+CAMPOS_TRABAJADOR = ("DNI_NIE", "Nombre", "Apellido1", "Apellido2", "NumSS", "GrupoCotizacion", "TipoContrato",
+                     "DuracionContrato", "IndicadorDuracionContrato", "CodProfesion", "FechaAltaEmpresa",
+                     "CodCausaSuspension", "FechaSuspensionExtincion", "DiasSalarioTramitacion")
+FECHAS_TRABAJADOR = ("FechaAltaEmpresa", "FechaSuspensionExtincion")
+
+def _campos_bloque(bloque, campos, fechas=()):
+    tabla = {}
+    for campo in campos:
+        tabla[f"{bloque}/{campo}"] = (f"{bloque}/{campo}", "", formatear_fecha if campo in fechas else None)
+    return tabla
+
+MAPEO_CERTIFICADO = MapeoXml(
+    {
+        **_campos_bloque("Datos_Representante", CAMPOS_REPRESENTANTE),
+        **_campos_bloque("Datos_Empresa", CAMPOS_EMPRESA),
+        **_campos_bloque("Datos_Trabajador", CAMPOS_TRABAJADOR, FECHAS_TRABAJADOR),
+    },
+    listas={
+        "periodos": ('Datos_Trabajador/DistribucionJornadas/Periodo', MAPEO_PERIODO),
+        "cotizaciones": ('Datos_Trabajador/Datos_Cotizacion', MAPEO_COTIZACION),
+    },
+    nodos={
+        "Datos_Representante": 'Datos_Representante',
+        "Datos_Empresa": 'Datos_Empresa',
+        "Datos_Trabajador": 'Datos_Trabajador',
+        "DistribucionJornadas": 'Datos_Trabajador/DistribucionJornadas',
+    }
+)
+
+MAPEO_ALTA = MapeoXml({
+    "tipo_documento": ('TIPODOC', "", None),
+    "ccc": ('CCC', "", None),
+    "dni": ('NIF_NIE', "", None),
+    "fecha_inicio": ('FECHA_ALTA', "", formatear_fecha),
+})
+
+def tratar_sepeId(sepeId):
+    if not sepeId:
+        return ""
+    
+    sepeId = sepeId.strip()
+
+    if re.fullmatch(r"E-\d{2}-\d{4}-\d{7}", sepeId) or re.fullmatch(r"E-\d{2}-\d{4}-\d{6}", sepeId):
+        return sepeId
+    
+    
+    solo_numeros = re.sub(r"\D", "", sepeId)
+    
+    if not sepeId.startswith("E-"):
+        return f"E-{solo_numeros[0:2]}-{solo_numeros[2:6]}-{solo_numeros[6:]}"
+    else:
+        return ""
+
+def normalizar_texto(texto: str) -> str:
+    if not texto:
+        return ""
+
+    try:
+        bytes_texto = texto.encode('iso-8859-1')
+        texto = bytes_texto.decode('utf-8')
+    except (UnicodeDecodeError, UnicodeEncodeError):
+        pass
+
+    texto = re.sub(r'\s+', ' ', texto)
+
+    # Quita espacios al inicio y final
+    return texto.strip()
+
+def contrato_a_payload(contrato_node):
+    """Convierte un nodo CONTRATO_XXX en el payload de /sepe/contrata"""
+    cod_contrato = int(contrato_node.tag.split('_')[1])
+    datos = MAPEO_CONTRATO.extraer(contrato_node)
+
+    ccc_completo = datos["ccc"]
+    regimen_empresa = ccc_completo[:4]
+    ccc_empresa = ccc_completo[4:]
+    
+    identificador = datos["identificador"]
+    tipo_documento = identificador[0] if identificador else ""
+    numero_documento = identificador[1:] if identificador else ""
+
+    nss = datos["nss"]
+    # Asegura que el NSS tenga 12 dígitos, rellenando con ceros a la izquierda si es necesario
+    if nss:
+        nss = nss.zfill(12)
+    else:
+        nss = 0 
+    
+    real_decreto_1435_1985 = ""
+    if cod_contrato in CONTRATOS_REAL_DECRETO:
+        real_decreto_1435_1985 = datos["real_decreto_1435_1985"]
+
+    collectiveAgreement = datos["convenio_colectivo"]
+    causa_sustitucion = datos["causa_sustitucion"]
+
+    horas_formacion = 0
+    minutos_formacion = 0
+
+    if cod_contrato in CONTRATOS_HORAS_FORMACION:
+        horas_formacion = int(datos["horas_formacion"])
+        minutos_formacion = 1
+        
+    indicador_ere = datos["indicador_ere"]
+    fecha_fin = datos["fecha_fin"]
+
+    texto_copia_basica = normalizar_texto(datos["texto_copia_basica"])
+
+    payload_api = {
+        "cif": datos["cif"],
+        "regimen": regimen_empresa,
+        "ccc": ccc_empresa,
+        "docType": tipo_documento,
+        "dni": numero_documento,
+        "name": datos["nombre"],
+        "surname": datos["apellido1"],
+        "lastSurname": datos["apellido2"],
+        "sex": datos["sexo"],
+        "dateOfBirth": datos["fecha_nacimiento"],
+        "nationality": datos["nacionalidad"],
+        "municipality": datos["municipio"],
+        "PAIS_RESIDENCIA": datos["pais_residencia"],
+        "nss": nss,
+        "nivelFormativo": datos["nivel_formativo"],
+        "occupation": datos["ocupacion"],
+        "nationalityContract": datos["nacionalidad_contrato"],
+        "municipalityContract": datos["municipio_contrato"],
+        "codContract": cod_contrato,
+        "startDate": datos["fecha_inicio"],
+        "INDICATIVO_PRTR": datos["indicativo_prtr"],
+        "copyBasic": {
+            "TIPO_FIRMA": datos["tipo_firma"],
+            "TEXTO_COPIABASICA": texto_copia_basica,
+            "DOMIC_CENTRO_TRABAJO": datos["domicilio_centro_trabajo"]
+        },
+        "duplicate": 1
+    }
+    if real_decreto_1435_1985 and real_decreto_1435_1985 != "":
+        payload_api["REAL_DECRETO_1435_1985"] = real_decreto_1435_1985
+
+    if collectiveAgreement and collectiveAgreement != "":
+        payload_api["collectiveAgreement"] = collectiveAgreement
+
+    if horas_formacion > 0:
+        payload_api["HORAS_FORMACION"] = horas_formacion
+
+    if minutos_formacion > 0:
+        payload_api["jornadaFormativaMin"] = minutos_formacion
+    
+    if indicador_ere is not None:
+        payload_api["IND_ERE"] = indicador_ere
+
+    if causa_sustitucion:
+        payload_api["sustitucion"] = causa_sustitucion
+    
+    if fecha_fin:
+        payload_api["endDate"] = fecha_fin
+
+    if cod_contrato in TIEMPO_PARCIAL:
+        horas_jornada = datos["horas_jornada"]
+        payload_api["jornadaType"] = datos["tipo_jornada"]
+        payload_api["jornadaHour"] = horas_jornada[:4]
+        payload_api["jornadaMin"] = horas_jornada[4:]
+
+    return payload_api
+
+def transformacion_a_payload(transformacion_node):
+    """Convierte un nodo TRANSFORMACION_XXX en el payload de /sepe/transformation"""
+    cod_contrato = int(transformacion_node.tag.split('_')[1])
+    datos = MAPEO_TRANSFORMACION.extraer(transformacion_node)
+
+    payload_api = {
+        "TIPO_CONTRATO": cod_contrato,
+        "DATOS_EMPRESA": {
+            "CODIGO_CUENTA_COTIZACION": datos["ccc"]
+        },
+        "DATOS_CONTRATO": {
+            "IDENTIFICADORPFISICA": datos["identificador"],
+            "FECHA_INICIO_CTO": datos["fecha_inicio_cto"],
+            "CLAVE_CONTRATO": tratar_sepeId(datos["clave_contrato"])
+        },
+        "DATOS_GENERALES_TRANSFORMACION": {
+            "FECHA_INICIO": datos["fecha_inicio"],
+            "CODIGO_OCUPACION": datos["codigo_ocupacion"]
+        },
+        "DATOS_COMUNICA_COPIA_BASICA": {
+            "TIPO_FIRMA": datos["tipo_firma"],
+            "TEXTO_COPIABASICA": datos["texto_copia_basica"],
+            "DOMIC_CENTRO_TRABAJO": datos["domicilio_centro_trabajo"]
+        },
+        "duplicate": 1
+    }
+
+    if datos["tiempo_parcial"]:
+        payload_api["DATOS_CONTRATO_TIEMPO_PARCIAL"] = {
+            "TIPO_JORNADA": datos["tipo_jornada"],
+            "HORAS_JORNADA": datos["horas_jornada"]
+        }
+
+    return payload_api
+
+def prorroga_a_payload(prorroga_node):
+    """Convierte el nodo PRORROGA_TIPO en el payload de /sepe/prorroga"""
+    datos = MAPEO_PRORROGA.extraer(prorroga_node)
+    ccc_completo = datos["ccc"]
+
+    return {
+        "cif": datos["cif"],
+        "regimen": ccc_completo[:4],
+        "ccc": ccc_completo[4:],
+        "dni": datos["dni"],
+        "old_startDate": datos["fecha_inicio_cto"],
+        "startDate": datos["fecha_inicio"],
+        "endDate": datos["fecha_fin"],
+        "prorroga_exist_convenio": datos["convenio_colectivo"],
+        "duplicate": 1
+    }
+
+def llamamiento_a_payload(llamamiento_node):
+    """Convierte el nodo LLAMAMIENTO_TIPO en el payload de /sepe/llamamientos"""
+    datos = MAPEO_LLAMAMIENTO.extraer(llamamiento_node)
+    ccc_completo = datos["ccc"]
+
+    identificador = datos["identificador"]
+    tipo_documento = identificador[0] if identificador else ""
+    numero_documento = identificador[1:] if identificador else ""
+
+    nss = datos["nss"]
+    if nss:
+        nss = nss.zfill(12)
+    else:
+        nss = 0                
+
+    return {
+        "cif": datos["cif"],
+        "regimen": ccc_completo[:4],
+        "ccc": ccc_completo[4:],
+        "duplicate": 1,
+        "employees": [
+            {
+                "doc": numero_documento,
+                "docType": tipo_documento,
+                "name": datos["nombre"],
+                "surname": datos["apellido1"],
+                "lastSurname": datos["apellido2"],
+                "nss": nss,
+                "sex": datos["sexo"],
+                "dateOfBirth": datos["fecha_nacimiento"],
+                "nationality": datos["nacionalidad"],
+                "municipality": datos["municipio"],
+                "country": datos["pais_residencia"],
+                "startDate": datos["fecha_inicio"],
+                "endDate": datos["fecha_fin"],
+                "nivelFormativo": datos["nivel_formativo"],
+                "question": datos["question"],
+                "occupation": datos["ocupacion"],
+                "sepeId": tratar_sepeId(datos["sepeId"])
+            }
+        ]
+    }
+
+# Conversor de cada registro según la raíz del XML y, si procede, etiqueta de los registros
+CONVERSORES_REGISTRO = {
+    "CONTRATOS": contrato_a_payload,
+    "TRANSFORMACIONES": transformacion_a_payload,
+    "LLAMAMIENTOS": llamamiento_a_payload,
+    "PRORROGAS": prorroga_a_payload
+}
+ETIQUETAS_REGISTRO = {
+    "LLAMAMIENTOS": "LLAMAMIENTO_TIPO",
+    "PRORROGAS": "PRORROGA_TIPO"
+}
+
+# Etiqueta de apertura de los registros de primer nivel de cada tipo, para repartir un XML por bytes
+APERTURAS_REGISTRO = {
+    "CONTRATOS": re.compile(rb"<CONTRATO_\d+[\s/>]"),
+    "TRANSFORMACIONES": re.compile(rb"<TRANSFORMACION_\d+[\s/>]"),
+    "LLAMAMIENTOS": re.compile(rb"<LLAMAMIENTO_TIPO[\s/>]"),
+    "PRORROGAS": re.compile(rb"<PRORROGA_TIPO[\s/>]")
+}
+
+def convertir_registros(tipo_raiz, nodos):
+    """Convierte los registros (nodos de primer nivel) de un XML de tipo 'tipo_raiz' en sus payloads"""
+    conversor = CONVERSORES_REGISTRO[tipo_raiz]
+    etiqueta = ETIQUETAS_REGISTRO.get(tipo_raiz)
+    return [conversor(nodo) for nodo in nodos if etiqueta is None or nodo.tag == etiqueta]
+
+def bloques_registros(path_xml, registros_por_bloque: int):
+    """
+    Reparte el XML en bloques de 'registros_por_bloque' registros consecutivos sin analizarlo: busca en
+    los bytes la etiqueta de apertura de cada registro (APERTURAS_REGISTRO). Devuelve (raíz, cabecera,
+    [(inicio, fin)], registros), con 'cabecera' los bytes hasta la etiqueta de apertura de la raíz incluida.
+    """
+    with open(path_xml, "rb") as f:
+        contenido = f.read()
+
+    tipo_raiz = None
+    for _, nodo in ET.iterparse(io.BytesIO(contenido), events=("start",)):
+        tipo_raiz = nodo.tag
+        break
+    if tipo_raiz not in APERTURAS_REGISTRO:
+        raise ValueError(f"El XML '{path_xml}' de tipo {tipo_raiz} no admite lectura por registros")
+
+    fin_cabecera = contenido.index(b">", contenido.index(b"<" + tipo_raiz.encode())) + 1
+    cierre_raiz = contenido.rindex(b"</" + tipo_raiz.encode())
+    inicios = [apertura.start() for apertura in APERTURAS_REGISTRO[tipo_raiz].finditer(contenido, fin_cabecera, cierre_raiz)]
+    limites = inicios[::registros_por_bloque] + [cierre_raiz]
+    return tipo_raiz, contenido[:fin_cabecera], list(zip(limites[:-1], limites[1:])), len(inicios)
+
+def convertir_bloque(path_xml, tipo_raiz, cabecera: bytes, inicio: int, fin: int):
+    """
+    Lee y convierte los registros entre los bytes 'inicio' y 'fin' del XML (un bloque de bloques_registros).
+    Se ejecuta en los procesos de SaltraClient.xml_a_registros: cada uno analiza solo su parte del fichero.
+    """
+    with open(path_xml, "rb") as f:
+        f.seek(inicio)
+        cuerpo = f.read(fin - inicio)
+    raiz = ET.fromstring(cabecera + cuerpo + f"</{tipo_raiz}>".encode())
+    return convertir_registros(tipo_raiz, raiz)
@@ -28,6 +28,17 @@ class TestErrores(unittest.TestCase):
         self.passw = "test_password"
         self.code_respuesta = "ISO8859-1"
         self.tiempo_inicio = time.time()
+
+        # Registro de envíos, catálogo, circuitos y cola propios de cada test (no los del usuario)
+        import tempfile
+        directorio_local = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio_local.cleanup)
+        for parche in (patch('dsenviosaltra_envios.RUTA_REGISTRO_ENVIOS', os.path.join(directorio_local.name, "envios.sqlite")),
+                       patch('dsenviosaltra_catalogo.RUTA_CATALOGO', os.path.join(directorio_local.name, "catalogos.sqlite")),
+                       patch('dsenviosaltra_circuito.RUTA_CIRCUITOS', os.path.join(directorio_local.name, "circuitos.sqlite")),
+                       patch('dsenviosaltra_circuito.RUTA_COLA_OFFLINE', os.path.join(directorio_local.name, "pendientes"))):
+            parche.start()
+            self.addCleanup(parche.stop)
     
     def _crear_guion_temporal(self, contenido):
         """Crea un archivo guion temporal para testing"""
@@ -46,7 +57,7 @@ class TestErrores(unittest.TestCase):
                 self.passw, guion_inexistente, self.code_respuesta, self.tiempo_inicio
             )
     
-    @patch('dsenviosaltra.requests.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
     def test_error_json_invalido_en_guion(self, mock_post):
         """Test: Error cuando el JSON en el guion es inválido"""
         contenido_guion = """[url]
@@ -83,7 +94,7 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
     def test_error_credenciales_incorrectas(self, mock_post):
         """Test: Error cuando las credenciales de login son incorrectas"""
         contenido_guion = """[url]
@@ -119,8 +130,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_respuesta_api_400(self, mock_request, mock_post):
         """Test: Error cuando la API devuelve 400 Bad Request"""
         contenido_guion = """[url]
@@ -174,8 +185,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_respuesta_api_500(self, mock_request, mock_post):
         """Test: Error cuando la API devuelve 500 Internal Server Error"""
         contenido_guion = """[url]
@@ -226,7 +237,7 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
     def test_error_certificado_faltante(self, mock_post):
         """Test: Error cuando falta el certificado en el JSON"""
         contenido_guion = """[url]
@@ -261,7 +272,7 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
     def test_error_certificado_base64_invalido(self, mock_post):
         """Test: Error cuando el certificado Base64 es inválido"""
         contenido_guion = """[url]
@@ -297,8 +308,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.get')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.get')
     def test_error_metodo_no_soportado_certificado(self, mock_get, mock_post):
         """Test: Error cuando se usa un método no soportado para certificado"""
         contenido_guion = """[url]
@@ -329,8 +340,8 @@ PATCH
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.get')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.get')
     def test_error_metodo_no_soportado_cliente(self, mock_get, mock_post):
         """Test: Error cuando se usa un método no soportado para cliente"""
         contenido_guion = """[url]
@@ -361,8 +372,8 @@ PATCH
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     @patch('dsenviosaltra.ET.parse')
     def test_error_xml_no_existe(self, mock_parse, mock_request, mock_post):
         """Test: Error cuando el archivo XML referenciado no existe"""
@@ -408,8 +419,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_datos_string_no_json(self, mock_request, mock_post):
         """Test: Error cuando el campo 'datos' es un string que no es JSON válido"""
         contenido_guion = """[url]
@@ -447,8 +458,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.get')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.get')
     def test_error_cliente_json_invalido(self, mock_get, mock_post):
         """Test: Error cuando el JSON de cliente es inválido"""
         contenido_guion = """[url]
@@ -487,8 +498,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.delete')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.delete')
     def test_error_borrar_cliente_sin_parametro(self, mock_delete, mock_post):
         """Test: Error al borrar cliente sin parámetro"""
         contenido_guion = """[url]
@@ -524,8 +535,8 @@ DELETE
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_timeout_conexion(self, mock_request, mock_post):
         """Test: Error cuando hay timeout en la conexión"""
         contenido_guion = """[url]
@@ -572,8 +583,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_cond_desempleado_invalido(self, mock_request, mock_post):
         """Test: Error cuando cond_desempleado tiene un valor inválido"""
         contenido_guion = """[url]
@@ -621,8 +632,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_faltan_campos_obligatorios(self, mock_request, mock_post):
         """Test: Error cuando faltan campos obligatorios en el JSON"""
         contenido_guion = """[url]
@@ -672,8 +683,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_fecha_invalida(self, mock_request, mock_post):
         """Test: Error cuando la fecha tiene formato inválido"""
         contenido_guion = """[url]
@@ -724,8 +735,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_ccc_invalido(self, mock_request, mock_post):
         """Test: Error cuando el CCC tiene formato inválido"""
         contenido_guion = """[url]
@@ -774,8 +785,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_dni_invalido(self, mock_request, mock_post):
         """Test: Error cuando el DNI tiene formato inválido"""
         contenido_guion = """[url]
@@ -825,8 +836,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_nss_invalido(self, mock_request, mock_post):
         """Test: Error cuando el NSS tiene formato inválido"""
         contenido_guion = """[url]
@@ -876,8 +887,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_duplicate_sin_campos_requeridos(self, mock_request, mock_post):
         """Test: Error en duplicate-ta cuando faltan campos requeridos"""
         contenido_guion = """[url]
@@ -926,8 +937,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_category_professional_invalido(self, mock_request, mock_post):
         """Test: Error cuando category_professional tiene valor inválido"""
         contenido_guion = """[url]
@@ -982,8 +993,8 @@ PUT
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_ocupacion_invalida(self, mock_request, mock_post):
         """Test: Error cuando ocupacion tiene valor inválido"""
         contenido_guion = """[url]
@@ -1038,8 +1049,8 @@ PUT
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_copy_basic_sin_sepeid(self, mock_request, mock_post):
         """Test: Error en copy-basic cuando falta sepeId y otros campos"""
         contenido_guion = """[url]
@@ -1089,8 +1100,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_contrata_data_sin_fecha(self, mock_request, mock_post):
         """Test: Error en contrata/data cuando falta fecha"""
         contenido_guion = """[url]
@@ -1141,8 +1152,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_respuesta_no_json(self, mock_request, mock_post):
         """Test: Error cuando la respuesta de la API no es JSON"""
         contenido_guion = """[url]
@@ -1192,8 +1203,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_error_regimen_invalido(self, mock_request, mock_post):
         """Test: Error cuando el régimen tiene valor inválido"""
         contenido_guion = """[url]
@@ -1243,6 +1254,182 @@ GET
             os.unlink(guion_file)
 
 
+    @patch('dsenviosaltra_http.requests.Session.request')
+    def test_error_circuito_abierto_encola_guion(self, mock_session_request):
+        """Test: Con SEPE caído el circuito se abre, las peticiones fallan al momento y el guion queda en la cola offline"""
+        from dsenviosaltra_circuito import CircuitoBackend, CircuitoAbierto, cola_offline, vaciar_cola_offline, guiones_recuperables
+        from dsenviosaltra_http import TransporteSaltra
+        from dsenviosaltra_reintentos import PresupuestoReintentos
+
+        circuito = CircuitoBackend("sepe", umbral=2, espera=0.0)
+        transporte = TransporteSaltra()
+        url = "https://api.saltra.es/api/v4/sepe/copy-basic"
+        with patch.dict('dsenviosaltra_circuito.circuitos', {"sepe": circuito}), \
+             patch('dsenviosaltra_http.presupuesto_reintentos', PresupuestoReintentos(proporcion=0, minimo=0)):
+            mock_session_request.return_value = Mock(status_code=503, headers={})
+            transporte.get(url, headers={})
+            self.assertTrue(circuito.cerrado())
+            transporte.get(url, headers={})
+            self.assertFalse(circuito.cerrado())
+
+            # Cumplida la espera sale una única petición de prueba; si responde bien el circuito se cierra
+            self.assertTrue(circuito.permitir())
+            self.assertFalse(circuito.permitir())
+            with self.assertRaises(CircuitoAbierto):
+                transporte.get(url, headers={})
+            circuito.registrar(True)
+            self.assertTrue(circuito.cerrado())
+            self.assertEqual(mock_session_request.call_count, 2)
+
+        circuito = CircuitoBackend("sepe", umbral=1, espera=3600.0)
+        circuito.registrar(False)
+        contenido_guion = """[url]
+https://api.saltra.es/api/v4/sepe/llamamientos
+[metodo]
+POST
+[parametro]
+
+[fiche-out]
+/tmp/test/param_0104_circuito.txt
+
+[json envio]
+{
+	"certificado": "test",
+	"datos": {"cif": "B45532132"}
+}"""
+        guion_file = self._crear_guion_temporal(contenido_guion)
+        try:
+            with patch.dict('dsenviosaltra_circuito.circuitos', {"sepe": circuito}), \
+                 patch('dsenviosaltra_http.TransporteSaltra.post') as mock_post, \
+                 patch('dsenviosaltra_http.TransporteSaltra.request') as mock_request:
+                mock_post.return_value = Mock(status_code=200, json=lambda: {"data": {"access_token": "token"}})
+                client = SaltraClient(
+                    self.dsClave, self.usuario, self.idUsuario,
+                    self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+                )
+                with self.assertRaises(SystemExit):
+                    client.realizar_llamada_ss_sepe()
+                mock_request.assert_not_called()
+
+                with open("/tmp/test/param_0104_circuito.txt", encoding="iso-8859-1") as f:
+                    salida = f.read()
+                self.assertIn("STATUS ko", salida)
+                self.assertIn("circuito abierto", salida)
+                self.assertIn("Guion encolado", salida)
+                self.assertEqual(cola_offline.pendientes("sepe"), [client.encolado])
+                self.assertEqual(guiones_recuperables(), [])
+
+                # Recuperado el servicio, la cola se vacía ejecutando el guion encolado
+                circuito.registrar(True)
+                ejecutados = []
+                def ejecutar(guion):
+                    with open(guion, encoding="iso-8859-1") as f:
+                        ejecutados.append(f.read())
+                self.assertEqual(vaciar_cola_offline(ejecutar), 1)
+                self.assertEqual(ejecutados, [contenido_guion])
+                self.assertEqual(cola_offline.pendientes("sepe"), [])
+
+                # Un guion que falla (o cuyo proceso muere) a medias no se pierde: vuelve a la cola
+                encolado = cola_offline.encolar("sepe", guion_file)
+                def fallar(guion):
+                    raise RuntimeError("proceso interrumpido")
+                with self.assertRaises(RuntimeError):
+                    vaciar_cola_offline(fallar)
+                self.assertEqual(cola_offline.pendientes("sepe"), [])
+                en_curso = os.path.join(os.path.dirname(encolado), ".procesando", os.path.basename(encolado))
+                self.assertTrue(os.path.exists(en_curso))
+
+                # Mientras otro proceso lo tiene bloqueado no se toca
+                import fcntl
+                descriptor = os.open(en_curso, os.O_RDONLY)
+                fcntl.flock(descriptor, fcntl.LOCK_EX)
+                self.assertEqual(cola_offline.recuperar("sepe"), 0)
+                os.close(descriptor)
+
+                self.assertEqual(vaciar_cola_offline(ejecutar), 1)
+                self.assertEqual(ejecutados, [contenido_guion, contenido_guion])
+                self.assertFalse(os.path.exists(en_curso))
+
+                # Una invocación suelta de dsenviosaltra.py solo ejecuta ENCOLADOS_POR_INVOCACION
+                cola_offline.encolar("sepe", guion_file)
+                cola_offline.encolar("sepe", guion_file)
+                self.assertEqual(vaciar_cola_offline(ejecutar, maximo=1), 1)
+                self.assertEqual(len(cola_offline.pendientes("sepe")), 1)
+
+                # Con el circuito abierto, un envío que ya consta como aceptado se responde del registro sin encolar
+                from dsenviosaltra_envios import registro_envios, clave_envio
+                circuito.registrar(False)
+                self.assertTrue(circuito.abierto())
+                registro_envios.registrar(clave_envio(client.endpoint, "test", {"cif": "B45532132"}), client.endpoint,
+                                          {"success": True, "status": 200, "data": {"id": "LL-0001"}}, "/tmp/test/anterior.txt")
+                client = SaltraClient(
+                    self.dsClave, self.usuario, self.idUsuario,
+                    self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+                )
+                client.realizar_llamada_ss_sepe()
+                mock_request.assert_not_called()
+                self.assertIsNone(client.encolado)
+                with open("/tmp/test/param_0104_circuito.txt", encoding="iso-8859-1") as f:
+                    salida = f.read()
+                self.assertIn("LL-0001", salida)
+                self.assertIn("no se ha vuelto a enviar", salida)
+        finally:
+            os.unlink(guion_file)
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_error_copia_basica_tras_contrato_aceptado(self, mock_request, mock_post):
+        """Test: Si falla la copia básica de un contrato ya aceptado, el contrato queda registrado y aceptado y el lote sigue"""
+        import requests
+        from dsenviosaltra_respuestas import guardar_respuestas_contratos
+        contenido_guion = """[url]
+https://api.saltra.es/api/v4/sepe/contrata
+[metodo]
+POST
+[parametro]
+
+[fiche-out]
+/tmp/test/param_0105_copia.txt
+
+[json envio]
+{
+	"certificado": "test",
+	"datos": {}
+}"""
+        guion_file = self._crear_guion_temporal(contenido_guion)
+        try:
+            mock_post.return_value = Mock(status_code=200, json=lambda: {"data": {"access_token": "token"}})
+
+            def respuesta(method, url, headers=None, json=None, stream=False, renovador_token=None):
+                if url.endswith("/copy-basic") and json["dni"] == "1":
+                    raise requests.exceptions.ConnectionError("Conexión cerrada por el servidor")
+                return Mock(status_code=200, headers={}, json=lambda: {"success": True, "status": 200, "data": {"id": "C-" + json["dni"]}})
+            mock_request.side_effect = respuesta
+
+            client = SaltraClient(
+                self.dsClave, self.usuario, self.idUsuario,
+                self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+            )
+            respuestas = client.enviar_contratos([{"dni": "1"}, {"dni": "2"}], None, {})
+
+            self.assertEqual([item['numero'] for item in respuestas], [1, 2])
+            self.assertTrue(respuestas[0]['response']['success'])
+            self.assertIn("Copia básica no obtenida", respuestas[0]['response']['errors'])
+            self.assertTrue(respuestas[1]['response']['success'])
+            # Registrado como aceptado: al relanzar el lote no se vuelve a enviar
+            self.assertIsNotNone(client._envio_aceptado(client._clave_envio({"dni": "1"}, None)))
+
+            guardar_respuestas_contratos(respuestas, client.fich_respuesta, client.config, client.usuario,
+                                         client.endpoint, client.metodo, client.tiempo_inicio)
+            with open("/tmp/test/param_0105_copia.txt", encoding="utf-8") as f:
+                salida = f.read()
+            self.assertIn("Mensaje C-1", salida)
+            self.assertNotIn("RECHAZADO", salida)
+            self.assertIn("Copia básica no obtenida", salida)
+        finally:
+            os.unlink(guion_file)
+
+
 if __name__ == '__main__':
     unittest.main()
 
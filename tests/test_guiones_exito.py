@@ -31,6 +31,17 @@ class TestGuionesExito(unittest.TestCase):
         
         # Mock del token de autenticación
         self.mock_token = "mock_access_token_12345"
+
+        # Registro de envíos, catálogo, circuitos y cola propios de cada test (no los del usuario)
+        import tempfile
+        directorio_local = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio_local.cleanup)
+        for parche in (patch('dsenviosaltra_envios.RUTA_REGISTRO_ENVIOS', os.path.join(directorio_local.name, "envios.sqlite")),
+                       patch('dsenviosaltra_catalogo.RUTA_CATALOGO', os.path.join(directorio_local.name, "catalogos.sqlite")),
+                       patch('dsenviosaltra_circuito.RUTA_CIRCUITOS', os.path.join(directorio_local.name, "circuitos.sqlite")),
+                       patch('dsenviosaltra_circuito.RUTA_COLA_OFFLINE', os.path.join(directorio_local.name, "pendientes"))):
+            parche.start()
+            self.addCleanup(parche.stop)
         
     def _crear_guion_temporal(self, contenido):
         """Crea un archivo guion temporal para testing"""
@@ -52,11 +63,11 @@ class TestGuionesExito(unittest.TestCase):
         mock_response.text = json.dumps(data)
         return mock_response
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.get')
-    @patch('dsenviosaltra.requests.put')
-    @patch('dsenviosaltra.requests.delete')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.get')
+    @patch('dsenviosaltra_http.TransporteSaltra.put')
+    @patch('dsenviosaltra_http.TransporteSaltra.delete')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_01_alta_seg_social(self, mock_request, mock_delete, mock_put, mock_get, mock_post):
         """Test para guion_01: Alta en Seguridad Social"""
         contenido_guion = """[url]
@@ -113,11 +124,11 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.get')
-    @patch('dsenviosaltra.requests.put')
-    @patch('dsenviosaltra.requests.delete')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.get')
+    @patch('dsenviosaltra_http.TransporteSaltra.put')
+    @patch('dsenviosaltra_http.TransporteSaltra.delete')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_02_baja_seg_social(self, mock_request, mock_delete, mock_put, mock_get, mock_post):
         """Test para guion_02: Baja en Seguridad Social"""
         contenido_guion = """[url]
@@ -166,8 +177,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.get')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.get')
     def test_guion_subir_certificado(self, mock_get, mock_post):
         """Test para guion_subir_certificado: Subir certificado"""
         contenido_guion = """[url]
@@ -211,8 +222,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.get')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.get')
     def test_guion_obtener_certificados(self, mock_get, mock_post):
         """Test para guion_obtener_certificados: Obtener listado de certificados"""
         contenido_guion = """[url]
@@ -247,8 +258,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.delete')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.delete')
     def test_guion_borrar_certificado(self, mock_delete, mock_post):
         """Test para guion_borrar_certificado: Borrar certificado"""
         contenido_guion = """[url]
@@ -283,8 +294,8 @@ test_cert_secret
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.get')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.get')
     def test_guion_subir_clientes(self, mock_get, mock_post):
         """Test para guion_subir_clientes: Subir cliente"""
         contenido_guion = """[url]
@@ -334,8 +345,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.get')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.get')
     def test_guion_listado_clientes(self, mock_get, mock_post):
         """Test para guion_listado_clientes: Listar clientes"""
         contenido_guion = """[url]
@@ -369,8 +380,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.put')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.put')
     def test_guion_desactivar_cliente(self, mock_put, mock_post):
         """Test para guion_desactivar_cliente: Desactivar cliente"""
         contenido_guion = """[url]
@@ -408,8 +419,8 @@ PUT
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.delete')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.delete')
     def test_guion_borrar_clientes(self, mock_delete, mock_post):
         """Test para guion_borrar_clientes: Borrar cliente"""
         contenido_guion = """[url]
@@ -443,8 +454,8 @@ DELETE
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     @patch('dsenviosaltra.ET.parse')
     def test_guion_101_contrata(self, mock_parse, mock_request, mock_post):
         """Test para guion_101: Contrata con XML"""
@@ -503,8 +514,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     @patch('dsenviosaltra.ET.parse')
     def test_guion_104_llamamientos(self, mock_parse, mock_request, mock_post):
         """Test para guion_104: Llamamientos"""
@@ -558,8 +569,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_012_idc_info(self, mock_request, mock_post):
         """Test para guion_012: IDC Info for NSS"""
         contenido_guion = """[url]
@@ -602,8 +613,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_013_employees_enterprise(self, mock_request, mock_post):
         """Test para guion_013: Employees in Enterprise"""
         contenido_guion = """[url]
@@ -648,8 +659,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_04_contract_coeficiente(self, mock_request, mock_post):
         """Test para guion_04: Contract Coeficiente"""
         contenido_guion = """[url]
@@ -696,8 +707,8 @@ PUT
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_05_employee_situations(self, mock_request, mock_post):
         """Test para guion_05: Employee Situations"""
         contenido_guion = """[url]
@@ -739,8 +750,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_081_life_ccc(self, mock_request, mock_post):
         """Test para guion_081: Life CCC"""
         contenido_guion = """[url]
@@ -784,8 +795,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_06_report_situation_ccc(self, mock_request, mock_post):
         """Test para guion_06: Report Situation CCC"""
         contenido_guion = """[url]
@@ -826,8 +837,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_07_nss_by_ipf(self, mock_request, mock_post):
         """Test para guion_07: NSS by IPF"""
         contenido_guion = """[url]
@@ -869,8 +880,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_08_duplicate_ta(self, mock_request, mock_post):
         """Test para guion_08: Duplicate TA"""
         contenido_guion = """[url]
@@ -914,8 +925,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_020_category_professional(self, mock_request, mock_post):
         """Test para guion_020: Category Professional"""
         contenido_guion = """[url]
@@ -962,8 +973,8 @@ PUT
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_028_occupation(self, mock_request, mock_post):
         """Test para guion_028: Occupation"""
         contenido_guion = """[url]
@@ -1010,8 +1021,8 @@ PUT
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_062_informe_ita(self, mock_request, mock_post):
         """Test para guion_062: Informe ITA"""
         contenido_guion = """[url]
@@ -1052,8 +1063,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_082_life_affiliate(self, mock_request, mock_post):
         """Test para guion_082: Life Affiliate"""
         contenido_guion = """[url]
@@ -1095,8 +1106,8 @@ GET
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_101_copia_basica(self, mock_request, mock_post):
         """Test para guion_101_copia_basica: Copy Basic"""
         contenido_guion = """[url]
@@ -1148,8 +1159,8 @@ POST
         finally:
             os.unlink(guion_file)
     
-    @patch('dsenviosaltra.requests.post')
-    @patch('dsenviosaltra.requests.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
     def test_guion_111_contrata_data(self, mock_request, mock_post):
         """Test para guion_111: Contrata Data"""
         contenido_guion = """[url]
@@ -1193,6 +1204,1358 @@ GET
         finally:
             os.unlink(guion_file)
 
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_demonio_spool_reutiliza_token(self, mock_request, mock_post):
+        """Test para el demonio: procesa los guiones del spool con un único login"""
+        import tempfile
+        from dsenviosaltra_demonio import DsEnvioSaltraDemonio
+
+        with tempfile.TemporaryDirectory() as directorio:
+            spool = os.path.join(directorio, "spool")
+            for numero in (1, 2):
+                contenido_guion = f"""[url]
+https://api.saltra.es/api/v4/seg-social/employee-situations
+[metodo]
+GET
+[parametro]
+
+[fiche-out]
+{directorio}/salida/param_000{numero}.txt
+[json envio]
+{{
+        "certificado": "test_cert",
+        "datos":
+        {{
+                "regimen": "0111",
+                "ccc": "03141448363",
+                "dni": "23905114H"
+        }}
+}}"""
+                os.makedirs(spool, exist_ok=True)
+                with open(os.path.join(spool, f"guion_{numero}.txt"), "w", encoding="iso-8859-1") as f:
+                    f.write(contenido_guion)
+
+            mock_post.return_value = self._mock_respuesta_api_exitosa(
+                data={"data": {"access_token": self.mock_token}}
+            )
+            mock_request.return_value = self._mock_respuesta_api_exitosa(
+                data={"success": True, "data": {"situacion": "alta"}}
+            )
+
+            demonio = DsEnvioSaltraDemonio(
+                self.dsClave, self.usuario, self.idUsuario,
+                self.passw, spool, self.code_respuesta
+            )
+            for guion in demonio.guiones_pendientes():
+                self.assertEqual(demonio.procesar(demonio.reclamar(guion)), 0)
+
+            self.assertEqual(mock_post.call_count, 1)
+            self.assertEqual(sorted(os.listdir(os.path.join(spool, "procesados"))), ["guion_1.txt", "guion_2.txt"])
+            self.assertTrue(os.path.exists(os.path.join(directorio, "salida", "param_0001.txt")))
+            self.assertTrue(os.path.exists(os.path.join(directorio, "salida", "param_0002.fin")))
+
+    @patch('dsenviosaltra_http.requests.Session.request')
+    def test_transporte_compartido_pool_y_timeout(self, mock_session_request):
+        """Test para el transporte HTTP: una sola sesión con pool y timeouts por defecto"""
+        from dsenviosaltra_http import obtener_transporte, configurar_transporte
+
+        transporte = configurar_transporte(tamano_pool=25, timeout_conexion=5, timeout_lectura=60)
+        self.assertIs(obtener_transporte(), transporte)
+
+        adaptador = transporte.sesion.get_adapter("https://api.saltra.es")
+        self.assertEqual(adaptador._pool_maxsize, 25)
+        # Los reintentos son cosa de TransporteSaltra.request, no de urllib3
+        self.assertEqual(adaptador.max_retries.total, 0)
+
+        mock_session_request.return_value = self._mock_respuesta_api_exitosa()
+        obtener_transporte().get("https://api.saltra.es/api/web/v3/customer", headers={})
+        self.assertEqual(mock_session_request.call_args.kwargs["timeout"], (5, 60))
+
+        configurar_transporte()
+
+    @patch('dsenviosaltra_http.time.sleep')
+    @patch('dsenviosaltra_http.requests.Session.request')
+    def test_reintentos_por_politica_y_retry_after(self, mock_session_request, mock_sleep):
+        """Test para los reintentos: GET siempre, POST de envío solo con 429/503 y Retry-After, y presupuesto global"""
+        from dsenviosaltra_http import TransporteSaltra
+        from dsenviosaltra_reintentos import PresupuestoReintentos
+
+        def respuestas(*estados):
+            lista = []
+            for estado in estados:
+                estado, retry_after = estado if isinstance(estado, tuple) else (estado, None)
+                response = self._mock_respuesta_api_exitosa(status_code=estado)
+                if retry_after is not None:
+                    response.headers = {**response.headers, "Retry-After": retry_after}
+                lista.append(response)
+            mock_session_request.reset_mock()
+            mock_session_request.side_effect = lista
+
+        transporte = TransporteSaltra()
+        url_contrata = "https://api.saltra.es/api/v4/sepe/contrata"
+        # time.sleep está parcheado para todos los módulos: el limitador de los tests anteriores no debe esperar aquí
+        with patch('dsenviosaltra_http.presupuesto_reintentos', PresupuestoReintentos()), \
+             patch('dsenviosaltra_http.obtener_limitador'):
+            respuestas((503, "2"), 200)
+            response = transporte.get("https://api.saltra.es/api/v4/sepe/copy-basic", headers={})
+            self.assertEqual(response.status_code, 200)
+            mock_sleep.assert_called_once_with(2.0)
+
+            # Un envío que el servidor ha podido procesar no se repite
+            respuestas(502, 200)
+            self.assertEqual(transporte.post(url_contrata, headers={}).status_code, 502)
+            self.assertEqual(mock_session_request.call_count, 1)
+
+            respuestas(429, 200)
+            self.assertEqual(transporte.post(url_contrata, headers={}).status_code, 429)
+            self.assertEqual(mock_session_request.call_count, 1)
+
+            # Solo si indica con Retry-After que no lo ha procesado
+            respuestas((429, "1"), (503, "1"), 200)
+            self.assertEqual(transporte.post(url_contrata, headers={}).status_code, 200)
+            self.assertEqual(mock_session_request.call_count, 3)
+
+            # Un POST de consulta se repite como un GET
+            respuestas(502, 200)
+            self.assertEqual(transporte.post("https://api.saltra.es/api/v4/sepe/cno", headers={}).status_code, 200)
+
+            # Un Retry-After demasiado largo no se espera
+            respuestas((503, "3600"), 200)
+            self.assertEqual(transporte.get(url_contrata, headers={}).status_code, 503)
+
+        with patch('dsenviosaltra_http.presupuesto_reintentos', PresupuestoReintentos(proporcion=0, minimo=1)):
+            respuestas(503, 503, 503)
+            self.assertEqual(transporte.get(url_contrata, headers={}).status_code, 503)
+            self.assertEqual(mock_session_request.call_count, 2)
+
+    @patch('dsenviosaltra_limites.time.sleep')
+    def test_limitador_por_familia_y_certificado(self, mock_sleep):
+        """Test para el limitador de peticiones: cubos por familia de endpoints y por certificado compartidos entre hilos"""
+        import tempfile
+        from concurrent.futures import ThreadPoolExecutor
+        from dsenviosaltra_limites import LimitadorPeticiones, leer_limites, familia_endpoint
+
+        self.assertEqual(familia_endpoint("https://api.saltra.es/api/v4/seg-social/alta"), "seg-social")
+        self.assertEqual(familia_endpoint("https://api.saltra.es/api/v4/sepe/contrata"), "sepe")
+        self.assertIsNone(familia_endpoint("https://api.saltra.es/api/v4/auth/login"))
+
+        url_sepe = "https://api.saltra.es/api/v4/sepe/contrata"
+        limitador = LimitadorPeticiones({"sepe": (10.0, 2), "seg-social": (10.0, 2)}, None)
+        esperas = [limitador.esperar(url_sepe) for _ in range(3)]
+        self.assertEqual(esperas[:2], [0.0, 0.0])
+        self.assertAlmostEqual(esperas[2], 0.1, places=2)
+        # Otra familia tiene su propio cubo
+        self.assertEqual(limitador.esperar("https://api.saltra.es/api/v4/seg-social/alta"), 0.0)
+
+        # El cubo del certificado es común a todas las familias
+        limitador = LimitadorPeticiones({}, (1.0, 1))
+        self.assertEqual(limitador.esperar(url_sepe, {"X-Cert-Secret": "cert_a"}), 0.0)
+        self.assertGreater(limitador.esperar("https://api.saltra.es/api/web/v3/customer", {"X-Cert-Secret": "cert_a "}), 0.9)
+        self.assertEqual(limitador.esperar(url_sepe, {"X-Cert-Secret": "cert_b"}), 0.0)
+
+        # Varios hilos: cada uno reserva su turno y las esperas quedan escalonadas al ritmo del cubo
+        limitador = LimitadorPeticiones({"sepe": (100.0, 1)}, None)
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            esperas = sorted(pool.map(lambda _: limitador.esperar(url_sepe), range(10)))
+        self.assertEqual(esperas[0], 0.0)
+        self.assertGreater(esperas[-1], 0.05)
+        self.assertLessEqual(esperas[-1], 0.09 + 1e-9)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, "limites.json")
+            with open(ruta, "w", encoding="utf-8") as f:
+                json.dump({"familias": {"sepe": [20, 40], "customer": None}, "certificado": [3, 6]}, f)
+            limites_familia, limite_certificado = leer_limites(ruta)
+            self.assertEqual(limites_familia["sepe"], (20, 40))
+            self.assertIsNone(limites_familia["customer"])
+            self.assertEqual(limites_familia["seg-social"], (5.0, 10))
+            self.assertEqual(limite_certificado, (3, 6))
+
+    @patch('dsenviosaltra_http.requests.Session.request')
+    def test_concurrencia_adaptativa_aimd(self, mock_session_request):
+        """Test para el control AIMD: sube con respuestas sanas, baja con 429/5xx o latencia alta y limita los hilos"""
+        import threading
+        from dsenviosaltra_concurrencia import ControlConcurrencia, MIN_MUESTRAS
+        from dsenviosaltra_http import TransporteSaltra
+        from dsenviosaltra_reintentos import PresupuestoReintentos
+
+        control = ControlConcurrencia("sepe", 2, 1, 4, 1.0)
+        for _ in range(20):
+            control.liberar(control.adquirir(), 200)
+        self.assertEqual(control.limite, 4.0)
+
+        # Un 429 baja a la mitad; otro de una petición que salió antes de la bajada no vuelve a bajar
+        antigua = control.adquirir()
+        control.liberar(control.adquirir(), 429)
+        self.assertEqual(control.limite, 2.0)
+        control.liberar(antigua, 429)
+        self.assertEqual(control.limite, 2.0)
+
+        # p95 de la latencia por encima del objetivo: las respuestas lentas no suben el límite y acaban bajándolo
+        control = ControlConcurrencia("sepe", 4, 1, 4, 0.0)
+        for _ in range(MIN_MUESTRAS - 1):
+            control.liberar(control.adquirir(), 200)
+        self.assertEqual(control.limite, 4.0)
+        control.liberar(control.adquirir(), 200)
+        self.assertEqual(control.limite, 2.0)
+
+        # Las peticiones en curso nunca superan el límite, sea cual sea el número de hilos
+        control = ControlConcurrencia("seg-social", 2, 1, 2, 10.0)
+        en_curso, maximo = [0], [0]
+        lock = threading.Lock()
+
+        def peticion():
+            inicio = control.adquirir()
+            with lock:
+                en_curso[0] += 1
+                maximo[0] = max(maximo[0], en_curso[0])
+            time.sleep(0.01)
+            with lock:
+                en_curso[0] -= 1
+            control.liberar(inicio, 200)
+
+        hilos = [threading.Thread(target=peticion) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(maximo[0], 2)
+
+        # El transporte alimenta el control del backend de la URL; con [concurrencia] auto el lote usa su máximo
+        control = ControlConcurrencia("sepe", 4, 1, 16, 8.0)
+        with patch.dict('dsenviosaltra_concurrencia.controles_concurrencia', {"sepe": control}), \
+             patch('dsenviosaltra_http.presupuesto_reintentos', PresupuestoReintentos(proporcion=0, minimo=0)):
+            mock_session_request.return_value = self._mock_respuesta_api_exitosa(status_code=429)
+            TransporteSaltra().post("https://api.saltra.es/api/v4/sepe/contrata", headers={})
+            self.assertEqual(control.limite, 2.0)
+            self.assertEqual(control.en_curso, 0)
+
+            # Con stream=True el hueco sigue ocupado hasta leer entero el cuerpo o cerrar la respuesta
+            for terminar in (lambda response: list(response.iter_content(1024)), lambda response: response.close()):
+                respuesta = self._mock_respuesta_api_exitosa()
+                respuesta.iter_content.return_value = iter([b"{}"])
+                cerrar = respuesta.close
+                mock_session_request.return_value = respuesta
+                response = TransporteSaltra().post("https://api.saltra.es/api/v4/sepe/contrata", headers={}, stream=True)
+                self.assertEqual(control.en_curso, 1)
+                terminar(response)
+                response.close()
+                self.assertEqual(control.en_curso, 0)
+                cerrar.assert_called()
+
+            client = SaltraClient.__new__(SaltraClient)
+            client.concurrencia = SaltraClient.CONCURRENCIA_CONTRATOS
+            client.endpoint = "https://api.saltra.es/api/v4/sepe/contrata"
+            self.assertEqual(client._hilos_envio(), 1)
+            client.concurrencia = None
+            self.assertEqual(client._hilos_envio(), 16)
+
+    def _crear_jwt(self, segundos_validez):
+        """Crea un token con formato JWT y claim 'exp'"""
+        import base64
+        carga = json.dumps({"sub": self.usuario, "exp": int(time.time()) + segundos_validez}).encode()
+        return "cabecera." + base64.urlsafe_b64encode(carga).decode().rstrip("=") + ".firma"
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    def test_cache_tokens_evita_login_repetido(self, mock_post):
+        """Test para la caché de tokens: el segundo guion reutiliza el token guardado en disco"""
+        import tempfile
+        import stat
+        contenido_guion = """[url]
+https://api.saltra.es/api/web/v3/customer
+[metodo]
+GET
+[parametro]
+[fiche-out]
+/tmp/test/listaclientes.txt"""
+
+        guion_file = self._crear_guion_temporal(contenido_guion)
+        token_jwt = self._crear_jwt(3600)
+
+        try:
+            with tempfile.TemporaryDirectory() as directorio:
+                ruta_cache = os.path.join(directorio, "tokens.json")
+                with patch('dsenviosaltra_token.RUTA_CACHE_TOKENS', ruta_cache):
+                    mock_post.return_value = self._mock_respuesta_api_exitosa(
+                        data={"data": {"access_token": token_jwt}}
+                    )
+
+                    for _ in range(2):
+                        client = SaltraClient(
+                            self.dsClave, self.usuario, self.idUsuario,
+                            self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+                        )
+                        self.assertEqual(client.token, token_jwt)
+
+                    self.assertEqual(mock_post.call_count, 1)
+                    self.assertEqual(stat.S_IMODE(os.stat(ruta_cache).st_mode), 0o600)
+        finally:
+            os.unlink(guion_file)
+
+    @patch('dsenviosaltra_http.requests.Session.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    def test_token_renovado_tras_401(self, mock_post, mock_session_request):
+        """Test para la renovación de token: un 401 provoca un único login del cliente de la petición y se repite"""
+        contenido_guion = """[url]
+https://api.saltra.es/api/web/v3/customer
+[metodo]
+GET
+[parametro]
+[fiche-out]
+/tmp/test/listaclientes.txt"""
+
+        guion_file = self._crear_guion_temporal(contenido_guion)
+
+        try:
+            mock_post.side_effect = [
+                self._mock_respuesta_api_exitosa(data={"data": {"access_token": "token_viejo"}}),
+                self._mock_respuesta_api_exitosa(data={"data": {"access_token": "token_nuevo"}})
+            ]
+            mock_session_request.side_effect = [
+                self._mock_respuesta_api_exitosa(status_code=401, data={"message": "Unauthenticated."}),
+                self._mock_respuesta_api_exitosa()
+            ]
+
+            client = SaltraClient(
+                self.dsClave, self.usuario, self.idUsuario,
+                self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+            )
+            # Otro cliente del mismo proceso (modo demonio/lote) no interviene en la renovación
+            otro_client = SaltraClient(
+                self.dsClave, self.usuario, self.idUsuario,
+                self.passw, guion_file, self.code_respuesta, self.tiempo_inicio, token="token_otro"
+            )
+
+            from dsenviosaltra_http import obtener_transporte
+            response = obtener_transporte().get(client.endpoint, headers={'Authorization': f'Bearer {client.token}'},
+                                                renovador_token=client.renovar_token)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(client.token, "token_nuevo")
+            self.assertEqual(client.api_cliente.token, "token_nuevo")
+            self.assertEqual(otro_client.token, "token_otro")
+            self.assertEqual(mock_post.call_count, 2)
+            self.assertEqual(mock_session_request.call_args.kwargs["headers"]["Authorization"], "Bearer token_nuevo")
+        finally:
+            os.unlink(guion_file)
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_contratos_concurrentes_mantienen_orden(self, mock_request, mock_post):
+        """Test para el envío concurrente de contratos: las respuestas se devuelven en orden de 'numero'"""
+        contenido_guion = """[url]
+https://api.saltra.es/api/v4/sepe/contrata
+[metodo]
+POST
+[parametro]
+
+[concurrencia]
+4
+[fiche-out]
+/tmp/test/param_0101.txt
+
+[json envio]
+{
+	"certificado": "test_cert",
+	"datos": {}
+}"""
+
+        guion_file = self._crear_guion_temporal(contenido_guion)
+
+        try:
+            mock_post.return_value = self._mock_respuesta_api_exitosa(
+                data={"data": {"access_token": self.mock_token}}
+            )
+
+            def respuesta_retardada(method, url, headers, json, stream=False, renovador_token=None):
+                # Los primeros contratos tardan más, así terminan fuera de orden
+                time.sleep(0.05 * (4 - int(json["dni"])))
+                return self._mock_respuesta_api_exitosa(
+                    status_code=400, data={"status": 400, "message": json["dni"]}
+                )
+            mock_request.side_effect = respuesta_retardada
+
+            client = SaltraClient(
+                self.dsClave, self.usuario, self.idUsuario,
+                self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+            )
+            self.assertEqual(client.concurrencia, 4)
+
+            contratos = [{"dni": str(numero)} for numero in range(1, 5)]
+            respuestas = client.enviar_contratos(contratos, 1, {})
+
+            self.assertEqual([item['numero'] for item in respuestas], [1, 2, 3, 4])
+            self.assertEqual([item['response']['message'] for item in respuestas], ["1", "2", "3", "4"])
+            self.assertTrue(all(contrato["test"] == 1 for contrato in contratos))
+        finally:
+            os.unlink(guion_file)
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_contratos_copia_basica_en_segunda_etapa(self, mock_request, mock_post):
+        """Test para la etapa de copia básica: se fusionan file1/file2 sin bloquear el siguiente envío"""
+        contenido_guion = """[url]
+https://api.saltra.es/api/v4/sepe/contrata
+[metodo]
+POST
+[parametro]
+
+[fiche-out]
+/tmp/test/param_0101.txt
+
+[json envio]
+{
+	"certificado": "test_cert",
+	"datos": {}
+}"""
+
+        guion_file = self._crear_guion_temporal(contenido_guion)
+
+        try:
+            mock_post.return_value = self._mock_respuesta_api_exitosa(
+                data={"data": {"access_token": self.mock_token}}
+            )
+            envios_realizados = []
+
+            def respuesta(method, url, headers, json, stream=False, renovador_token=None):
+                if url.endswith("/copy-basic"):
+                    # Cuando se pide la copia básica del primer contrato el segundo ya debe estar enviado
+                    if json["dni"] == "1":
+                        time.sleep(0.05)
+                        self.assertIn("2", envios_realizados)
+                    return self._mock_respuesta_api_exitosa(
+                        data={"success": True, "data": {"file": "copia_" + json["dni"]}}
+                    )
+                envios_realizados.append(json["dni"])
+                return self._mock_respuesta_api_exitosa(
+                    data={"success": True, "status": 200, "data": {"id": json["dni"], "file": "contrato_" + json["dni"]}}
+                )
+            mock_request.side_effect = respuesta
+
+            client = SaltraClient(
+                self.dsClave, self.usuario, self.idUsuario,
+                self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+            )
+
+            respuestas = client.enviar_contratos([{"dni": "1"}, {"dni": "2"}], None, {})
+
+            self.assertEqual([item['numero'] for item in respuestas], [1, 2])
+            self.assertEqual(respuestas[0]['response']['data']['file1'], "contrato_1")
+            self.assertEqual(respuestas[0]['response']['data']['file2'], "copia_1")
+            self.assertEqual(respuestas[1]['response']['data']['file2'], "copia_2")
+        finally:
+            os.unlink(guion_file)
+
+    @patch('dsenviosaltra_http.requests.Session.request')
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    def test_contratos_copia_basica_con_un_hueco(self, mock_post, mock_session_request):
+        """Test para el lote con el backend limitado a una petición: el contrato libera su hueco antes de pedir la copia básica"""
+        import io
+        import threading
+        import requests
+        from dsenviosaltra_concurrencia import ControlConcurrencia
+        contenido_guion = """[url]
+https://api.saltra.es/api/v4/sepe/contrata
+[metodo]
+POST
+[parametro]
+
+[concurrencia]
+4
+[fiche-out]
+/tmp/test/param_0101.txt
+
+[json envio]
+{
+	"certificado": "test_cert",
+	"datos": {}
+}"""
+
+        guion_file = self._crear_guion_temporal(contenido_guion)
+
+        def respuesta(method, url, **kwargs):
+            # Respuestas reales de requests: el hueco se libera al leer o cerrar su cuerpo
+            response = requests.Response()
+            response.status_code = 200
+            response.headers['content-type'] = 'application/json'
+            response.encoding = 'utf-8'
+            dni = kwargs["json"]["dni"]
+            fichero = ("copia_" if url.endswith("/copy-basic") else "contrato_") + dni
+            response.raw = io.BytesIO(json.dumps({"success": True, "status": 200, "data": {"id": dni, "file": fichero}}).encode())
+            return response
+
+        try:
+            mock_post.return_value = self._mock_respuesta_api_exitosa(
+                data={"data": {"access_token": self.mock_token}}
+            )
+            mock_session_request.side_effect = respuesta
+            client = SaltraClient(
+                self.dsClave, self.usuario, self.idUsuario,
+                self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+            )
+
+            control = ControlConcurrencia("sepe", 1, 1, 1, 8.0)
+            respuestas = []
+            with patch.dict('dsenviosaltra_concurrencia.controles_concurrencia', {"sepe": control}):
+                hilo = threading.Thread(target=lambda: respuestas.extend(
+                    client.enviar_contratos([{"dni": str(numero)} for numero in range(1, 6)], None, {})), daemon=True)
+                hilo.start()
+                hilo.join(timeout=5)
+                bloqueado = hilo.is_alive()
+                en_curso = control.en_curso
+                while hilo.is_alive():
+                    # Se desbloquea el lote para que el fallo no deje hilos colgados
+                    control.liberar(time.monotonic(), 200)
+                    hilo.join(timeout=0.1)
+
+            self.assertFalse(bloqueado, f"Lote bloqueado con {en_curso} peticiones en curso")
+            self.assertEqual(control.en_curso, 0)
+            self.assertEqual([item['numero'] for item in respuestas], [1, 2, 3, 4, 5])
+            self.assertEqual(respuestas[4]['response']['data']['file2'], "copia_5")
+        finally:
+            os.unlink(guion_file)
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_lote_guiones_un_solo_login(self, mock_request, mock_post):
+        """Test para el modo lote: varios guiones con un único login y resumen por guion"""
+        import tempfile
+        from dsenviosaltra_lote import DsEnvioSaltraLote, listar_guiones
+
+        with tempfile.TemporaryDirectory() as directorio:
+            for numero in range(1, 5):
+                contenido_guion = f"""[url]
+https://api.saltra.es/api/v4/seg-social/idc-info-for-nss
+[metodo]
+GET
+[parametro]
+
+[fiche-out]
+{directorio}/salida/param_000{numero}.txt
+[json envio]
+{{
+        "certificado": "test_cert",
+        "datos": {{ "nss": "28123456789{numero}" }}
+}}"""
+                with open(os.path.join(directorio, f"guion_{numero}.txt"), "w", encoding="iso-8859-1") as f:
+                    f.write(contenido_guion)
+
+            mock_post.return_value = self._mock_respuesta_api_exitosa(
+                data={"data": {"access_token": self.mock_token}}
+            )
+            mock_request.return_value = self._mock_respuesta_api_exitosa(
+                data={"success": True, "data": {"idc": None}}
+            )
+
+            guiones = listar_guiones(directorio)
+            resultados = DsEnvioSaltraLote(
+                self.dsClave, self.usuario, self.idUsuario,
+                self.passw, self.code_respuesta, hilos=3
+            ).ejecutar(guiones)
+
+            self.assertEqual(mock_post.call_count, 1)
+            self.assertEqual([resultado["guion"] for resultado in resultados], guiones)
+            self.assertTrue(all(resultado["status"] == "ok" for resultado in resultados))
+            self.assertEqual(resultados[3]["salida"], os.path.join(directorio, "salida", "param_0004.txt"))
+            self.assertTrue(os.path.exists(os.path.join(directorio, "salida", "param_0004.fin")))
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_lote_guion_inexistente(self, mock_request, mock_post):
+        """Test para el lote con un guion inexistente: ese guion acaba en ko y el resto del lote sigue"""
+        import tempfile
+        from dsenviosaltra_lote import DsEnvioSaltraLote
+
+        with tempfile.TemporaryDirectory() as directorio:
+            guiones = []
+            for numero in range(1, 6):
+                contenido_guion = f"""[url]
+https://api.saltra.es/api/v4/seg-social/life-affiliate
+[metodo]
+GET
+[parametro]
+
+[fiche-out]
+{directorio}/param_000{numero}.txt
+[json envio]
+{{
+        "certificado": "test_cert",
+        "datos": {{ "nss": "28123456789{numero}" }}
+}}"""
+                guion_file = os.path.join(directorio, f"guion_{numero}.txt")
+                with open(guion_file, "w", encoding="iso-8859-1") as f:
+                    f.write(contenido_guion)
+                guiones.append(guion_file)
+            guiones.append(os.path.join(directorio, "no_existe.txt"))
+
+            mock_post.return_value = self._mock_respuesta_api_exitosa(
+                data={"data": {"access_token": self.mock_token}}
+            )
+            mock_request.return_value = self._mock_respuesta_api_exitosa(
+                data={"success": True, "data": {"list": []}}
+            )
+
+            resultados = DsEnvioSaltraLote(
+                self.dsClave, self.usuario, self.idUsuario,
+                self.passw, self.code_respuesta, hilos=3
+            ).ejecutar(guiones)
+
+            self.assertEqual(mock_post.call_count, 1)
+            self.assertEqual([resultado["status"] for resultado in resultados], ["ok"] * 5 + ["ko"])
+            self.assertTrue(os.path.exists(os.path.join(directorio, "param_0005.fin")))
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    @patch('dsenviosaltra.ET.parse')
+    def test_contratos_xml_en_streaming(self, mock_parse, mock_request, mock_post):
+        """Test para CONTRATOS en streaming: los contratos se leen con iterparse al enviarlos"""
+        import tempfile
+        ruta_xml = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "CONTR402.xml")
+
+        with tempfile.TemporaryDirectory() as directorio:
+            contenido_guion = f"""[url]
+https://api.saltra.es/api/v4/sepe/contrata
+[metodo]
+POST
+[parametro]
+
+[fiche-xml]
+{ruta_xml}
+[fiche-out]
+{directorio}/param_0101.txt
+
+[json envio]
+{{
+	"certificado": "test_cert",
+	"datos":
+	{{
+		"validar_sin_enviar": "true",
+		"#xmltojson#" : "null"
+	}}
+}}"""
+            guion_file = self._crear_guion_temporal(contenido_guion)
+
+            try:
+                mock_parse.side_effect = AssertionError("El XML no debe cargarse entero")
+                mock_post.return_value = self._mock_respuesta_api_exitosa(
+                    data={"data": {"access_token": self.mock_token}}
+                )
+                mock_request.return_value = self._mock_respuesta_api_exitosa(
+                    status_code=400, data={"status": 400, "message": "rechazado"}
+                )
+
+                client = SaltraClient(
+                    self.dsClave, self.usuario, self.idUsuario,
+                    self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+                )
+                self.assertTrue(client.xml_streaming)
+                self.assertNotIn("json_data", client.config["json envio"])
+
+                client.realizar_llamada_ss_sepe()
+
+                contratos_enviados = [llamada.kwargs["json"] for llamada in mock_request.call_args_list]
+                self.assertEqual(len(contratos_enviados), 1)
+                self.assertEqual(contratos_enviados[0]["cif"], "A81538472")
+                self.assertTrue(all(contrato["test"] == 1 for contrato in contratos_enviados))
+                with open(os.path.join(directorio, "param_0101.txt"), encoding="utf-8") as f:
+                    self.assertIn("Registro-1", f.read())
+            finally:
+                os.unlink(guion_file)
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_llamamiento_xml_sin_reserializar(self, mock_request, mock_post):
+        """Test para la petición nativa: el payload del XML llega al envío sin pasar otra vez por JSON"""
+        import tempfile
+        ruta_xml = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "llamamiento.xml")
+
+        with tempfile.TemporaryDirectory() as directorio:
+            contenido_guion = f"""[url]
+https://api.saltra.es/api/v4/sepe/llamamientos
+[metodo]
+POST
+[parametro]
+
+[fiche-xml]
+{ruta_xml}
+[fiche-out]
+{directorio}/param_0104.txt
+
+[json envio]
+{{
+        "certificado": "test_cert",
+        "datos":
+        {{
+                "validar_sin_enviar": "true",
+                "#xmltojson#": "null"
+        }}
+}}"""
+            guion_file = self._crear_guion_temporal(contenido_guion)
+
+            try:
+                mock_post.return_value = self._mock_respuesta_api_exitosa(
+                    data={"data": {"access_token": self.mock_token}}
+                )
+                mock_request.return_value = self._mock_respuesta_api_exitosa(
+                    data={"success": True, "data": {"id": "E-28-2026-0000001"}}
+                )
+
+                client = SaltraClient(
+                    self.dsClave, self.usuario, self.idUsuario,
+                    self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+                )
+                self.assertTrue(client.peticion.desde_xml)
+                self.assertEqual(client.peticion.certificado, "test_cert")
+
+                with patch('dsenviosaltra.json.loads', side_effect=AssertionError("No debe volver a parsearse")):
+                    client.realizar_llamada_ss_sepe()
+
+                payload = mock_request.call_args.kwargs["json"]
+                self.assertIs(payload, client.peticion.payload_xml)
+                self.assertEqual(payload["test"], 1)
+                self.assertEqual(payload["employees"][0]["sepeId"], "E-28-2025-198702100")
+            finally:
+                os.unlink(guion_file)
+
+    def test_mapeo_xml_una_pasada(self):
+        """Test para las tablas de mapeo XML: mismos valores que obtener_texto_nodo en una sola pasada"""
+        import xml.etree.ElementTree as ET
+        from dsenviosaltra_xml import MapeoXml
+
+        nodo = ET.fromstring(
+            "<REGISTRO><A><B>  uno </B><B>dos</B><C/></A><D>   </D>"
+            "<L><V>1</V></L><L><V>2</V></L></REGISTRO>"
+        )
+        mapeo = MapeoXml(
+            {
+                "b": ('A/B', "", None),
+                "c": ('A/C', "defecto", None),
+                "d": ('D', "defecto", None),
+                "e": ('E', '0', int),
+            },
+            listas={"l": ('L', MapeoXml({"v": ('V', "", int)}))},
+            nodos={"a": 'A', "x": 'X'}
+        )
+        datos = mapeo.extraer(nodo)
+
+        client = SaltraClient.__new__(SaltraClient)
+        self.assertEqual(datos["b"], client.obtener_texto_nodo(nodo, 'A/B'))
+        self.assertEqual(datos["c"], client.obtener_texto_nodo(nodo, 'A/C', "defecto"))
+        self.assertEqual(datos["d"], client.obtener_texto_nodo(nodo, 'D', "defecto"))
+        self.assertEqual(datos["e"], 0)
+        self.assertEqual(datos["l"], [{"v": 1}, {"v": 2}])
+        self.assertTrue(datos["a"])
+        self.assertFalse(datos["x"])
+
+        ruta_xml = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "CONTR402.xml")
+        contratos = client.xml_a_objeto(ruta_xml)
+        self.assertEqual(contratos[0]["codContract"], 200)
+
+    def test_xml_a_json_transformacion(self):
+        """Test para la conversión de TRANSFORMACIONES: mismo payload que la versión original y, con varios registros, todos"""
+        import tempfile
+        ruta_xml = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "transformacion.xml")
+        client = SaltraClient.__new__(SaltraClient)
+
+        esperado = {
+            "TIPO_CONTRATO": 189,
+            "DATOS_EMPRESA": {"CODIGO_CUENTA_COTIZACION": "011103130277401"},
+            "DATOS_CONTRATO": {"IDENTIFICADORPFISICA": "D48621852J", "FECHA_INICIO_CTO": "2018-03-06", "CLAVE_CONTRATO": ""},
+            "DATOS_GENERALES_TRANSFORMACION": {"FECHA_INICIO": "2018-03-06", "CODIGO_OCUPACION": "2121"},
+            "DATOS_COMUNICA_COPIA_BASICA": {
+                "TIPO_FIRMA": "2",
+                "TEXTO_COPIABASICA": "En San Vicente del Raspeig, mismo.",
+                "DOMIC_CENTRO_TRABAJO": "AVDA ANCHA DE CASTELAR 153, - (03690) SAN VICENTE DEL RASPEIG/S - ALICANTE"
+            },
+            "duplicate": 1
+        }
+        self.assertEqual(json.loads(client.xml_a_json(ruta_xml)), esperado)
+
+        # Con dos registros no se descarta ninguno
+        with open(ruta_xml, encoding="iso-8859-1") as f:
+            contenido = f.read()
+        inicio, fin = contenido.index("<TRANSFORMACION_189>"), contenido.index("</TRANSFORMACION_189>") + len("</TRANSFORMACION_189>")
+        registro = contenido[inicio:fin]
+        with tempfile.NamedTemporaryFile("w", suffix=".xml", encoding="iso-8859-1", delete=False) as f:
+            f.write(contenido[:fin] + registro.replace("D48621852J", "X1234567L") + contenido[fin:])
+        try:
+            payloads = client.xml_a_objeto(f.name)
+            self.assertEqual([payload["DATOS_CONTRATO"]["IDENTIFICADORPFISICA"] for payload in payloads], ["D48621852J", "X1234567L"])
+        finally:
+            os.unlink(f.name)
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_llamamientos_multirregistro(self, mock_request, mock_post):
+        """Test para un XML LLAMAMIENTOS con varios registros convertidos en procesos y enviados uno a uno"""
+        import tempfile
+        import re
+        ruta_base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(os.path.join(ruta_base, "llamamiento.xml"), encoding="iso-8859-1") as f:
+            contenido_xml = f.read()
+        registro = re.search(r"<LLAMAMIENTO_TIPO>.*</LLAMAMIENTO_TIPO>", contenido_xml, re.S).group(0)
+        # NSS distintos y con su control módulo 97 correcto
+        nss = [f"{base}{base % 97:02d}" for base in range(2816148474, 2816148477)]
+        registros = "".join(registro.replace("281614847448", numero) for numero in nss)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta_xml = os.path.join(directorio, "llamamientos.xml")
+            with open(ruta_xml, "w", encoding="iso-8859-1") as f:
+                f.write(f'<?xml version="1.0" encoding="ISO-8859-1" ?>\n<LLAMAMIENTOS>{registros}</LLAMAMIENTOS>')
+
+            contenido_guion = f"""[url]
+https://api.saltra.es/api/v4/sepe/llamamientos
+[metodo]
+POST
+[procesos-xml]
+2
+[fiche-xml]
+{ruta_xml}
+[fiche-out]
+{directorio}/param_0104.txt
+
+[json envio]
+{{
+        "certificado": "test_cert",
+        "datos":
+        {{
+                "validar_sin_enviar": "true",
+                "#xmltojson#": "null"
+        }}
+}}"""
+            guion_file = self._crear_guion_temporal(contenido_guion)
+
+            try:
+                mock_post.return_value = self._mock_respuesta_api_exitosa(
+                    data={"data": {"access_token": self.mock_token}}
+                )
+                mock_request.return_value = self._mock_respuesta_api_exitosa(
+                    data={"success": True, "status": 200, "data": {"id": "E-28-2026-0000001"}}
+                )
+
+                # Por defecto la conversión no arranca procesos; con [procesos-xml] y por encima del umbral
+                # cada proceso lee y convierte su tramo del fichero, con el mismo resultado
+                self.assertEqual(SaltraClient.PROCESOS_XML, 1)
+                with patch('dsenviosaltra.ProcessPoolExecutor') as mock_procesos:
+                    en_proceso = SaltraClient(
+                        self.dsClave, self.usuario, self.idUsuario,
+                        self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+                    ).peticion.registros_xml
+                mock_procesos.assert_not_called()
+                with patch.object(SaltraClient, 'REGISTROS_POR_PROCESO', 1), \
+                     patch.object(SaltraClient, 'MIN_REGISTROS_PROCESOS', 0):
+                    client = SaltraClient(
+                        self.dsClave, self.usuario, self.idUsuario,
+                        self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+                    )
+                self.assertEqual(client.procesos_xml, 2)
+                self.assertEqual(len(client.peticion.registros_xml), 3)
+                self.assertEqual(client.peticion.registros_xml, en_proceso)
+                self.assertEqual([payload["employees"][0]["nss"] for payload in en_proceso], nss)
+
+                client.realizar_llamada_ss_sepe()
+
+                self.assertEqual(mock_request.call_count, 3)
+                enviados = [llamada.kwargs["json"]["employees"][0]["nss"] for llamada in mock_request.call_args_list]
+                self.assertEqual(sorted(enviados), nss)
+                self.assertTrue(all(llamada.kwargs["json"]["test"] == 1 for llamada in mock_request.call_args_list))
+
+                with open(os.path.join(directorio, "param_0104.txt"), encoding="utf-8") as f:
+                    salida = f.read()
+                for numero in (1, 2, 3):
+                    self.assertIn(f"Registro-{numero}", salida)
+                self.assertIn("STATUS ok", salida)
+            finally:
+                os.unlink(guion_file)
+
+    def test_pdf_respuesta_en_streaming(self):
+        """Test para la extracción de PDFs en streaming: el base64 va a disco y el JSON guarda la referencia"""
+        import io
+        import base64
+        import hashlib
+        import tempfile
+        import requests
+        import dsenviosaltra_pdf
+        from dsenviosaltra_respuestas import guardar_respuesta_completa
+
+        pdf = b"%PDF-1.4\n" + bytes(range(256)) * 40 + b"\n%%EOF"
+        # La API escapa '/' como '\/': el escape también puede quedar partido entre bloques
+        contenido = base64.b64encode(pdf).decode("ascii").replace("/", "\\/")
+        cuerpo = json.dumps({"success": True, "message": "\"content\": no es un PDF", "data": {"id": "1"}})[:-2]
+        cuerpo += f', "file": {{"contentType": "application/pdf", "content": "{contenido}"}}}}}}'
+
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["content-type"] = "application/json"
+        response.raw = io.BytesIO(cuerpo.encode("utf-8"))
+
+        with tempfile.TemporaryDirectory() as directorio:
+            fich_respuesta = os.path.join(directorio, "param_0062.txt")
+            with patch.object(dsenviosaltra_pdf, 'TAMANO_BLOQUE_LECTURA', 7):
+                guardar_respuesta_completa(response, fich_respuesta, "query_avanza", {}, self.usuario,
+                                           "https://api.saltra.es/api/v4/seg-social/informe-ita", "GET", self.tiempo_inicio)
+
+            ruta_pdf = os.path.join(directorio, "pdf1_1.pdf")
+            with open(ruta_pdf, "rb") as f:
+                self.assertEqual(f.read(), pdf)
+
+            with open(fich_respuesta, encoding="utf-8") as f:
+                volcado = json.load(f)
+            referencia = volcado["data"]["file"]["content"]
+            self.assertEqual(referencia, {"ruta": ruta_pdf, "tamano": len(pdf), "sha256": hashlib.sha256(pdf).hexdigest()})
+            self.assertEqual(volcado["message"], "\"content\": no es un PDF")
+            self.assertFalse([nombre for nombre in os.listdir(directorio) if nombre.endswith(".tmp")])
+
+    def test_pdfs_contratos_en_paralelo(self):
+        """Test para el pool de escritura de PDFs: todos en disco y sincronizados antes de generar el .txt"""
+        import base64
+        import tempfile
+        import dsenviosaltra_respuestas
+
+        pdf = base64.b64encode(b"%PDF-1.4 contrato").decode("ascii")
+        respuestas = [
+            {"numero": numero, "response": {"success": True, "status": 200,
+                                            "data": {"id": f"E-{numero}", "file1": {"contentType": "application/pdf", "content": pdf}}}}
+            for numero in (1, 2, 3)
+        ]
+
+        with tempfile.TemporaryDirectory() as directorio:
+            fich_respuesta = os.path.join(directorio, "param_0101.txt")
+            sincronizados = []
+            fsync_original = os.fsync
+
+            def fsync(descriptor):
+                # Cuando se sincroniza un PDF todavía no puede existir el .txt
+                self.assertFalse(os.path.exists(fich_respuesta))
+                sincronizados.append(descriptor)
+                return fsync_original(descriptor)
+
+            with patch('dsenviosaltra_respuestas.os.fsync', side_effect=fsync), \
+                 patch.object(dsenviosaltra_respuestas, 'LOTE_FSYNC', 2):
+                dsenviosaltra_respuestas.guardar_respuestas_contratos(
+                    respuestas, fich_respuesta, {}, self.usuario,
+                    "https://api.saltra.es/api/v4/sepe/contrata", "POST", self.tiempo_inicio
+                )
+
+            # Tres PDFs y el directorio
+            self.assertEqual(len(sincronizados), 4)
+            with open(fich_respuesta, encoding="utf-8") as f:
+                salida = f.read()
+            for numero in (1, 2, 3):
+                ruta_pdf = os.path.join(directorio, f"pdf_{numero}_1.pdf")
+                self.assertIn(f"Pdf1 {ruta_pdf}", salida)
+                with open(ruta_pdf, "rb") as f:
+                    self.assertEqual(f.read(), b"%PDF-1.4 contrato")
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_resultados_publicados_atomicamente(self, mock_request, mock_post):
+        """Test para la publicación atómica: cada fichero se publica una vez con rename y el .fin el último"""
+        import tempfile
+        import dsenviosaltra_salida
+        from dsenviosaltra import ejecutar_guion
+
+        with tempfile.TemporaryDirectory() as directorio:
+            contenido_guion = f"""[url]
+https://api.saltra.es/api/v4/seg-social/idc-info-for-nss
+[parametro]
+
+[metodo]
+GET
+[fiche-out]
+{directorio}/param_0012.out
+
+[json envio]
+{{
+        "certificado": "test_cert",
+        "datos":
+        {{
+            "regimen": "0111",
+            "ccc": "08208093015",
+            "nss": "081079806389"
+        }}
+}}"""
+            guion_file = self._crear_guion_temporal(contenido_guion)
+
+            try:
+                mock_post.return_value = self._mock_respuesta_api_exitosa(
+                    data={"data": {"access_token": self.mock_token}}
+                )
+                mock_request.return_value = self._mock_respuesta_api_exitosa()
+
+                client = SaltraClient(
+                    self.dsClave, self.usuario, self.idUsuario,
+                    self.passw, guion_file, self.code_respuesta, self.tiempo_inicio
+                )
+
+                publicados = []
+                replace_original = os.replace
+
+                def replace(origen, destino):
+                    # Nada se publica hasta que el guion ha terminado
+                    self.assertEqual(mock_request.call_count, 1)
+                    publicados.append(os.path.basename(destino))
+                    return replace_original(origen, destino)
+
+                with patch('dsenviosaltra_salida.os.replace', side_effect=replace):
+                    self.assertEqual(ejecutar_guion(client, self.tiempo_inicio), 0)
+
+                self.assertEqual(sorted(publicados[:-1]), ["param_0012.out", "param_0012.txt"])
+                self.assertEqual(publicados[-1], "param_0012.fin")
+                with open(os.path.join(directorio, "param_0012.out"), encoding="utf-8") as f:
+                    contenido = f.read()
+                self.assertIn('"id": "12345"', contenido)
+                self.assertIn("Tiempo transcurrido:", contenido)
+                with open(os.path.join(directorio, "param_0012.fin"), encoding="iso-8859-1") as f:
+                    self.assertEqual(f.read(), "FIN\n")
+                self.assertEqual(sorted(os.listdir(directorio)), ["param_0012.fin", "param_0012.out", "param_0012.txt"])
+            finally:
+                os.unlink(guion_file)
+
+    @patch('dsenviosaltra_http.requests.Session.request')
+    def test_tiempos_por_fase_y_metricas(self, mock_session_request):
+        """Test para la medición por fases: .tiempos.json publicado antes del .fin y métricas acumuladas por endpoint"""
+        import tempfile
+        from dsenviosaltra import procesar_guion
+        from dsenviosaltra_tiempos import configurar_metricas, metricas
+
+        def respuesta(method, url, **kwargs):
+            if url.endswith("/auth/login"):
+                return self._mock_respuesta_api_exitosa(data={"data": {"access_token": self.mock_token}})
+            return self._mock_respuesta_api_exitosa()
+
+        mock_session_request.side_effect = respuesta
+
+        with tempfile.TemporaryDirectory() as directorio:
+            guion_file = self._crear_guion_temporal(f"""[url]
+https://api.saltra.es/api/v4/seg-social/idc-info-for-nss
+[metodo]
+GET
+[parametro]
+
+[fiche-out]
+{directorio}/param_0012.out
+[cache]
+no
+
+[json envio]
+{{
+        "certificado": "test_cert",
+        "datos": {{"regimen": "0111", "ccc": "08208093015", "nss": "081079806389"}}
+}}""")
+            configurar_metricas(os.path.join(directorio, "metricas.json"))
+            self.addCleanup(configurar_metricas, None)
+
+            publicados = []
+            replace_original = os.replace
+
+            def replace(origen, destino):
+                publicados.append(os.path.basename(destino))
+                return replace_original(origen, destino)
+
+            try:
+                with patch('dsenviosaltra_salida.os.replace', side_effect=replace):
+                    self.assertEqual(procesar_guion(self.dsClave, self.usuario, self.idUsuario, self.passw, guion_file, self.code_respuesta)[0], 0)
+                procesar_guion(self.dsClave, self.usuario, self.idUsuario, self.passw, guion_file, self.code_respuesta)
+            finally:
+                os.unlink(guion_file)
+
+            self.assertLess(publicados.index("param_0012.tiempos.json"), publicados.index("param_0012.fin"))
+            with open(os.path.join(directorio, "param_0012.tiempos.json"), encoding="utf-8") as f:
+                tiempos = json.load(f)
+            self.assertEqual(tiempos["guion"], guion_file)
+            for nombre in ("guion", "login", "http", "lectura_respuesta", "volcado_json", "txt"):
+                self.assertIn(nombre, tiempos["fases"])
+                self.assertGreaterEqual(tiempos["fases"][nombre]["pared"], 0)
+            self.assertEqual(tiempos["fases"]["http"]["llamadas"], 2)
+            peticiones = [llamada for llamada in tiempos["llamadas"] if llamada["fase"] == "http"]
+            self.assertEqual([(peticion["metodo"], peticion["estado"]) for peticion in peticiones], [("POST", 200), ("GET", 200)])
+            self.assertTrue(peticiones[1]["url"].endswith("/idc-info-for-nss"))
+
+            with open(os.path.join(directorio, "param_0012.out"), encoding="utf-8") as f:
+                self.assertIn("Tiempo transcurrido:", f.read())
+
+            acumuladas = metricas.leer()
+            self.assertEqual(acumuladas["guiones"], 2)
+            self.assertEqual(acumuladas["fases"]["login"]["llamadas"], 2)
+            self.assertEqual(acumuladas["http"]["idc-info-for-nss"]["llamadas"], 2)
+            self.assertEqual(acumuladas["http"]["idc-info-for-nss"]["estados"], {"200": 2})
+
+    def test_json_to_txt_listado_en_streaming(self):
+        """Test para el renderizado TXT por partes: mismo formato de línea para un listado grande"""
+        import tempfile
+        from dsenviosaltra_respuestas import json_to_txt
+
+        filas = [{"nss": f"{numero:012d}", "nombre": f"Trabajador {numero}"} for numero in range(5000)]
+        with tempfile.TemporaryDirectory() as directorio:
+            txt_path = os.path.join(directorio, "param_0013.txt")
+            json_to_txt({"success": True, "data": {"list": filas}}, txt_path, 200, {"parametro": ""},
+                        self.usuario, "https://api.saltra.es/api/v4/seg-social/employees-in-enterprise", "GET")
+
+            with open(txt_path, encoding="utf-8") as f:
+                salida = f.read()
+            # Sin temporales de la escritura por partes
+            self.assertEqual(os.listdir(directorio), ["param_0013.txt"])
+
+        cabecera, cuerpo = salida.split("        Resultado ACEPTADO", 1)
+        self.assertTrue(cabecera.startswith("PETICION\n  FECHA "))
+        esperado = "\n        Extra\n          facturable : 1" + "".join(
+            f"\n          Tabla\n            nss : {fila['nss']}\n            nombre : {fila['nombre']}" for fila in filas
+        ) + "\n\nFIN"
+        self.assertEqual(cuerpo, esperado)
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_cache_respuestas_consultas(self, mock_request, mock_post):
+        """Test para la caché de respuestas: la consulta repetida (GET o PUT según el endpoint) no llega a la red salvo con [cache] no"""
+        import io
+        import tempfile
+        import requests
+
+        def respuesta(method, url, headers=None, json=None, stream=False, renovador_token=None):
+            response = requests.Response()
+            response.status_code = 200
+            response.headers["content-type"] = "application/json"
+            response.raw = io.BytesIO(b'{"success": true, "data": {"list": [{"codigo": "2611", "descripcion": "Abogados"}]}}')
+            return response
+
+        mock_post.return_value = self._mock_respuesta_api_exitosa(data={"data": {"access_token": self.mock_token}})
+        mock_request.side_effect = respuesta
+
+        with tempfile.TemporaryDirectory() as directorio:
+            def ejecutar(datos, seccion_cache="", endpoint="cno", metodo="GET"):
+                guion_file = self._crear_guion_temporal(f"""[url]
+https://api.saltra.es/api/v4/seg-social/{endpoint}
+[metodo]
+{metodo}
+[parametro]
+
+[fiche-out]
+{directorio}/param_0023.out
+{seccion_cache}
+[json envio]
+{{
+        "certificado": "test_cert   ",
+        "datos": {datos}
+}}""")
+                try:
+                    client = SaltraClient(self.dsClave, self.usuario, self.idUsuario,
+                                          self.passw, guion_file, self.code_respuesta, self.tiempo_inicio)
+                    client.realizar_llamada_ss_sepe()
+                finally:
+                    os.unlink(guion_file)
+                with open(os.path.join(directorio, "param_0023.txt"), encoding="utf-8") as f:
+                    return f.read().split("STATUS", 1)[1]
+
+            with patch('dsenviosaltra_cache.RUTA_CACHE_RESPUESTAS', os.path.join(directorio, "cache")), \
+                 patch('dsenviosaltra_catalogo.RUTA_CATALOGO', os.path.join(directorio, "catalogos.sqlite")):
+                primera = ejecutar('{"regimen": "0111", "ccc": "28206877853"}')
+                # Mismos datos en otro orden: se sirve de la caché
+                segunda = ejecutar('{"ccc": "28206877853", "regimen": "0111"}')
+                self.assertEqual(mock_request.call_count, 1)
+                self.assertEqual(segunda, primera)
+                self.assertIn("codigo : 2611", segunda)
+
+                ejecutar('{"regimen": "0111", "ccc": "28206877853"}', "[cache]\nno\n")
+                ejecutar('{"regimen": "0111", "ccc": "99999999999"}')
+                self.assertEqual(mock_request.call_count, 3)
+
+                # Las ocupaciones se consultan por PUT (guion_028) y también se guardan
+                datos_ocupacion = '{"regimen": "0111", "ccc": "28206877853", "nss": "281234567890"}'
+                ejecutar(datos_ocupacion, endpoint="occupation", metodo="PUT")
+                ejecutar(datos_ocupacion, endpoint="occupation", metodo="PUT")
+                self.assertEqual(mock_request.call_count, 4)
+
+            from dsenviosaltra_cache import ttl_endpoint
+            self.assertEqual(ttl_endpoint("https://api.saltra.es/api/v4/seg-social/category-professional", "put"), 24 * 3600)
+            self.assertIsNone(ttl_endpoint("https://api.saltra.es/api/v4/seg-social/occupation", "GET"))
+            self.assertIsNone(ttl_endpoint("https://api.saltra.es/api/v4/seg-social/alta", "POST"))
+
+    def test_catalogo_ocupaciones_local(self):
+        """Test para el índice local de catálogos: consulta, carga incremental y CODIGO_OCUPACION comprobado antes de enviar"""
+        import tempfile
+        from dsenviosaltra_catalogo import catalogo_referencia, CATALOGO_OCUPACION, CATALOGO_GRUPO_COTIZACION
+        from dsenviosaltra_validacion import validar_registros
+
+        client = SaltraClient.__new__(SaltraClient)
+        ruta_xml = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "transformacion.xml")
+        payload = client.xml_a_objeto(ruta_xml)
+
+        with tempfile.TemporaryDirectory() as directorio, \
+             patch('dsenviosaltra_catalogo.RUTA_CATALOGO', os.path.join(directorio, "catalogos.sqlite")):
+            # Sin catálogo completo no se descarta ningún código
+            catalogo_referencia.registrar_respuesta("https://api.saltra.es/api/v4/seg-social/cno",
+                                                    {"list": [{"codigo": "0110", "descripcion": "Oficiales de las fuerzas armadas"}]})
+            self.assertEqual(catalogo_referencia.buscar(CATALOGO_OCUPACION, 110)["descripcion"], "Oficiales de las fuerzas armadas")
+            self.assertFalse(catalogo_referencia.completo(CATALOGO_OCUPACION))
+            self.assertEqual(validar_registros("TRANSFORMACIONES", [payload]), {})
+
+            fichero = os.path.join(directorio, "cno.csv")
+            with open(fichero, "w", encoding="iso-8859-1") as f:
+                f.write("2611;Abogados\n2612;Fiscales\n")
+            self.assertEqual(catalogo_referencia.cargar_fichero(CATALOGO_OCUPACION, fichero), 2)
+            self.assertIsNone(catalogo_referencia.buscar(CATALOGO_OCUPACION, "0110"))
+            self.assertEqual([e["codigo"] for e in catalogo_referencia.buscar_texto(CATALOGO_OCUPACION, "261")], ["2611", "2612"])
+
+            # transformacion.xml lleva CODIGO_OCUPACION 2121, que no está en el catálogo cargado
+            self.assertEqual(validar_registros("TRANSFORMACIONES", [payload]), {1: ["CODIGO_OCUPACION no válido (2121)"]})
+
+            catalogo_referencia.registrar_respuesta("https://api.saltra.es/api/v4/seg-social/category-occupation-gc",
+                                                    {"ocupacion": {"codigo": "2121", "descripcion": "Matemáticos"},
+                                                     "grupoCotizacion": {"codigo": "01", "descripcion": "Ingenieros"}})
+            self.assertEqual(validar_registros("TRANSFORMACIONES", [payload]), {})
+            self.assertEqual(catalogo_referencia.buscar(CATALOGO_GRUPO_COTIZACION, "1")["descripcion"], "Ingenieros")
+
+    def test_validacion_local_registro_n(self):
+        """Test para la validación local: los registros con errores no se envían y salen como Registro-N RECHAZADO"""
+        import tempfile
+        import re
+        ruta_base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(os.path.join(ruta_base, "llamamiento.xml"), encoding="iso-8859-1") as f:
+            contenido_xml = f.read()
+        registro = re.search(r"<LLAMAMIENTO_TIPO>.*</LLAMAMIENTO_TIPO>", contenido_xml, re.S).group(0)
+        # Registro 2: NSS con control incorrecto, fecha de nacimiento imposible y CIF en blanco
+        erroneo = (registro.replace("281614847448", "281614847449")
+                           .replace("<FECHA_NACIMIENTO>19911128", "<FECHA_NACIMIENTO>19911328")
+                           .replace("B45532132", ""))
+        self.assertNotEqual(erroneo, registro)
+        # Registro 3: otro llamamiento del mismo trabajador (uno idéntico al 1 no se volvería a enviar)
+        otro_dia = registro.replace("20260209", "20260210")
+
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta_xml = os.path.join(directorio, "llamamientos.xml")
+            with open(ruta_xml, "w", encoding="iso-8859-1") as f:
+                f.write(f'<?xml version="1.0" encoding="ISO-8859-1" ?>\n<LLAMAMIENTOS>{registro}{erroneo}{otro_dia}</LLAMAMIENTOS>')
+
+            guion_file = self._crear_guion_temporal(f"""[url]
+https://api.saltra.es/api/v4/sepe/llamamientos
+[metodo]
+POST
+[fiche-xml]
+{ruta_xml}
+[fiche-out]
+{directorio}/param_0104.txt
+
+[json envio]
+{{
+        "certificado": "test_cert",
+        "datos": {{"#xmltojson#": "null"}}
+}}""")
+            try:
+                with patch('dsenviosaltra_http.TransporteSaltra.post') as mock_post, \
+                     patch('dsenviosaltra_http.TransporteSaltra.request') as mock_request:
+                    mock_post.return_value = self._mock_respuesta_api_exitosa(data={"data": {"access_token": self.mock_token}})
+                    mock_request.return_value = self._mock_respuesta_api_exitosa(
+                        data={"success": True, "status": 200, "data": {"id": "E-28-2026-0000001"}}
+                    )
+                    client = SaltraClient(self.dsClave, self.usuario, self.idUsuario,
+                                          self.passw, guion_file, self.code_respuesta, self.tiempo_inicio)
+                    client.realizar_llamada_ss_sepe()
+
+                    self.assertEqual(mock_request.call_count, 2)
+
+                with open(os.path.join(directorio, "param_0104.txt"), encoding="utf-8") as f:
+                    salida = f.read()
+                self.assertIn("STATUS ko", salida)
+                rechazado = salida.split("Registro-2", 1)[1].split("Registro-3", 1)[0]
+                self.assertIn("Resultado RECHAZADO", rechazado)
+                self.assertIn("CIF_NIF de la empresa no válido ()", rechazado)
+                self.assertIn("NSS no válido (281614847449)", rechazado)
+                self.assertIn("Fecha de nacimiento no válido (1991-13-28)", rechazado)
+                self.assertEqual(salida.count("Resultado ACEPTADO"), 2)
+            finally:
+                os.unlink(guion_file)
+
+    @patch('dsenviosaltra_http.TransporteSaltra.post')
+    @patch('dsenviosaltra_http.TransporteSaltra.request')
+    def test_registro_envios_evita_duplicado(self, mock_request, mock_post):
+        """Test para el registro de envíos: un alta ya aceptada no se vuelve a enviar salvo con [reenviar] si"""
+        import io
+        import tempfile
+        import requests
+
+        def respuesta(method, url, headers=None, json=None, stream=False, renovador_token=None):
+            response = requests.Response()
+            response.status_code = 200
+            response.headers["content-type"] = "application/json"
+            response.raw = io.BytesIO(b'{"success": true, "status": 200, "data": {"id": "IDC-0001"}}')
+            return response
+
+        mock_post.return_value = self._mock_respuesta_api_exitosa(data={"data": {"access_token": self.mock_token}})
+        mock_request.side_effect = respuesta
+
+        with tempfile.TemporaryDirectory() as directorio:
+            def ejecutar(datos, seccion_reenviar=""):
+                guion_file = self._crear_guion_temporal(f"""[url]
+https://api.saltra.es/api/v4/seg-social/alta
+[metodo]
+POST
+[parametro]
+
+[fiche-out]
+{directorio}/param_0001.out
+{seccion_reenviar}
+[json envio]
+{{
+        "certificado": "test_cert",
+        "datos": {datos}
+}}""")
+                try:
+                    client = SaltraClient(self.dsClave, self.usuario, self.idUsuario,
+                                          self.passw, guion_file, self.code_respuesta, self.tiempo_inicio)
+                    client.realizar_llamada_ss_sepe()
+                finally:
+                    os.unlink(guion_file)
+                with open(os.path.join(directorio, "param_0001.txt"), encoding="utf-8") as f:
+                    return f.read()
+
+            primera = ejecutar('{"regimen": "0111", "ccc": "06005271108", "dni": "52359707T", "duplicate": "1"}')
+            self.assertIn("Resultado ACEPTADO", primera)
+            # Mismo alta con los campos en otro orden y sin 'duplicate': se responde desde el registro
+            segunda = ejecutar('{"dni": "52359707T", "ccc": "06005271108", "regimen": "0111"}')
+            self.assertEqual(mock_request.call_count, 1)
+            self.assertIn("Resultado ACEPTADO", segunda)
+            self.assertIn("IDC-0001", segunda)
+
+            ejecutar('{"regimen": "0111", "ccc": "06005271108", "dni": "52359707T"}', "[reenviar]\nsi\n")
+            ejecutar('{"regimen": "0111", "ccc": "06005271108", "dni": "52359707T", "test": 1}')
+            self.assertEqual(mock_request.call_count, 3)
+
+    def test_formatos_txt_por_tabla(self):
+        """Test para los formatos TXT declarativos: endpoint, parámetro y un endpoint nuevo añadido a la tabla"""
+        import tempfile
+        import dsenviosaltra_formatos
+        from dsenviosaltra_respuestas import json_to_txt, json_certificado_to_txt
+
+        def renderizar(funcion, json_data, endpoint, parametro="", metodo="GET"):
+            txt_path = os.path.join(directorio, "param_0014.txt")
+            funcion(json_data, txt_path, 200, {"parametro": parametro}, self.usuario, endpoint, metodo)
+            with open(txt_path, encoding="utf-8") as f:
+                return f.read().split("STATUS ok", 1)[1]
+
+        with tempfile.TemporaryDirectory() as directorio:
+            empresa = renderizar(json_to_txt, {"success": True, "data": {"id": "E1", "domicilio": {"calle": "Mayor"}, "ccc": "123"}},
+                                 "https://api.saltra.es/api/v4/seg-social/enterprise-data")
+            self.assertTrue(empresa.endswith("facturable : 1\n          Mensaje E1\n                id : E1\n"
+                                             "                calle : Mayor\n                ccc : 123\n\nFIN"))
+
+            ocupacion = renderizar(json_to_txt, {"success": True, "data": {"ocupacion": {}}},
+                                   "https://api.saltra.es/api/v4/sepe/occupation", "019")
+            self.assertTrue(ocupacion.endswith("          Tabla\n                ocupacion : Ninguna\n\nFIN"))
+
+            certificados = renderizar(json_certificado_to_txt, {"data": {"data": [{"cert_secret": "S1", "desde": "2024-01-31", "gn": None}]}},
+                                      "https://api.saltra.es/api/v4/certificate")
+            self.assertIn("  pk : S1\n  numero_serie: S1\n", certificados)
+            self.assertIn("  inicio_validez: 31/01/2024 00:00:00\n", certificados)
+            self.assertIn("  gn: \n", certificados)
+
+            # Un endpoint nuevo solo necesita su entrada en la tabla
+            with patch.dict(dsenviosaltra_formatos.FORMATOS_DATOS_ENDPOINT, {"/nuevo": dsenviosaltra_formatos.Seccion("resumen")}):
+                nuevo = renderizar(json_to_txt, {"success": True, "data": {"resumen": {"total": 3}}},
+                                   "https://api.saltra.es/api/v4/seg-social/nuevo")
+            self.assertTrue(nuevo.endswith("          Tabla\n                total : 3\n\nFIN"))
+
 
 if __name__ == '__main__':
     unittest.main()